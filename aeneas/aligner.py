@@ -0,0 +1,234 @@
+"""
+Warm pool of aeneas alignment workers.
+
+Each worker process imports aeneas and initializes its C extensions once,
+then runs ExecuteTask through the Python API for every request it receives.
+"""
+
+import os
+import time
+import logging
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from metrics import ALIGNER_EXECUTE, ALIGNER_QUEUE_WAIT, ALIGNER_REJECTED, ALIGNER_POOL_RESTARTS
+from profiling import profiled
+
+logger = logging.getLogger(__name__)
+
+# "pool" runs alignments in pre-initialized worker processes; "subprocess"
+# spawns aeneas.tools.execute_task per request.
+ALIGNER_MODE = os.getenv("ALIGNER_MODE", "pool")
+ALIGNER_POOL_SIZE = int(os.getenv("ALIGNER_POOL_SIZE", "2"))
+ALIGNER_QUEUE_SIZE = int(os.getenv("ALIGNER_QUEUE_SIZE", "8"))
+
+# Worker processes come from a fork server instead of being forked from this
+# multithreaded process (Flask request threads, sync jobs), where a child can
+# inherit a lock some other thread held at the time. The server preloads
+# this module rather than the Flask app; workers still import __main__ the
+# way spawned processes do, so sync_service keeps serving under its guard.
+_MP_CONTEXT = multiprocessing.get_context("forkserver")
+_MP_CONTEXT.set_forkserver_preload([__name__])
+
+class AlignerBusy(Exception):
+    """Raised when the pool and its queue are full."""
+
+def _init_worker():
+    # Pay the aeneas import and C-extension initialization once per process
+    from aeneas.executetask import ExecuteTask  # noqa: F401
+    from aeneas.task import Task  # noqa: F401
+    from aeneas.diagnostics import Diagnostics
+    Diagnostics.check_cdtw()
+    Diagnostics.check_cmfcc()
+    Diagnostics.check_cew()
+
+def _run_task(audio_path, srt_path, config_string, output_path, submitted_at, profile_path=None):
+    from aeneas.executetask import ExecuteTask
+    from aeneas.task import Task
+
+    started_at = time.time()
+    with profiled(profile_path, enabled=profile_path is not None):
+        task = Task(config_string=config_string)
+        task.audio_file_path_absolute = audio_path
+        task.text_file_path_absolute = srt_path
+        task.sync_map_file_path_absolute = output_path
+        ExecuteTask(task).execute()
+        task.output_sync_map_file()
+    return {"queue_wait": started_at - submitted_at, "execute": time.time() - started_at}
+
+def _run_diagnostics():
+    from aeneas.diagnostics import Diagnostics
+    errors, warnings, c_ext_warnings = Diagnostics.check_all()
+    return {"errors": errors, "warnings": warnings, "c_ext_warnings": c_ext_warnings}
+
+def _new_executor(size):
+    return ProcessPoolExecutor(max_workers=size, initializer=_init_worker, mp_context=_MP_CONTEXT)
+
+def _record(timings):
+    ALIGNER_EXECUTE.observe(timings["execute"])
+    ALIGNER_QUEUE_WAIT.observe(timings["queue_wait"])
+    return timings
+
+class AlignerPool:
+    def __init__(self, size=ALIGNER_POOL_SIZE, queue_size=ALIGNER_QUEUE_SIZE):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size + queue_size)
+        self._executor = _new_executor(size)
+        self._executor_lock = threading.Lock()
+        self._diagnostics = None
+        self._diagnostics_lock = threading.Lock()
+
+    def _submit(self, fn, *args):
+        """
+        Submits to the current executor and returns (executor, future).
+        """
+        with self._executor_lock:
+            executor = self._executor
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            executor = self._replace(executor)
+            return executor, executor.submit(fn, *args)
+
+    def _replace(self, broken):
+        """
+        Swaps in a fresh executor after a worker process died (e.g. a crash
+        in the aeneas C extensions), unless another thread already did.
+        Returns the current executor.
+        """
+        with self._executor_lock:
+            if self._executor is broken:
+                logger.error("An aligner worker process died, restarting the pool")
+                ALIGNER_POOL_RESTARTS.inc()
+                self._executor = _new_executor(self.size)
+                broken.shutdown(wait=False)
+            return self._executor
+
+    def align(self, audio_path, srt_path, config_string, output_path, profile_path=None):
+        """
+        Runs one alignment in the pool and returns its timing breakdown.
+        Raises AlignerBusy if size + queue_size alignments are already pending.
+        With profile_path, the worker process profiles the alignment there.
+        """
+        if not self._slots.acquire(blocking=False):
+            ALIGNER_REJECTED.inc()
+            raise AlignerBusy("Alignment queue is full")
+        try:
+            executor, future = self._submit(
+                _run_task, audio_path, srt_path, config_string, output_path, time.time(), profile_path
+            )
+            try:
+                return _record(future.result())
+            except BrokenProcessPool as e:
+                # Only the alignments running in the dead pool fail
+                self._replace(executor)
+                raise RuntimeError("The aligner worker process died during alignment") from e
+        finally:
+            self._slots.release()
+
+    def align_many(self, tasks, profile_paths=None):
+        """
+        Runs (audio_path, text_path, config_string, output_path) tasks in
+        parallel across the pool, holding a single queue slot for the batch.
+        profile_paths optionally gives a profile output path per task.
+        """
+        if not self._slots.acquire(blocking=False):
+            ALIGNER_REJECTED.inc()
+            raise AlignerBusy("Alignment queue is full")
+        try:
+            profile_paths = profile_paths or [None] * len(tasks)
+            submitted = [
+                self._submit(_run_task, *task, time.time(), profile_path)
+                for task, profile_path in zip(tasks, profile_paths)
+            ]
+            try:
+                return [_record(future.result()) for _, future in submitted]
+            except BrokenProcessPool as e:
+                for executor, future in submitted:
+                    future.cancel()
+                    self._replace(executor)
+                raise RuntimeError("An aligner worker process died during windowed alignment") from e
+        finally:
+            self._slots.release()
+
+    def diagnostics(self):
+        """
+        Returns aeneas diagnostics, computed once in a worker and cached.
+        """
+        with self._diagnostics_lock:
+            if self._diagnostics is None:
+                self._diagnostics = self._submit(_run_diagnostics)[1].result()
+            return self._diagnostics
+
+def align_subprocess(audio_path, srt_path, config_string, output_path, profile_path=None):
+    started_at = time.time()
+    profile_args = ["-m", "cProfile", "-o", profile_path] if profile_path else []
+    subprocess.run([
+        "python3", *profile_args, "-m", "aeneas.tools.execute_task",
+        audio_path, srt_path, config_string, output_path
+    ], check=True)
+    return _record({"queue_wait": 0.0, "execute": time.time() - started_at})
+
+def diagnostics_subprocess():
+    result = subprocess.run(["python3", "-m", "aeneas.diagnostics"], capture_output=True)
+    return {"errors": result.returncode != 0, "warnings": False, "c_ext_warnings": False}
+
+_pool = None
+_pool_lock = threading.Lock()
+_diagnostics = None
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = AlignerPool()
+        return _pool
+
+def align(audio_path, srt_path, config_string, output_path, profile_path=None):
+    """
+    Aligns srt_path against audio_path using the configured ALIGNER_MODE and
+    returns {"queue_wait", "execute", "total"} timings in seconds. In
+    subprocess mode "execute" includes interpreter startup and aeneas import.
+    With profile_path, the process running the alignment profiles it there.
+    """
+    started_at = time.time()
+    if ALIGNER_MODE == "pool":
+        timings = get_pool().align(audio_path, srt_path, config_string, output_path, profile_path)
+    else:
+        timings = align_subprocess(audio_path, srt_path, config_string, output_path, profile_path)
+    timings["total"] = time.time() - started_at
+    logger.info(
+        f"Alignment ({ALIGNER_MODE}) took {timings['total']:.2f}s: execute {timings['execute']:.2f}s, "
+        f"queue wait {timings['queue_wait']:.2f}s"
+    )
+    return timings
+
+def align_many(tasks, profile_paths=None):
+    """
+    Runs (audio_path, text_path, config_string, output_path) tasks in
+    parallel using the configured ALIGNER_MODE and returns their timings.
+    Subprocess mode runs up to ALIGNER_POOL_SIZE processes at a time.
+    """
+    if ALIGNER_MODE == "pool":
+        return get_pool().align_many(tasks, profile_paths)
+    profile_paths = profile_paths or [None] * len(tasks)
+    with ThreadPoolExecutor(max_workers=ALIGNER_POOL_SIZE) as executor:
+        futures = [
+            executor.submit(align_subprocess, *task, profile_path)
+            for task, profile_path in zip(tasks, profile_paths)
+        ]
+        return [future.result() for future in futures]
+
+def diagnostics():
+    """
+    Returns cached aeneas diagnostics, running them on first use only.
+    """
+    global _diagnostics
+    if ALIGNER_MODE == "pool":
+        return get_pool().diagnostics()
+    with _pool_lock:
+        if _diagnostics is None:
+            _diagnostics = diagnostics_subprocess()
+        return _diagnostics
@@ -0,0 +1,131 @@
+"""
+Content-addressed cache of alignment-grade audio extracted from media files.
+
+Entries are keyed by the media path, size and mtime, stored as 16 kHz mono
+WAV on local scratch, and evicted least-recently-used by total bytes.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+import subprocess
+import time
+from contextlib import contextmanager
+from metrics import FFMPEG_DURATION, AUDIO_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "/tmp/aeneas-audio")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+AUDIO_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", "16000"))
+
+# Guards the pins, the key lock table and eviction
+_cache_lock = threading.Lock()
+# Cache key -> [lock, number of threads using it]
+_key_locks = {}
+# Audio path -> number of syncs still reading it; pinned files are never evicted
+_pins = {}
+
+def cache_key(video_path):
+    stat = os.stat(video_path)
+    fingerprint = f"{os.path.abspath(video_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+@contextmanager
+def _key_lock(key):
+    with _cache_lock:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _cache_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _key_locks[key]
+
+def _pin(audio_path):
+    # Callers hold _cache_lock
+    _pins[audio_path] = _pins.get(audio_path, 0) + 1
+
+def release_audio(audio_path):
+    """
+    Releases an audio path returned by get_audio, making it evictable again.
+    """
+    with _cache_lock:
+        count = _pins.get(audio_path, 0) - 1
+        if count > 0:
+            _pins[audio_path] = count
+        else:
+            _pins.pop(audio_path, None)
+
+def _evict():
+    entries = []
+    for name in os.listdir(AUDIO_CACHE_DIR):
+        path = os.path.join(AUDIO_CACHE_DIR, name)
+        if not name.endswith(".wav"):
+            continue
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= AUDIO_CACHE_MAX_BYTES:
+            break
+        if path in _pins:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            logger.info(f"Evicted cached audio {path}")
+        except FileNotFoundError:
+            pass
+
+def get_audio(video_path):
+    """
+    Returns the path of the cached alignment audio for video_path, running
+    ffmpeg only on a cache miss. The file is pinned against eviction until
+    the caller passes it to release_audio.
+    """
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    key = cache_key(video_path)
+    audio_path = os.path.join(AUDIO_CACHE_DIR, f"{key}.wav")
+
+    with _key_lock(key):
+        with _cache_lock:
+            hit = os.path.exists(audio_path)
+            if hit:
+                _pin(audio_path)
+        if hit:
+            # mtime doubles as the LRU timestamp
+            os.utime(audio_path)
+            AUDIO_CACHE_LOOKUPS.labels("hit").inc()
+            logger.info(f"Audio cache hit for {video_path}: {audio_path}")
+            return audio_path
+
+        logger.info(f"Audio cache miss, extracting audio from {video_path} to {audio_path}")
+        AUDIO_CACHE_LOOKUPS.labels("miss").inc()
+        partial_path = f"{audio_path}.{os.getpid()}.{threading.get_ident()}.part"
+        started_at = time.monotonic()
+        try:
+            subprocess.run([
+                "ffmpeg", "-nostdin", "-v", "error", "-i", video_path,
+                "-vn", "-ac", "1", "-ar", str(AUDIO_SAMPLE_RATE),
+                "-c:a", "pcm_s16le", "-f", "wav", "-y", partial_path
+            ], check=True)
+            FFMPEG_DURATION.observe(time.monotonic() - started_at)
+            with _cache_lock:
+                os.replace(partial_path, audio_path)
+                _pin(audio_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    with _cache_lock:
+        _evict()
+    return audio_path
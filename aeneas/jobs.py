@@ -0,0 +1,137 @@
+"""
+Asynchronous sync jobs with admission control.
+
+Jobs run on a bounded thread pool. Once max_pending jobs are queued or
+running, new submissions are refused with a Retry-After estimate so callers
+back off instead of piling up on the server.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from metrics import SYNC_JOBS, SYNC_JOB_QUEUE_WAIT, SYNC_JOB_DURATION, SYNC_JOBS_REJECTED
+import tracing
+
+logger = logging.getLogger(__name__)
+
+SYNC_MAX_CONCURRENCY = int(os.getenv("SYNC_MAX_CONCURRENCY", os.getenv("ALIGNER_POOL_SIZE", "2")))
+SYNC_MAX_PENDING = int(os.getenv("SYNC_MAX_PENDING", "8"))
+SYNC_JOB_TTL = int(os.getenv("SYNC_JOB_TTL", "86400"))
+
+class JobQueueFull(Exception):
+    """Raised when max_pending jobs are already queued or running."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Sync queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class SyncJobManager:
+    def __init__(self, max_concurrency=SYNC_MAX_CONCURRENCY, max_pending=SYNC_MAX_PENDING, job_ttl=SYNC_JOB_TTL):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="sync-job")
+        self._jobs = {}
+        self._active = 0
+        self._average_duration = 60.0
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """
+        Seconds until a slot is likely to free up, from the running average job time.
+        """
+        waves = max(1, self._active - self.max_concurrency + 1) / self.max_concurrency
+        return max(5, int(self._average_duration * waves))
+
+    def submit(self, func, *args, callback_url=None, traceparent=None):
+        """
+        Queues func(*args) and returns the job record. func returns the
+        synced SRT path or raises. It runs in a span continuing the
+        caller's trace (traceparent).
+        """
+        with self._lock:
+            self._prune()
+            if self._active >= self.max_pending:
+                SYNC_JOBS_REJECTED.inc()
+                raise JobQueueFull(self.retry_after())
+            self._active += 1
+            SYNC_JOBS.labels("queued").inc()
+            job = {
+                "job_id": str(uuid.uuid4()),
+                "status": "queued",
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "synced_srt": None,
+                "error": None,
+                "callback_url": callback_url,
+                "traceparent": traceparent
+            }
+            self._jobs[job["job_id"]] = job
+        job["future"] = self._executor.submit(self._run, job, func, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+            return {"max_concurrency": self.max_concurrency, "max_pending": self.max_pending, **counts}
+
+    def _run(self, job, func, args):
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        SYNC_JOBS.labels("queued").dec()
+        SYNC_JOBS.labels("running").inc()
+        SYNC_JOB_QUEUE_WAIT.observe(job["started_at"] - job["submitted_at"])
+        try:
+            with tracing.span("sync_job", parent=job["traceparent"], kind="server", job_id=job["job_id"],
+                              queue_wait=round(job["started_at"] - job["submitted_at"], 3)):
+                job["synced_srt"] = func(*args)
+            job["status"] = "done"
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = "failed"
+            logger.error(f"Sync job {job['job_id']} failed: {str(e)}")
+        finally:
+            job["finished_at"] = time.time()
+            SYNC_JOBS.labels("running").dec()
+            with self._lock:
+                self._active -= 1
+                duration = job["finished_at"] - job["started_at"]
+                SYNC_JOB_DURATION.labels(job["status"]).observe(duration)
+                self._average_duration = 0.8 * self._average_duration + 0.2 * duration
+        if job["callback_url"]:
+            self._send_callback(job)
+        return job
+
+    def _send_callback(self, job):
+        try:
+            request = urllib.request.Request(
+                job["callback_url"],
+                data=json.dumps(public_view(job)).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST"
+            )
+            urllib.request.urlopen(request, timeout=10).close()
+        except Exception as e:
+            logger.warning(f"Callback for sync job {job['job_id']} to {job['callback_url']} failed: {str(e)}")
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+def public_view(job):
+    return {key: value for key, value in job.items() if key not in ("future", "callback_url", "traceparent")}
@@ -0,0 +1,34 @@
+"""
+Prometheus metrics for the sync service, exposed on /metrics.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+FFMPEG_DURATION = Histogram(
+    "aeneas_ffmpeg_extract_seconds", "Time to extract alignment audio on a cache miss", buckets=DURATION_BUCKETS
+)
+AUDIO_CACHE_LOOKUPS = Counter("aeneas_audio_cache_lookups_total", "Alignment audio cache lookups", ["result"])
+
+ALIGNMENT_DURATION = Histogram(
+    "aeneas_alignment_seconds", "Time to align one subtitle file", ["method"], buckets=DURATION_BUCKETS
+)
+# Per aligner task: a whole file, or one window of a windowed alignment
+ALIGNER_EXECUTE = Histogram(
+    "aeneas_aligner_execute_seconds", "Time an aligner worker spent on one task", buckets=DURATION_BUCKETS
+)
+ALIGNER_QUEUE_WAIT = Histogram(
+    "aeneas_aligner_queue_wait_seconds", "Time a task waited for a free aligner worker", buckets=DURATION_BUCKETS
+)
+ALIGNER_REJECTED = Counter("aeneas_aligner_rejected_total", "Alignments refused because the aligner queue was full")
+ALIGNER_POOL_RESTARTS = Counter("aeneas_aligner_pool_restarts_total", "Aligner pools replaced after a worker process died")
+
+SYNC_JOBS = Gauge("aeneas_sync_jobs", "Sync jobs admitted and not yet finished", ["state"])
+SYNC_JOB_QUEUE_WAIT = Histogram(
+    "aeneas_sync_job_queue_wait_seconds", "Time a sync job waited for a free slot", buckets=DURATION_BUCKETS
+)
+SYNC_JOB_DURATION = Histogram(
+    "aeneas_sync_job_seconds", "Run time of one sync job", ["status"], buckets=DURATION_BUCKETS
+)
+SYNC_JOBS_REJECTED = Counter("aeneas_sync_jobs_rejected_total", "Sync jobs refused because the queue was full")
@@ -1,10 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 import os
 import subprocess
 import sys
-import re
+import shutil
+import time
 import logging
 from logging.handlers import RotatingFileHandler
+from audio_cache import get_audio, release_audio, AUDIO_CACHE_DIR
+from aligner import align, diagnostics, AlignerBusy
+from windowed import align_windowed, audio_duration, WINDOWED_ALIGNMENT_MIN_SECONDS
+from jobs import SyncJobManager, JobQueueFull, public_view
+from srt_io import iter_cues, write_cues
+from timing import normalize_srt, timing_params
+from metrics import ALIGNMENT_DURATION
+from profiling import profiled, profile_path, profiling_enabled
+import tracing
 
 # Configure logging
 logging.basicConfig(
@@ -18,17 +29,22 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+job_manager = SyncJobManager()
 
 @app.route("/health", methods=["GET"])
 def health_check():
     """
     Health check endpoint to verify service is running.
+    Aeneas diagnostics are computed once and served from cache.
     """
     try:
         # Check if required tools are available
-        subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
-        subprocess.run(["python3", "-m", "aeneas.diagnostics"], capture_output=True, check=True)
-        return jsonify({"status": "healthy"}), 200
+        if not shutil.which("ffmpeg"):
+            raise RuntimeError("ffmpeg not found")
+        result = diagnostics()
+        if result["errors"]:
+            raise RuntimeError(f"aeneas diagnostics failed: {result}")
+        return jsonify({"status": "healthy", "aeneas": result}), 200
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return jsonify({
@@ -39,98 +55,68 @@ def health_check():
 def clean_srt(subtitle_path):
     """
     Cleans SRT file by removing redundant subtitle entries and keeping only complete ones.
-    Uses the second timestamp occurrence for each subtitle block.
+    Uses the last timestamp occurrence for each subtitle block.
     """
     try:
-        with open(subtitle_path, 'r', encoding='utf-8') as file:
-            content = file.read().strip()
-        # Split into subtitle blocks
-        blocks = content.split('\n\n')
-        cleaned_blocks = []
-        subtitle_count = 1
-        # Regular expressions for matching
-        timestamp_pattern = re.compile(r'^\d{2}:\d{2}:\d{2},\d{3} --> \d{2}:\d{2}:\d{2},\d{3}$')
-        number_pattern = re.compile(r'^\d+$')
-
-        for block in blocks:
-            lines = block.split('\n')
-            cleaned_lines = []
-            text_lines = []
-            timestamps = []
-            
-            for line in lines:
-                line = line.strip()
-                if timestamp_pattern.match(line):
-                    timestamps.append(line)
-                elif number_pattern.match(line):
-                    if not cleaned_lines:  # Only add number if it's the first line
-                        cleaned_lines.append(str(subtitle_count))
-                else:
-                    text_lines.append(line)
-
-            # Use the second timestamp if available
-            if len(timestamps) >= 2:
-                cleaned_lines.append(timestamps[1])
-            elif timestamps:  # Fallback to first timestamp if only one exists
-                cleaned_lines.append(timestamps[0])
-
-            if timestamps and text_lines:  # Only keep blocks with both timestamp and text
-                cleaned_lines.extend(text_lines)
-                cleaned_blocks.append('\n'.join(cleaned_lines))
-                subtitle_count += 1
-
-        # Write the cleaned content
-        with open(subtitle_path, 'w', encoding='utf-8') as file:
-            file.write('\n\n'.join(cleaned_blocks))
-            file.write('\n')  # Add final newline
-        
-        logger.info(f"Cleaned subtitle saved to {subtitle_path}")
+        # write_cues streams into a temporary file, so reading the original
+        # lazily while writing is safe
+        count = write_cues(subtitle_path, (cue for cue in iter_cues(subtitle_path) if cue.lines))
+        logger.info(f"Cleaned subtitle saved to {subtitle_path} ({count} cues)")
         return True
     except Exception as e:
         logger.error(f"Error during subtitle cleaning: {e}")
         return False
 
-@app.route("/sync", methods=["POST"])
-def sync_subtitles():
-    """
-    Synchronize subtitles using Aeneas.
-    """
-    data = request.json
+class SyncError(Exception):
+    """Raised by run_sync with the HTTP status the failure maps to."""
 
-    # Input validation
-    if "video_path" not in data or "srt_path" not in data or "language" not in data:
-        return jsonify({"error": "Missing video_path, srt_path, or language in request"}), 400
-
-    video_path = data["video_path"]
-    srt_path = data["srt_path"]
-    source_language = data["language"]
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
 
-    if not os.path.exists(video_path) or not os.path.exists(srt_path):
-        return jsonify({"error": "File does not exist"}), 400
+def use_windowed(audio_file_path, windowed):
+    if windowed is not None:
+        return bool(windowed)
+    return audio_duration(audio_file_path) >= WINDOWED_ALIGNMENT_MIN_SECONDS
 
-    # Step 1: Extract audio from the video file
-    audio_file_path = f"{video_path.rsplit('.', 1)[0]}.mp3"
-    logger.info(f"Extracting audio from {video_path} to {audio_file_path}")
+def run_sync(video_path, srt_path, source_language, windowed=None, timing=None, profile=False):
+    """
+    Synchronize subtitles using Aeneas and return the synced SRT path.
+    Long media (or windowed=True) is aligned in parallel windows. timing
+    overrides the DEFAULT_TIMING normalization parameters. With profile
+    (or PROFILE_JOBS) the job thread and the alignment processes are
+    profiled into <media base>.aeneas.prof and .aeneas-align.prof.
+    """
+    enabled = profiling_enabled(profile)
+    with profiled(profile_path(video_path, "aeneas"), enabled):
+        align_profile = profile_path(video_path, "aeneas-align") if enabled else None
+        return _sync(video_path, srt_path, source_language, windowed, timing, align_profile)
 
+def _sync(video_path, srt_path, source_language, windowed, timing, align_profile):
+    # Step 1: Extract (or reuse cached) alignment audio from the video file
     try:
-        subprocess.run([
-            "ffmpeg", "-i", video_path, "-vn", "-acodec", "libmp3lame",
-            "-ab", "192k", "-ar", "44100", "-y", audio_file_path
-        ], check=True)
-        logger.info(f"Audio file created at: {audio_file_path}")
-    except subprocess.CalledProcessError as e:
-        return jsonify({"error": f"Error during audio extraction: {e}"}), 500
+        with tracing.span("extract_audio"):
+            audio_file_path = get_audio(video_path)
+        logger.info(f"Audio file ready at: {audio_file_path}")
+    except (subprocess.CalledProcessError, OSError) as e:
+        raise SyncError(f"Error during audio extraction: {e}")
 
     # Step 2: Sync the subtitles using Aeneas
     output_subtitle_path = srt_path.replace(".srt", "_aligned.srt")
     try:
-        command = [
-            "python3", "-m", "aeneas.tools.execute_task",
-            audio_file_path, srt_path,
-            f"task_language={source_language}|os_task_file_format=srt|is_text_type=subtitles",
-            output_subtitle_path
-        ]
-        subprocess.run(command, check=True)
+        started_at = time.monotonic()
+        method = "windowed" if use_windowed(audio_file_path, windowed) else "single"
+        with tracing.span("align", method=method, language=source_language):
+            if method == "windowed":
+                align_windowed(audio_file_path, srt_path, source_language,
+                               output_subtitle_path, AUDIO_CACHE_DIR, align_profile)
+            else:
+                align(
+                    audio_file_path, srt_path,
+                    f"task_language={source_language}|os_task_file_format=srt|is_text_type=subtitles",
+                    output_subtitle_path, align_profile
+                )
+        ALIGNMENT_DURATION.labels(method).observe(time.monotonic() - started_at)
         logger.info(f"Subtitle timings corrected and saved: {output_subtitle_path}")
 
         # Step 3: Clean the synced subtitles
@@ -139,18 +125,110 @@ def sync_subtitles():
         else:
             logger.warning("Subtitle cleaning process encountered issues")
 
-        # Step 4: Replace original subtitle file with the aligned version
+        # Step 4: Fix overlaps, flashes and reading speed left by alignment
+        try:
+            with tracing.span("normalize_timing"):
+                normalize_srt(output_subtitle_path, timing)
+        except Exception as e:
+            logger.warning(f"Timing normalization failed, keeping aligned timings: {e}")
+
+        # Step 5: Replace original subtitle file with the aligned version
         os.rename(output_subtitle_path, srt_path)
         logger.info(f"Original subtitle file replaced with aligned version: {srt_path}")
-    except subprocess.CalledProcessError as e:
-        return jsonify({"error": f"Error during subtitle processing: {e}"}), 500
+    except AlignerBusy as e:
+        raise SyncError(str(e), 503)
+    except Exception as e:
+        raise SyncError(f"Error during subtitle processing: {e}")
     finally:
-        if os.path.exists(audio_file_path):
-            os.remove(audio_file_path)
-            logger.info(f"Temporary audio file removed: {audio_file_path}")
+        release_audio(audio_file_path)
 
     logger.info("Processing completed successfully.")
-    return jsonify({"synced_srt": srt_path}), 200
+    return srt_path
+
+def parse_sync_request(data):
+    """
+    Validates a sync request body and returns
+    (video_path, srt_path, language, windowed, timing, profile).
+    """
+    # Input validation
+    if not data or "video_path" not in data or "srt_path" not in data or "language" not in data:
+        raise SyncError("Missing video_path, srt_path, or language in request", 400)
+
+    if not os.path.exists(data["video_path"]) or not os.path.exists(data["srt_path"]):
+        raise SyncError("File does not exist", 400)
+
+    try:
+        timing_params(data.get("timing"))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise SyncError(f"Invalid timing parameters: {e}", 400)
+
+    return (data["video_path"], data["srt_path"], data["language"], data.get("windowed"), data.get("timing"),
+            bool(data.get("profile")))
+
+def queue_full_response(e):
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 429
+
+@app.route("/sync", methods=["POST"])
+def sync_subtitles():
+    """
+    Synchronize subtitles using Aeneas, blocking until the job finishes.
+    Subject to the same admission control as /jobs.
+    """
+    try:
+        args = parse_sync_request(request.json)
+        job = job_manager.submit(run_sync, *args, traceparent=request.headers.get(tracing.TRACEPARENT_HEADER))
+        job["future"].result()
+    except SyncError as e:
+        return jsonify({"error": str(e)}), e.status
+    except JobQueueFull as e:
+        return queue_full_response(e)
+
+    if job["status"] != "done":
+        return jsonify({"error": job["error"]}), 500
+    return jsonify({"synced_srt": job["synced_srt"]}), 200
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """
+    Queue a sync job and return its id immediately. An optional callback_url
+    receives the final job status as a JSON POST.
+    """
+    data = request.json
+    try:
+        args = parse_sync_request(data)
+        job = job_manager.submit(run_sync, *args, callback_url=data.get("callback_url"),
+                                 traceparent=request.headers.get(tracing.TRACEPARENT_HEADER))
+    except SyncError as e:
+        return jsonify({"error": str(e)}), e.status
+    except JobQueueFull as e:
+        return queue_full_response(e)
+
+    logger.info(f"Queued sync job {job['job_id']} for {args[1]}")
+    response = jsonify({**public_view(job), "status_url": f"/jobs/{job['job_id']}"})
+    response.headers["Location"] = f"/jobs/{job['job_id']}"
+    return response, 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Report queued/running/done/failed and the synced SRT path when done.
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(public_view(job)), 200
+
+@app.route("/jobs", methods=["GET"])
+def job_stats():
+    return jsonify(job_manager.stats()), 200
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001)
\ No newline at end of file
+    # Start the aligner workers and cache diagnostics before serving
+    diagnostics()
+    app.run(host="0.0.0.0", port=5001, threaded=True)
\ No newline at end of file
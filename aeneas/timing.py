@@ -0,0 +1,108 @@
+"""
+Cue timing normalization applied after alignment.
+
+Start/end times are loaded into NumPy arrays and fixed in whole-array
+passes: global offset/drift correction, minimum duration and maximum
+reading speed (characters per second), maximum duration, and minimum gap
+with overlap resolution. Every parameter has an environment default and
+can be overridden per job.
+"""
+
+import os
+import logging
+import numpy as np
+from srt_io import iter_cues, write_cues
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMING = {
+    "enabled": os.getenv("TIMING_NORMALIZATION", "true").lower() == "true",
+    # Linear correction t' = t * (1 + drift_ppm / 1e6) + offset_ms
+    "offset_ms": int(os.getenv("TIMING_OFFSET_MS", "0")),
+    "drift_ppm": float(os.getenv("TIMING_DRIFT_PPM", "0")),
+    "min_duration_ms": int(os.getenv("TIMING_MIN_DURATION_MS", "800")),
+    "max_duration_ms": int(os.getenv("TIMING_MAX_DURATION_MS", "7000")),
+    "min_gap_ms": int(os.getenv("TIMING_MIN_GAP_MS", "80")),
+    "max_cps": float(os.getenv("TIMING_MAX_CPS", "20")),
+}
+# Offset and drift may be negative; these may not
+NON_NEGATIVE = ("min_duration_ms", "max_duration_ms", "min_gap_ms")
+
+def timing_params(overrides=None):
+    """
+    Returns DEFAULT_TIMING with per-job overrides applied. Raises ValueError
+    for unknown, mistyped or out-of-range parameters.
+    """
+    params = dict(DEFAULT_TIMING)
+    for key, value in (overrides or {}).items():
+        if key not in DEFAULT_TIMING:
+            raise ValueError(f"Unknown timing parameter: {key}")
+        if key == "enabled":
+            # bool("false") is True, so only accept real booleans
+            if not isinstance(value, bool):
+                raise ValueError("Timing parameter enabled must be true or false")
+            params[key] = value
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Timing parameter {key} must be a number")
+        else:
+            params[key] = type(DEFAULT_TIMING[key])(value)
+    if params["max_cps"] <= 0:
+        raise ValueError("Timing parameter max_cps must be positive")
+    for key in NON_NEGATIVE:
+        if params[key] < 0:
+            raise ValueError(f"Timing parameter {key} must not be negative")
+    return params
+
+def normalize(starts, ends, char_counts, params):
+    """
+    Returns normalized (starts, ends) as int64 millisecond arrays. Inputs are
+    in cue order; later cues never start before earlier ones on output.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    if starts.size == 0:
+        return starts.astype(np.int64), ends.astype(np.int64)
+    chars = np.asarray(char_counts, dtype=np.float64)
+
+    # Offset and drift
+    scale = 1.0 + params["drift_ppm"] / 1e6
+    starts = np.maximum(starts * scale + params["offset_ms"], 0)
+    ends = np.maximum(ends * scale + params["offset_ms"], 0)
+    starts = np.maximum.accumulate(starts)
+    ends = np.maximum(ends, starts)
+
+    # Long enough to read: the larger of the minimum duration and the text
+    # length at max_cps, but no longer than max_duration
+    needed = np.maximum(params["min_duration_ms"], chars * 1000.0 / params["max_cps"])
+    ends = np.maximum(ends, starts + needed)
+    ends = np.minimum(ends, starts + params["max_duration_ms"])
+
+    # Keep min_gap before the next cue. Where that would cut a cue below its
+    # minimum duration, give up the gap (but never overlap) instead.
+    next_starts = starts[1:]
+    limit = next_starts - params["min_gap_ms"]
+    floor = np.minimum(starts[:-1] + params["min_duration_ms"], next_starts)
+    ends[:-1] = np.maximum(np.minimum(ends[:-1], limit), floor)
+
+    return np.rint(starts).astype(np.int64), np.rint(ends).astype(np.int64)
+
+def normalize_srt(srt_path, overrides=None):
+    """
+    Normalizes the cue timings of srt_path in place. Returns the number of
+    cues whose timing changed.
+    """
+    params = timing_params(overrides)
+    if not params["enabled"]:
+        return 0
+    cues = [cue for cue in iter_cues(srt_path) if cue.lines]
+    starts = np.fromiter((cue.start for cue in cues), dtype=np.int64, count=len(cues))
+    ends = np.fromiter((cue.end for cue in cues), dtype=np.int64, count=len(cues))
+    chars = np.fromiter((sum(len(line) for line in cue.lines) for cue in cues), dtype=np.int64, count=len(cues))
+
+    new_starts, new_ends = normalize(starts, ends, chars, params)
+    changed = int(np.count_nonzero((new_starts != starts) | (new_ends != ends)))
+    for cue, start, end in zip(cues, new_starts.tolist(), new_ends.tolist()):
+        cue.start, cue.end = start, end
+    write_cues(srt_path, cues)
+    logger.info(f"Normalized timing of {changed}/{len(cues)} cues in {srt_path}")
+    return changed
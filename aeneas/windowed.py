@@ -0,0 +1,160 @@
+"""
+Windowed alignment for long media.
+
+The cues are split into windows at the widest inter-cue gaps (which on
+Whisper output coincide with silence), each window is aligned against its
+own slice of the audio in parallel, and the results are shifted back by the
+slice offset. Windows overlap by a few cues on each side so every cue is
+aligned with context; the overlap is discarded and each cue keeps the timing
+from the window that owns it.
+"""
+
+import os
+import json
+import wave
+import shutil
+import logging
+import tempfile
+from srt_io import Cue, iter_cues, write_cues
+from profiling import merge_profiles
+from aligner import align_many
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = float(os.getenv("ALIGN_WINDOW_SECONDS", "600"))
+WINDOW_SEARCH_SECONDS = float(os.getenv("ALIGN_WINDOW_SEARCH_SECONDS", "60"))
+WINDOW_OVERLAP_CUES = int(os.getenv("ALIGN_WINDOW_OVERLAP_CUES", "3"))
+WINDOW_PADDING_SECONDS = float(os.getenv("ALIGN_WINDOW_PADDING_SECONDS", "5"))
+WINDOWED_ALIGNMENT_MIN_SECONDS = float(os.getenv("WINDOWED_ALIGNMENT_MIN_SECONDS", "1800"))
+
+def audio_duration(audio_path):
+    with wave.open(audio_path, "rb") as audio:
+        return audio.getnframes() / audio.getframerate()
+
+def plan_windows(cues):
+    """
+    Splits cue indices into contiguous [start, end) core ranges of roughly
+    WINDOW_SECONDS, cutting at the widest gap within the search range.
+    """
+    window_ms = WINDOW_SECONDS * 1000
+    search_ms = WINDOW_SEARCH_SECONDS * 1000
+    windows = []
+    start = 0
+    while start < len(cues):
+        target = cues[start].start + window_ms
+        if cues[-1].start < target + search_ms:
+            windows.append((start, len(cues)))
+            break
+        end = start + 1
+        while cues[end].start < target - search_ms:
+            end += 1
+        best, best_gap = end, -1
+        for candidate in range(end, len(cues)):
+            if cues[candidate].start >= target + search_ms:
+                break
+            gap = cues[candidate].start - cues[candidate - 1].end
+            if gap > best_gap:
+                best, best_gap = candidate, gap
+        end = best
+        windows.append((start, end))
+        start = end
+    return windows
+
+def _write_audio_slice(audio_path, output_path, begin, end):
+    with wave.open(audio_path, "rb") as source:
+        rate = source.getframerate()
+        first = int(begin * rate)
+        last = min(source.getnframes(), int(end * rate))
+        source.setpos(first)
+        with wave.open(output_path, "wb") as target:
+            target.setparams(source.getparams())
+            remaining = last - first
+            # Copy in chunks so a worker never holds more than one window
+            while remaining > 0:
+                frames = source.readframes(min(remaining, rate * 10))
+                if not frames:
+                    break
+                target.writeframes(frames)
+                remaining -= min(remaining, rate * 10)
+
+def _write_text(cues, output_path):
+    # aeneas "subtitles" text format: one fragment per blank-line separated block
+    with open(output_path, "w", encoding="utf-8") as file:
+        file.write("\n\n".join(cue.text for cue in cues))
+        file.write("\n")
+
+def prepare_windows(audio_path, cues, work_dir):
+    """
+    Writes the audio slice and text for every window and returns their
+    descriptions, including the cue range each window owns.
+    """
+    duration = audio_duration(audio_path)
+    windows = []
+    for number, (core_start, core_end) in enumerate(plan_windows(cues)):
+        first = max(0, core_start - WINDOW_OVERLAP_CUES)
+        last = min(len(cues), core_end + WINDOW_OVERLAP_CUES)
+        begin = max(0.0, cues[first].start / 1000 - WINDOW_PADDING_SECONDS)
+        end = min(duration, cues[last - 1].end / 1000 + WINDOW_PADDING_SECONDS)
+
+        window_audio = os.path.join(work_dir, f"window_{number:04d}.wav")
+        window_text = os.path.join(work_dir, f"window_{number:04d}.txt")
+        window_output = os.path.join(work_dir, f"window_{number:04d}.json")
+        _write_audio_slice(audio_path, window_audio, begin, end)
+        _write_text(cues[first:last], window_text)
+        windows.append({
+            "audio": window_audio,
+            "text": window_text,
+            "output": window_output,
+            "offset": begin,
+            "first": first,
+            "core_start": core_start,
+            "core_end": core_end
+        })
+    return windows
+
+def stitch(cues, windows):
+    """
+    Applies each window's aligned fragment times, shifted by the window
+    offset, to the cues it owns.
+    """
+    aligned = [Cue(cue.start, cue.end, cue.lines, cue.index) for cue in cues]
+    for window in windows:
+        with open(window["output"], "r", encoding="utf-8") as file:
+            fragments = json.load(file)["fragments"]
+        for i in range(window["core_start"], window["core_end"]):
+            fragment = fragments[i - window["first"]]
+            aligned[i].start = int(round((window["offset"] + float(fragment["begin"])) * 1000))
+            aligned[i].end = int(round((window["offset"] + float(fragment["end"])) * 1000))
+    # Reconcile window seams so a cue never starts before the previous one ends
+    for previous, cue in zip(aligned, aligned[1:]):
+        if cue.start < previous.end:
+            previous.end = cue.start
+    return aligned
+
+def align_windowed(audio_path, srt_path, language, output_path, scratch_dir, profile_path=None):
+    """
+    Aligns srt_path against audio_path window by window, in parallel in the
+    configured ALIGNER_MODE, and writes the stitched SRT to output_path. With profile_path, every
+    window is profiled and the profiles are merged there.
+    """
+    # aeneas needs a non-empty text for every fragment
+    cues = [cue for cue in iter_cues(srt_path) if cue.lines]
+    if not cues:
+        raise ValueError(f"No cues found in {srt_path}")
+    work_dir = tempfile.mkdtemp(prefix="windows-", dir=scratch_dir)
+    try:
+        windows = prepare_windows(audio_path, cues, work_dir)
+        logger.info(f"Aligning {len(cues)} cues in {len(windows)} windows of ~{WINDOW_SECONDS:.0f}s")
+        config_string = f"task_language={language}|os_task_file_format=json|is_text_type=subtitles"
+        profile_paths = None
+        if profile_path:
+            profile_paths = [os.path.join(work_dir, f"window_{number:04d}.prof") for number in range(len(windows))]
+        timings = align_many([
+            (window["audio"], window["text"], config_string, window["output"]) for window in windows
+        ], profile_paths)
+        if profile_paths:
+            merge_profiles(profile_paths, profile_path)
+        write_cues(output_path, stitch(cues, windows))
+        return timings
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,119 @@
+"""
+Compares the two alignment paths on a fixture with reference subtitles.
+
+  aeneas: Whisper SRT output, then an aeneas alignment pass
+  words:  Whisper word timestamps, segmented locally, no alignment pass
+
+Both run against the live Whisper and aeneas services. The media path must
+be visible to both under the same path, e.g. under /mediacenter. The
+script reports wall time per step and the timing error of each result
+against the reference SRT:
+- boundary error: the distance from each reference cue start/end to the
+  nearest produced one
+- speech IoU: the overlap of the time covered by cues
+
+    python bench/alignment_compare.py --media /mediacenter/fixture.mkv \\
+        --reference /mediacenter/fixture.reference.srt --language eng
+"""
+
+import os
+import sys
+import time
+import bisect
+import shutil
+import argparse
+import statistics
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--media", required=True)
+    parser.add_argument("--reference", required=True, help="Hand-timed SRT for the fixture")
+    parser.add_argument("--language", default="eng")
+    parser.add_argument("--whisper-url", default="http://localhost:9000/asr")
+    parser.add_argument("--aeneas-url", default="http://localhost:5001/jobs")
+    return parser.parse_args()
+
+def boundary_errors(reference, produced):
+    """
+    Absolute distance in ms from every reference start and end to the
+    nearest start or end among produced cues.
+    """
+    starts = sorted(cue.start for cue in produced)
+    ends = sorted(cue.end for cue in produced)
+
+    def nearest(values, target):
+        i = bisect.bisect_left(values, target)
+        return min(abs(values[j] - target) for j in (i - 1, i) if 0 <= j < len(values))
+
+    return ([nearest(starts, cue.start) for cue in reference]
+            + [nearest(ends, cue.end) for cue in reference])
+
+def covered(cues):
+    intervals = []
+    for cue in sorted(cues, key=lambda cue: cue.start):
+        if intervals and cue.start <= intervals[-1][1]:
+            intervals[-1][1] = max(intervals[-1][1], cue.end)
+        else:
+            intervals.append([cue.start, cue.end])
+    return intervals
+
+def speech_iou(reference, produced):
+    a, b = covered(reference), covered(produced)
+    intersection, i, j = 0, 0, 0
+    while i < len(a) and j < len(b):
+        intersection += max(0, min(a[i][1], b[j][1]) - max(a[i][0], b[j][0]))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    union = sum(end - start for start, end in a) + sum(end - start for start, end in b) - intersection
+    return intersection / union if union else 0.0
+
+def report(name, timings, reference, produced):
+    errors = sorted(boundary_errors(reference, produced))
+    p90 = errors[int(len(errors) * 0.9)] if errors else 0
+    steps = ", ".join(f"{step} {seconds:.1f}s" for step, seconds in timings.items())
+    print(f"{name:<8} wall {sum(timings.values()):>7.1f}s ({steps})")
+    print(f"{'':<8} {len(produced)} cues, boundary error median {statistics.median(errors):.0f} ms, "
+          f"p90 {p90:.0f} ms, speech IoU {speech_iou(reference, produced):.3f}")
+
+def main():
+    args = parse_args()
+    os.environ["WHISPER_ASR_URL"] = args.whisper_url
+    os.environ["AENEAS_JOBS_URL"] = args.aeneas_url
+    sys.path[:0] = [os.path.join(ROOT, "shared"), os.path.join(ROOT, "worker")]
+    from srt_io import read_cues
+    from whisper_transcription import process_whisper_transcription
+    from aeneas_sync import sync_subtitles
+
+    reference = [cue for cue in read_cues(args.reference) if cue.lines]
+    base_path = os.path.splitext(args.media)[0]
+
+    # aeneas path
+    timings = {}
+    started = time.monotonic()
+    result = process_whisper_transcription(args.media, args.language)
+    timings["whisper"] = time.monotonic() - started
+    if not result:
+        sys.exit("Whisper transcription failed")
+    aeneas_srt = f"{base_path}.compare-aeneas.srt"
+    shutil.move(result["srt_path"], aeneas_srt)
+    started = time.monotonic()
+    if not sync_subtitles(args.media, aeneas_srt, args.language):
+        sys.exit("aeneas alignment failed")
+    timings["aeneas"] = time.monotonic() - started
+    report("aeneas", timings, reference, read_cues(aeneas_srt))
+
+    # Word-timestamp path
+    started = time.monotonic()
+    result = process_whisper_transcription(args.media, args.language, word_timestamps=True)
+    if not result:
+        sys.exit("Whisper word-timestamp transcription failed")
+    words_srt = f"{base_path}.compare-words.srt"
+    shutil.move(result["srt_path"], words_srt)
+    report("words", {"whisper+segment": time.monotonic() - started}, reference, read_cues(words_srt))
+
+if __name__ == "__main__":
+    main()
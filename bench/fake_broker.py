@@ -0,0 +1,351 @@
+"""
+In-process stand-in for RabbitMQ, for benchmarks that run without a broker.
+
+install(broker) swaps pika.BlockingConnection and pika.SelectConnection for
+connections to an in-memory Broker, so flask-app and the worker run
+unmodified in one process. It covers the part of AMQP the pipeline uses:
+queues on the default exchange, priorities (x-max-priority), per-queue and
+per-message TTL with dead-lettering (the retry queues), prefetch, ack and nack
+with requeue, redelivery of unacked messages when a channel closes, and
+publisher confirms. Persistence, other exchanges and flow control are not
+modelled.
+
+pika itself must be installed: properties, exceptions and the confirm
+frames are the real pika classes.
+"""
+
+import heapq
+import time
+import itertools
+import threading
+import functools
+import collections
+from types import SimpleNamespace
+import pika
+
+SWEEP_INTERVAL = 0.05
+
+class _Queue:
+    def __init__(self, name, arguments):
+        arguments = arguments or {}
+        self.name = name
+        self.ttl = arguments.get("x-message-ttl")
+        self.dead_letter_to = arguments.get("x-dead-letter-routing-key")
+        self.max_priority = arguments.get("x-max-priority")
+        # (-priority, sequence, message); requeued messages get a negative
+        # sequence so they go back to the head of their priority
+        self.ready = []
+
+class Broker:
+    def __init__(self):
+        self.published = 0
+        self.dead_lettered = 0
+        self._queues = {}
+        self._sequence = itertools.count(1)
+        self._changed = threading.Condition()
+        threading.Thread(target=self._sweep, name="fake-broker-ttl", daemon=True).start()
+
+    def declare(self, name, arguments=None, passive=False):
+        with self._changed:
+            if name not in self._queues:
+                if passive:
+                    raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{name}'")
+                self._queues[name] = _Queue(name, arguments)
+            return len(self._queues[name].ready)
+
+    def publish(self, routing_key, body, properties=None, requeue=False):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        properties = properties or pika.BasicProperties()
+        with self._changed:
+            queue = self._queues.get(routing_key)
+            if queue is None:
+                # The default exchange drops messages for unknown queues
+                return
+            priority = min(properties.priority or 0, queue.max_priority) if queue.max_priority else 0
+            ttl = int(properties.expiration) if properties.expiration else queue.ttl
+            message = SimpleNamespace(
+                body=body, properties=properties, routing_key=routing_key, redelivered=requeue,
+                expires_at=time.monotonic() + ttl / 1000 if ttl and not requeue else None
+            )
+            sequence = next(self._sequence)
+            heapq.heappush(queue.ready, (-priority, -sequence if requeue else sequence, message))
+            if not requeue:
+                self.published += 1
+            self._changed.notify_all()
+
+    def get(self, queue_name):
+        with self._changed:
+            queue = self._queues.get(queue_name)
+            if queue is None or not queue.ready:
+                return None
+            return heapq.heappop(queue.ready)[2]
+
+    def depths(self):
+        with self._changed:
+            return {name: len(queue.ready) for name, queue in self._queues.items()}
+
+    def notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait(self, timeout):
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def _sweep(self):
+        # Like RabbitMQ, only the head of a queue expires; every delay queue
+        # here holds messages of one TTL, so the head expires first
+        while True:
+            time.sleep(SWEEP_INTERVAL)
+            expired = []
+            with self._changed:
+                now = time.monotonic()
+                for queue in self._queues.values():
+                    while queue.ready and queue.ready[0][2].expires_at is not None \
+                            and queue.ready[0][2].expires_at <= now:
+                        expired.append((queue, heapq.heappop(queue.ready)[2]))
+            for queue, message in expired:
+                if queue.dead_letter_to:
+                    self.dead_lettered += 1
+                    # Dead-lettering drops the per-message expiration
+                    properties = pika.BasicProperties(**{**vars(message.properties), "expiration": None})
+                    self.publish(queue.dead_letter_to, message.body, properties)
+
+class _Channel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.prefetch_count = 0
+        self.consumers = {}
+        self.unacked = {}
+        self.is_open = True
+        self._delivery_tags = itertools.count(1)
+        self._consumer_tags = itertools.count(1)
+        self._confirm_callback = None
+        self._publish_tags = itertools.count(1)
+        self._close_callbacks = []
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def queue_declare(self, queue, durable=False, arguments=None, passive=False, callback=None, **kwargs):
+        count = self.broker.declare(queue, arguments, passive)
+        frame = SimpleNamespace(method=SimpleNamespace(queue=queue, message_count=count, consumer_count=0))
+        if callback:
+            self.connection.ioloop.add_callback(functools.partial(callback, frame))
+        return frame
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, **kwargs):
+        tag = f"ctag{next(self._consumer_tags)}"
+        self.consumers[tag] = (queue, on_message_callback, auto_ack)
+        return tag
+
+    def basic_cancel(self, consumer_tag):
+        self.consumers.pop(consumer_tag, None)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.broker.publish(routing_key, body, properties)
+        if self._confirm_callback:
+            frame = SimpleNamespace(method=pika.spec.Basic.Ack(delivery_tag=next(self._publish_tags)))
+            self.connection.ioloop.add_callback(functools.partial(self._confirm_callback, frame))
+
+    def start_consuming(self):
+        self.connection.start_consuming()
+
+    def stop_consuming(self):
+        self.consumers.clear()
+
+    def tx_select(self):
+        pass
+
+    def tx_commit(self):
+        pass
+
+    def confirm_delivery(self, ack_nack_callback=None, callback=None):
+        self._confirm_callback = ack_nack_callback
+        if callback:
+            self.connection.ioloop.add_callback(functools.partial(callback, SimpleNamespace()))
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        for tag in self._settled(delivery_tag, multiple):
+            self.unacked.pop(tag, None)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        for tag in self._settled(delivery_tag, multiple):
+            message = self.unacked.pop(tag, None)
+            if message and requeue:
+                self.broker.publish(message.routing_key, message.body, message.properties, requeue=True)
+
+    def add_on_close_callback(self, callback):
+        self._close_callbacks.append(callback)
+
+    def close(self, reason="closed"):
+        if not self.is_open:
+            return
+        self.is_open = False
+        self.consumers.clear()
+        for tag in list(self.unacked):
+            self.basic_nack(tag, requeue=True)
+        for callback in self._close_callbacks:
+            callback(self, reason)
+
+    def _settled(self, delivery_tag, multiple):
+        if multiple:
+            return [tag for tag in list(self.unacked) if delivery_tag == 0 or tag <= delivery_tag]
+        return [delivery_tag]
+
+    def deliver(self):
+        """
+        Hands ready messages to this channel's consumers within the
+        prefetch limit. Returns the number delivered.
+        """
+        delivered = 0
+        for consumer_tag, (queue, callback, auto_ack) in list(self.consumers.items()):
+            while self.is_open and consumer_tag in self.consumers:
+                if self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+                    break
+                message = self.broker.get(queue)
+                if message is None:
+                    break
+                tag = next(self._delivery_tags)
+                if not auto_ack:
+                    self.unacked[tag] = message
+                method = SimpleNamespace(delivery_tag=tag, redelivered=message.redelivered,
+                                         routing_key=queue, consumer_tag=consumer_tag, exchange="")
+                callback(self, method, message.properties, message.body)
+                delivered += 1
+        return delivered
+
+class BlockingConnection:
+    def __init__(self, broker, parameters=None):
+        self.broker = broker
+        self.parameters = parameters
+        self.is_open = True
+        self._channels = []
+        self._callbacks = collections.deque()
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def channel(self):
+        channel = _Channel(self)
+        self._channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError("Connection is closed")
+        self._callbacks.append(callback)
+        self.broker.notify()
+
+    def process_data_events(self, time_limit=0):
+        deadline = time.monotonic() + (time_limit or 0)
+        while self.is_open:
+            handled = 0
+            while self._callbacks:
+                self._callbacks.popleft()()
+                handled += 1
+            for channel in self._channels:
+                handled += channel.deliver()
+            remaining = deadline - time.monotonic()
+            if handled or remaining <= 0:
+                return
+            self.broker.wait(min(remaining, SWEEP_INTERVAL))
+
+    def sleep(self, duration):
+        deadline = time.monotonic() + duration
+        while self.is_open and time.monotonic() < deadline:
+            self.process_data_events(time_limit=deadline - time.monotonic())
+
+    def start_consuming(self):
+        while self.is_open and any(channel.consumers for channel in self._channels):
+            self.process_data_events(time_limit=1)
+
+    def close(self):
+        for channel in self._channels:
+            channel.close()
+        self.is_open = False
+
+class _IOLoop:
+    def __init__(self):
+        self._callbacks = collections.deque()
+        self._timers = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+        self._running = False
+
+    def add_callback(self, callback):
+        with self._wakeup:
+            self._callbacks.append(callback)
+            self._wakeup.notify()
+
+    add_callback_threadsafe = add_callback
+
+    def call_later(self, delay, callback):
+        with self._wakeup:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._sequence), callback))
+            self._wakeup.notify()
+
+    def start(self):
+        self._running = True
+        while self._running:
+            with self._wakeup:
+                now = time.monotonic()
+                while self._timers and self._timers[0][0] <= now:
+                    self._callbacks.append(heapq.heappop(self._timers)[2])
+                if not self._callbacks:
+                    timeout = self._timers[0][0] - now if self._timers else None
+                    self._wakeup.wait(timeout)
+                    continue
+                callback = self._callbacks.popleft()
+            callback()
+
+    def stop(self):
+        self._running = False
+        with self._wakeup:
+            self._wakeup.notify()
+
+class SelectConnection:
+    def __init__(self, broker, parameters=None, on_open_callback=None, on_open_error_callback=None,
+                 on_close_callback=None):
+        self.broker = broker
+        self.parameters = parameters
+        self.ioloop = _IOLoop()
+        self.is_open = True
+        self._channels = []
+        self._on_close_callback = on_close_callback
+        if on_open_callback:
+            self.ioloop.add_callback(functools.partial(on_open_callback, self))
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def channel(self, on_open_callback=None):
+        channel = _Channel(self)
+        self._channels.append(channel)
+        if on_open_callback:
+            self.ioloop.add_callback(functools.partial(on_open_callback, channel))
+        return channel
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        for channel in self._channels:
+            channel.close()
+        if self._on_close_callback:
+            self.ioloop.add_callback(functools.partial(self._on_close_callback, self, "closed"))
+
+def install(broker):
+    """
+    Routes every new pika connection in this process to broker.
+    """
+    pika.BlockingConnection = functools.partial(BlockingConnection, broker)
+    pika.SelectConnection = functools.partial(SelectConnection, broker)
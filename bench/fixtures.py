@@ -0,0 +1,81 @@
+"""
+Synthetic media and subtitle fixtures for the offline benchmarks.
+
+Media files are real, test-pattern videos with a tone when ffmpeg is on PATH
+(so ffprobe, audio extraction and chunking behave as in production), and
+otherwise placeholder files of the requested size, which are enough for
+the container upload path (WHISPER_UPLOAD_MODE=container).
+"""
+
+import os
+import sys
+import random
+import shutil
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from srt_io import Cue, write_cues  # noqa: E402
+
+WORDS = ("the quick brown fox jumps over a lazy dog while someone shouts from the "
+         "other room about dinner and 42 reasons to leave now").split()
+
+def synthetic_cues(count, seed=1, start=1000):
+    """
+    Returns count cues of one or two lines of filler text, 1.5-4.5s long
+    with short gaps, starting at start ms.
+    """
+    rng = random.Random(seed)
+    cues = []
+    position = start
+    for _ in range(count):
+        duration = rng.randint(1500, 4500)
+        lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))
+                 for _ in range(rng.randint(1, 2))]
+        cues.append(Cue(position, position + duration, lines))
+        position += duration + rng.randint(100, 1500)
+    return cues
+
+def write_srt(path, count, seed=1):
+    return write_cues(path, synthetic_cues(count, seed))
+
+def have_ffmpeg():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+def make_media(path, size_mb=1.0, seconds=None):
+    """
+    Writes a fixture media file. With ffmpeg and seconds, a Matroska file
+    with a test-pattern video and a sine audio track tagged English;
+    otherwise a sparse placeholder of size_mb.
+    """
+    if seconds and have_ffmpeg():
+        subprocess.run([
+            "ffmpeg", "-nostdin", "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc=size=320x240:rate=10:duration={seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac",
+            "-metadata:s:a:0", "language=eng", path
+        ], check=True, timeout=600)
+        return path
+    with open(path, "wb") as media_file:
+        media_file.truncate(int(size_mb * 1048576))
+    return path
+
+def build_library(root, titles, size_mb=1.0, seconds=None, first_tmdb_id=1000):
+    """
+    Creates titles movie folders under root, one media file each, and
+    returns [(tmdb_id, media_path)]. ffmpeg output is reused across titles:
+    only the first file is encoded, the rest are copies.
+    """
+    library = []
+    template = None
+    for number in range(titles):
+        tmdb_id = first_tmdb_id + number
+        directory = os.path.join(root, f"Movie {tmdb_id} (2000)")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"Movie {tmdb_id} (2000).mkv")
+        if template is None:
+            template = make_media(path, size_mb, seconds)
+        else:
+            shutil.copyfile(template, path)
+        library.append((tmdb_id, path))
+    return library
@@ -0,0 +1,297 @@
+"""
+End-to-end load test of the webhook pipeline with no GPU, Radarr or
+translation service.
+
+flask-app and the worker run in this process, unmodified, against local
+stand-ins (bench/standins.py) for Whisper, aeneas, Radarr and the
+translation backend, and against either an in-memory broker
+(bench/fake_broker.py, the default) or a real RabbitMQ (--broker rabbitmq
+--rabbitmq-host localhost). The load generator posts Radarr webhooks to
+/webhook at --rate per second and waits for every accepted job to finish.
+
+Reported:
+- webhooks/s accepted and p50/p99 ingest latency (client-side)
+- jobs/hour, from the first webhook to the last finished job
+- mean time per pipeline stage, from the worker's stage histograms
+- stand-in request, error and rejection counts
+
+With --baseline, a previous --json report, the run fails (exit 1) when
+throughput drops or p99 latency grows by more than --tolerance.
+
+    python bench/load_test.py --webhooks 200 --rate 50 --whisper-latency 0.5 \\
+        --aeneas-latency 0.2 --translate-latency 0.05 --json report.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+import fixtures  # noqa: E402
+import standins  # noqa: E402
+
+STAGES = ("transcribe", "align", "translate")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--broker", choices=("fake", "rabbitmq"), default="fake")
+    parser.add_argument("--rabbitmq-host", default="localhost")
+    parser.add_argument("--webhooks", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0, help="Webhooks per second (0: as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent webhook requests")
+    parser.add_argument("--titles", type=int, default=0,
+                        help="Distinct movies (default: one per webhook); fewer exercises deduplication")
+    parser.add_argument("--media-mb", type=float, default=1.0, help="Placeholder media size")
+    parser.add_argument("--media-seconds", type=float, default=0,
+                        help="Encode real media of this length (needs ffmpeg; enables audio upload mode)")
+    parser.add_argument("--webhook-mode", choices=("fast", "sync"), default="fast")
+    parser.add_argument("--target-language", default="spa")
+    for stage in STAGES:
+        parser.add_argument(f"--{stage}-consumers", type=int, default=2, help=f"Worker {stage} consumers")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for jobs to finish")
+    parser.add_argument("--workdir", default=None, help="Keep fixtures and state here instead of a temp dir")
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Compare against a previous --json report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    standins.add_arguments(parser)
+    return parser.parse_args()
+
+def configure_environment(args, workdir, services):
+    """
+    Points flask-app and the worker at the stand-ins and the work
+    directory. Must run before either is imported: both read their
+    configuration at import time.
+    """
+    state = os.path.join(workdir, "state")
+    audio_upload = bool(args.media_seconds) and fixtures.have_ffmpeg()
+    os.environ.update({
+        "RABBITMQ_HOST": args.rabbitmq_host,
+        "RADARR_API_KEY": "bench",
+        "RADARR_API_URL": f"{services['radarr'].url}/api/v3/movie",
+        "WEBHOOK_MODE": args.webhook_mode,
+        "DEDUP_DB_PATH": os.path.join(state, "job_index.db"),
+        "PUBLISH_SPOOL_PATH": os.path.join(state, "publish_spool.db"),
+        "WEBHOOK_EVENTS_SPOOL_PATH": os.path.join(state, "webhook_events_spool.db"),
+        "ENRICHMENT_RETRY_DELAY": "1",
+        "JOB_STATE_PATH": os.path.join(state, "job_state.db"),
+        "TRANSLATION_MEMORY_PATH": os.path.join(state, "translation_memory.db"),
+        "WHISPER_ASR_URL": f"{services['whisper'].url}/asr",
+        "WHISPER_UPLOAD_MODE": "audio" if audio_upload else "container",
+        "CHUNKED_TRANSCRIPTION": "auto" if audio_upload else "never",
+        "AENEAS_JOBS_URL": f"{services['aeneas'].url}/jobs",
+        "AENEAS_POLL_INTERVAL": "0.2",
+        "TRANSLATION_BACKEND": "libretranslate",
+        "TRANSLATION_URL": f"{services['translate'].url}/translate",
+        "DEFAULT_TARGET_LANGUAGE": args.target_language,
+        "RETRY_BASE_DELAY": "1",
+        # The fake broker has no consumer timeout
+        "RABBITMQ_CONSUMER_TIMEOUT": "0",
+        "SCHEDULER_WINDOW": "20",
+        "METRICS_PORT": "0",
+        **{f"{stage.upper()}_CONCURRENCY": str(getattr(args, f"{stage}_consumers")) for stage in STAGES}
+    })
+
+def start_flask_app(workdir):
+    """
+    Imports flask-app (which connects its publishers on import) and serves
+    it on a free port. Returns the base URL.
+    """
+    from werkzeug.serving import make_server
+    sys.path.insert(0, os.path.join(ROOT, "flask-app"))
+    # app.py writes app.log to the working directory
+    os.chdir(workdir)
+    import app
+    # flask-app and the worker both have a metrics module
+    sys.path.remove(os.path.join(ROOT, "flask-app"))
+    del sys.modules["metrics"]
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="flask-app", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def start_worker():
+    sys.path.insert(0, os.path.join(ROOT, "worker"))
+    import rabbitmq_handler
+    for stage_name, stage in rabbitmq_handler.STAGES.items():
+        for index in range(stage["concurrency"]):
+            threading.Thread(target=rabbitmq_handler.run_consumer, args=(stage_name,),
+                             name=f"{stage_name}-{index}", daemon=True).start()
+    return rabbitmq_handler
+
+def send_webhooks(url, library, args):
+    """
+    Posts args.webhooks Radarr webhooks, cycling through library, at
+    args.rate per second. Returns [(status, seconds)] and the wall time.
+    """
+    import requests
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    def post(number):
+        tmdb_id, path = library[number % len(library)]
+        payload = {"eventType": "Download", "movie": {"tmdbId": tmdb_id, "title": f"Movie {tmdb_id}"},
+                   "movieFile": {"path": path, "relativePath": os.path.basename(path),
+                                 "size": os.path.getsize(path)}}
+        start = time.monotonic()
+        try:
+            status = session.post(f"{url}/webhook", json=payload, timeout=60).status_code
+        except requests.RequestException:
+            status = None
+        return status, time.monotonic() - start
+
+    start = time.monotonic()
+    futures = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for number in range(args.webhooks):
+            if args.rate:
+                delay = start + number / args.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(executor.submit(post, number))
+    return [future.result() for future in futures], time.monotonic() - start
+
+def sample(name, labels=None):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+def enqueue_outcomes():
+    return {status: sample("webhook_jobs_total", {"status": status}) for status in ("queued", "duplicate", "failed")}
+
+def wait_for_jobs(accepted, job_state, timeout):
+    """
+    Waits until every accepted webhook has been turned into a job (or a
+    duplicate) and every job has finished. Returns the job state counts.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        outcomes = enqueue_outcomes()
+        counts = job_state.stats()
+        if (sum(outcomes.values()) >= accepted
+                and counts.get("done", 0) + counts.get("dead", 0) >= outcomes["queued"]):
+            return counts
+        time.sleep(0.2)
+    logging.warning(f"Timed out after {timeout:.0f}s with jobs unfinished: {job_state.stats()}")
+    return job_state.stats()
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+def stage_times():
+    times = {}
+    for stage in STAGES:
+        total = count = 0
+        for outcome in ("success", "failure"):
+            labels = {"stage": stage, "outcome": outcome}
+            total += sample("worker_stage_duration_seconds_sum", labels)
+            count += sample("worker_stage_duration_seconds_count", labels)
+        times[stage] = {"runs": int(count), "mean_s": round(total / count, 3) if count else None}
+    return times
+
+def compare(report, baseline, tolerance):
+    """
+    Returns the regressions of report against baseline.
+    """
+    regressions = []
+    for key in ("webhooks_per_second", "jobs_per_hour"):
+        if baseline.get(key) and report[key] < baseline[key] * (1 - tolerance):
+            regressions.append(f"{key} {report[key]} < baseline {baseline[key]}")
+    for key in ("ingest_p50_ms", "ingest_p99_ms"):
+        if baseline.get(key) and report[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {report[key]} > baseline {baseline[key]}")
+    return regressions
+
+def print_report(report):
+    print(f"broker {report['broker']}, webhook mode {report['webhook_mode']}, "
+          f"{report['webhooks']} webhooks over {report['titles']} titles")
+    print(f"  ingest      {report['webhooks_per_second']:>10.1f} webhooks/s   "
+          f"p50 {report['ingest_p50_ms']:.1f} ms   p99 {report['ingest_p99_ms']:.1f} ms   "
+          f"accepted {report['accepted']}")
+    print(f"  enqueue     {report['enqueued']}")
+    print(f"  pipeline    {report['jobs_per_hour']:>10.0f} jobs/hour     "
+          f"{report['jobs']} in {report['pipeline_seconds']:.1f}s")
+    for stage, times in report["stages"].items():
+        mean = f"{times['mean_s']:.3f}s" if times["mean_s"] is not None else "-"
+        print(f"  {stage:<11} {times['runs']:>6} runs   mean {mean}")
+    for service, stats in report["stand_ins"].items():
+        print(f"  {service:<11} " + "   ".join(f"{key} {value}" for key, value in stats.items()))
+
+def main():
+    args = parse_args()
+    # The working directory changes to workdir once flask-app starts
+    args.json = args.json and os.path.abspath(args.json)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="arr-subs-load-"))
+    os.makedirs(workdir, exist_ok=True)
+
+    library = fixtures.build_library(os.path.join(workdir, "movies"), args.titles or args.webhooks,
+                                     args.media_mb, args.media_seconds)
+    services = {service: standins.start_stand_in(service, args, seed=number)
+                for number, service in enumerate(standins.STAND_INS)}
+    for tmdb_id, path in library:
+        services["radarr"].add_movie(tmdb_id, path)
+    configure_environment(args, workdir, services)
+
+    if args.broker == "fake":
+        import fake_broker
+        fake_broker.install(fake_broker.Broker())
+
+    url = start_flask_app(workdir)
+    # flask-app configures INFO logging on import
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger("werkzeug").setLevel(args.log_level)
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(args.log_level)
+    rabbitmq_handler = start_worker()
+
+    load_start = time.monotonic()
+    results, send_seconds = send_webhooks(url, library, args)
+    accepted = sum(1 for status, _ in results if status in (200, 202))
+    latencies = [seconds for status, seconds in results if status in (200, 202)]
+    job_state = rabbitmq_handler.get_job_state()
+    counts = wait_for_jobs(accepted, job_state, args.timeout)
+    pipeline_seconds = time.monotonic() - load_start
+    finished = counts.get("done", 0)
+
+    rabbitmq_handler.shutdown_event.set()
+    report = {
+        "broker": args.broker,
+        "webhook_mode": args.webhook_mode,
+        "webhooks": args.webhooks,
+        "titles": len(library),
+        "accepted": accepted,
+        "webhooks_per_second": round(accepted / send_seconds, 1) if send_seconds else 0.0,
+        "ingest_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "ingest_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "enqueued": {status: int(count) for status, count in enqueue_outcomes().items()},
+        "jobs": counts,
+        "pipeline_seconds": round(pipeline_seconds, 1),
+        "jobs_per_hour": round(finished * 3600 / pipeline_seconds, 1) if pipeline_seconds else 0.0,
+        "stages": stage_times(),
+        "stand_ins": {service: stand_in.stats() for service, stand_in in services.items()}
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmarks the shared streaming SRT module against the code it replaced.
+
+Generates a 10k-cue file and a ~100 MB file, then reports parse and
+clean (parse + rewrite) throughput and peak Python memory for both the
+previous implementations and shared/srt_io.py. Before timing anything it
+runs the round-trip and edge-case checks the parser has to pass.
+
+    python bench/srt_benchmark.py [--large-mb 100] [--workdir /tmp]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import srt_io  # noqa: E402
+
+WORDS = ("the quick brown fox jumps over a lazy dog while someone shouts from the "
+         "other room about dinner and 42 reasons to leave now").split()
+
+# --- Previous implementations, kept verbatim for comparison ---------------
+
+def legacy_read_cues(lines):
+    cues = []
+    number, timestamp, buffer = None, None, []
+    for line in lines + [""]:
+        stripped_line = line.strip()
+        if stripped_line == "":
+            if timestamp is not None:
+                cues.append([number, timestamp, " ".join(buffer)])
+            number, timestamp, buffer = None, None, []
+        elif timestamp is None and "-->" in stripped_line:
+            timestamp = stripped_line
+        elif timestamp is None and stripped_line.isdigit():
+            number = stripped_line
+        else:
+            buffer.append(stripped_line)
+    return cues
+
+def legacy_parse(path):
+    with open(path, "r", encoding="utf-8") as file:
+        lines = file.readlines()
+    return legacy_read_cues(lines)
+
+def legacy_clean_srt(subtitle_path):
+    with open(subtitle_path, 'r', encoding='utf-8') as file:
+        content = file.read().strip()
+    blocks = content.split('\n\n')
+    cleaned_blocks = []
+    subtitle_count = 1
+    timestamp_pattern = re.compile(r'^\d{2}:\d{2}:\d{2},\d{3} --> \d{2}:\d{2}:\d{2},\d{3}$')
+    number_pattern = re.compile(r'^\d+$')
+    for block in blocks:
+        lines = block.split('\n')
+        cleaned_lines = []
+        text_lines = []
+        timestamps = []
+        for line in lines:
+            line = line.strip()
+            if timestamp_pattern.match(line):
+                timestamps.append(line)
+            elif number_pattern.match(line):
+                if not cleaned_lines:
+                    cleaned_lines.append(str(subtitle_count))
+            else:
+                text_lines.append(line)
+        if len(timestamps) >= 2:
+            cleaned_lines.append(timestamps[1])
+        elif timestamps:
+            cleaned_lines.append(timestamps[0])
+        if timestamps and text_lines:
+            cleaned_lines.extend(text_lines)
+            cleaned_blocks.append('\n'.join(cleaned_lines))
+            subtitle_count += 1
+    with open(subtitle_path, 'w', encoding='utf-8') as file:
+        file.write('\n\n'.join(cleaned_blocks))
+        file.write('\n')
+
+# --- New implementation ---------------------------------------------------
+
+def streaming_parse(path):
+    count = 0
+    for _ in srt_io.iter_cues(path):
+        count += 1
+    return count
+
+def streaming_clean(path):
+    srt_io.write_cues(path, (cue for cue in srt_io.iter_cues(path) if cue.lines))
+
+# --- Fixtures and checks --------------------------------------------------
+
+def write_synthetic(path, cues=None, target_bytes=None, seed=1):
+    rng = random.Random(seed)
+    written, number, start = 0, 0, 0
+    with open(path, "w", encoding="utf-8") as file:
+        while (cues is not None and number < cues) or (target_bytes is not None and written < target_bytes):
+            number += 1
+            start += rng.randint(200, 4000)
+            end = start + rng.randint(800, 6000)
+            lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))
+                     for _ in range(rng.randint(1, 2))]
+            block = (f"{number}\n{srt_io.format_timestamp(start)} --> {srt_io.format_timestamp(end)}\n"
+                     + "\n".join(lines) + "\n\n")
+            file.write(block)
+            written += len(block)
+            start = end
+    return number
+
+def check_round_trip(workdir):
+    path = os.path.join(workdir, "roundtrip.srt")
+    write_synthetic(path, cues=2000, seed=7)
+    first = srt_io.read_cues(path)
+    copy = os.path.join(workdir, "roundtrip_copy.srt")
+    srt_io.write_cues(copy, first)
+    assert srt_io.read_cues(copy) == first, "parse/write round trip changed cues"
+    with open(path, "rb") as original, open(copy, "rb") as rewritten:
+        assert original.read() == rewritten.read(), "round trip is not byte-identical"
+
+    cases = {
+        # BOM and CRLF
+        "\ufeff1\r\n00:00:01,000 --> 00:00:02,500\r\nHello\r\n\r\n": [(1000, 2500, ["Hello"])],
+        # All-digit text is text, not a cue number
+        "1\n00:00:01,000 --> 00:00:02,000\n1984\n\n": [(1000, 2000, ["1984"])],
+        # Missing blank line between cues
+        "1\n00:00:01,000 --> 00:00:02,000\nA\n2\n00:00:03,000 --> 00:00:04,000\nB\n":
+            [(1000, 2000, ["A"]), (3000, 4000, ["B"])],
+        # Repeated header (aeneas output of an SRT fed as text): last timing wins
+        "1\n00:00:05,000 --> 00:00:06,000\n1\n00:00:01,000 --> 00:00:02,000\nA\n\n": [(1000, 2000, ["A"])],
+        # Stray lines and a block without timing are skipped
+        "garbage\n\n2\nno timing here\n\n3\n00:00:01.5 --> 00:00:02.25\nB\n": [(1500, 2250, ["B"])],
+    }
+    for text, expected in cases.items():
+        got = [(cue.start, cue.end, cue.lines) for cue in srt_io.parse(text.splitlines(keepends=True))]
+        if text.startswith("\ufeff"):
+            case_path = os.path.join(workdir, "bom.srt")
+            with open(case_path, "w", encoding="utf-8", newline="") as file:
+                file.write(text)
+            got = [(cue.start, cue.end, cue.lines) for cue in srt_io.iter_cues(case_path)]
+        assert got == expected, f"{text!r}: expected {expected}, got {got}"
+    print("round-trip and edge-case checks passed")
+
+def measure(func, path, restore=None):
+    if restore:
+        restore()
+    started = time.perf_counter()
+    func(path)
+    elapsed = time.perf_counter() - started
+    if restore:
+        restore()
+    tracemalloc.start()
+    func(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def run(label, path, cues):
+    size_mb = os.path.getsize(path) / 1e6
+    pristine = path + ".orig"
+    with open(path, "rb") as source, open(pristine, "wb") as target:
+        target.write(source.read())
+
+    def restore():
+        with open(pristine, "rb") as source, open(path, "wb") as target:
+            target.write(source.read())
+
+    print(f"\n{label}: {cues} cues, {size_mb:.1f} MB")
+    print(f"{'operation':<28}{'seconds':>10}{'MB/s':>10}{'kcues/s':>10}{'peak MiB':>10}")
+    for name, func, needs_restore in (
+        ("parse (legacy readlines)", legacy_parse, False),
+        ("parse (srt_io streaming)", streaming_parse, False),
+        ("clean (legacy clean_srt)", legacy_clean_srt, True),
+        ("clean (srt_io streaming)", streaming_clean, True),
+    ):
+        elapsed, peak = measure(func, path, restore if needs_restore else None)
+        print(f"{name:<28}{elapsed:>10.2f}{size_mb / elapsed:>10.1f}{cues / elapsed / 1000:>10.1f}{peak / 2**20:>10.1f}")
+    os.remove(pristine)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--large-mb", type=float, default=100)
+    parser.add_argument("--workdir", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        check_round_trip(workdir)
+        small = os.path.join(workdir, "small.srt")
+        run("10k cues", small, write_synthetic(small, cues=10000))
+        large = os.path.join(workdir, "large.srt")
+        run(f"~{args.large_mb:.0f} MB", large, write_synthetic(large, target_bytes=int(args.large_mb * 1e6)))
+
+if __name__ == "__main__":
+    main()
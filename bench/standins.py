@@ -0,0 +1,379 @@
+"""
+Lightweight local stand-ins for the services the pipeline calls out to.
+
+  whisper    POST /asr             Whisper ASR webservice (SRT or word-timestamp JSON)
+  aeneas     POST /jobs, /sync     aeneas sync service, with admission control
+             GET  /jobs/<id>
+  radarr     GET  /api/v3/movie    Radarr movie lookup and library listing
+  translate  POST /translate       LibreTranslate API (TRANSLATION_BACKEND=libretranslate)
+
+Every stand-in takes a latency (seconds, plus uniform jitter), an error
+rate (fraction of requests answered with a 500) and a concurrency limit
+(requests beyond it queue, like a single GPU). Payload size is set per
+service: cues per Whisper response, movies in the Radarr library, and the
+length factor of translations.
+
+Used in-process by bench/load_test.py, or on their own to point real
+containers at:
+
+    python bench/standins.py --whisper-port 9000 --aeneas-port 5001 \\
+        --radarr-port 7878 --translate-port 5000 --whisper-latency 20
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from srt_io import Cue, format_cue, iter_cues, write_cues  # noqa: E402
+from fixtures import synthetic_cues  # noqa: E402
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        """
+        Reads the request body, plain or chunked (requests streams
+        generator bodies with chunked transfer encoding).
+        """
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(parts)
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send(self, status, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.handle(self, "GET")
+
+    def do_POST(self):
+        self.server.handle(self, "POST")
+
+class StandIn(ThreadingHTTPServer):
+    """
+    Base stand-in: routes requests to handle_<method>() after applying
+    the configured concurrency limit, latency and error rate.
+    """
+
+    daemon_threads = True
+    name = "stand-in"
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, concurrency=0, seed=None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name=self.name, daemon=True).start()
+        return self
+
+    def delay(self):
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def fails(self):
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.requests += 1
+            self.errors += failed
+        return failed
+
+    def handle(self, request, method):
+        try:
+            if self._slots:
+                self._slots.acquire()
+            try:
+                self.respond(request, method)
+            finally:
+                if self._slots:
+                    self._slots.release()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def respond(self, request, method):
+        raise NotImplementedError
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors}
+
+class WhisperStandIn(StandIn):
+    """
+    Reads the whole upload, waits, then answers with `cues` synthetic cues
+    as SRT, or as word-timestamp JSON when output=json.
+    """
+
+    name = "whisper-standin"
+
+    def __init__(self, cues=600, **kwargs):
+        super().__init__(**kwargs)
+        self.cues = cues
+        self.bytes_received = 0
+
+    def respond(self, request, method):
+        if method != "POST" or not request.path.startswith("/asr"):
+            return request.send(404, {"error": "not found"})
+        uploaded = len(request.read_body())
+        with self._lock:
+            self.bytes_received += uploaded
+        time.sleep(self.delay())
+        if self.fails():
+            return request.send(500, {"error": "stand-in failure"})
+
+        params = parse_qs(urlparse(request.path).query)
+        # A different transcript per request, so translation memory hits
+        # only what a real library would repeat
+        cues = synthetic_cues(self.cues, seed=self.requests)
+        if params.get("output", ["srt"])[0] == "json":
+            segments = []
+            for cue in cues:
+                words = cue.text.split()
+                step = (cue.end - cue.start) / len(words)
+                segments.append({
+                    "start": cue.start / 1000, "end": cue.end / 1000, "text": cue.text,
+                    "words": [{"word": f" {word}", "start": (cue.start + i * step) / 1000,
+                               "end": (cue.start + (i + 1) * step) / 1000} for i, word in enumerate(words)]
+                })
+            return request.send(200, {"text": " ".join(cue.text for cue in cues), "segments": segments})
+        srt = "".join(format_cue(cue, number) for number, cue in enumerate(cues, 1))
+        request.send(200, srt, content_type="text/plain; charset=utf-8")
+
+    def stats(self):
+        return {**super().stats(), "bytes_received": self.bytes_received}
+
+class AeneasStandIn(StandIn):
+    """
+    Accepts up to max_pending jobs (429 with Retry-After beyond that), runs
+    each for the configured latency and "aligns" the SRT in place by
+    nudging every cue by a few milliseconds.
+    """
+
+    name = "aeneas-standin"
+
+    def __init__(self, max_pending=8, **kwargs):
+        super().__init__(**kwargs)
+        self.max_pending = max_pending
+        self.rejected = 0
+        self._jobs = {}
+        self._active = 0
+
+    def respond(self, request, method):
+        path = urlparse(request.path).path
+        if method == "GET" and path.startswith("/jobs/"):
+            job = self._jobs.get(path[len("/jobs/"):])
+            return request.send(200, job) if job else request.send(404, {"error": "Unknown job"})
+        if method != "POST" or path not in ("/jobs", "/sync"):
+            return request.send(404, {"error": "not found"})
+
+        data = json.loads(request.read_body() or b"{}")
+        with self._lock:
+            if self._active >= self.max_pending:
+                self.rejected += 1
+                retry_after = max(1, int(round(self.latency)))
+                return request.send(429, {"error": "Sync queue is full", "retry_after": retry_after},
+                                    headers={"Retry-After": str(retry_after)})
+            self._active += 1
+        job = {"job_id": str(uuid.uuid4()), "status": "queued", "synced_srt": None, "error": None}
+        self._jobs[job["job_id"]] = job
+        thread = threading.Thread(target=self._run, args=(job, data["srt_path"]), daemon=True)
+        thread.start()
+        if path == "/sync":
+            thread.join()
+            if job["status"] != "done":
+                return request.send(500, {"error": job["error"]})
+            return request.send(200, {"synced_srt": job["synced_srt"]})
+        request.send(202, job, headers={"Location": f"/jobs/{job['job_id']}"})
+
+    def _run(self, job, srt_path):
+        job["status"] = "running"
+        try:
+            time.sleep(self.delay())
+            if self.fails():
+                raise RuntimeError("stand-in failure")
+            cues = [Cue(cue.start + 40, cue.end + 40, cue.lines) for cue in iter_cues(srt_path) if cue.lines]
+            write_cues(srt_path, cues)
+            job["synced_srt"] = srt_path
+            job["status"] = "done"
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def stats(self):
+        return {**super().stats(), "rejected": self.rejected}
+
+class RadarrStandIn(StandIn):
+    """
+    Serves movies registered with add_movie(), padded with `library_size`
+    filler movies in the full-library listing that prefetch reads.
+    """
+
+    name = "radarr-standin"
+
+    def __init__(self, library_size=0, **kwargs):
+        super().__init__(**kwargs)
+        self.movies = {}
+        self.filler = [self._movie(1_000_000 + i, f"/filler/movie-{i}.mkv") for i in range(library_size)]
+
+    @staticmethod
+    def _movie(tmdb_id, path, size=0):
+        return {
+            "tmdbId": tmdb_id,
+            "title": f"Movie {tmdb_id}",
+            "movieFile": {
+                "id": tmdb_id, "path": path, "relativePath": os.path.basename(path), "size": size,
+                "languages": [{"id": 1, "name": "English"}]
+            }
+        }
+
+    def add_movie(self, tmdb_id, path):
+        self.movies[tmdb_id] = self._movie(tmdb_id, path, os.path.getsize(path))
+
+    def respond(self, request, method):
+        url = urlparse(request.path)
+        if method != "GET" or not url.path.startswith("/api/v3/movie"):
+            return request.send(404, {"error": "not found"})
+        time.sleep(self.delay())
+        if self.fails():
+            return request.send(500, {"error": "stand-in failure"})
+        tmdb_id = parse_qs(url.query).get("tmdbId", [None])[0]
+        if tmdb_id is None:
+            return request.send(200, list(self.movies.values()) + self.filler)
+        movie = self.movies.get(int(tmdb_id))
+        request.send(200, [movie] if movie else [])
+
+class TranslateStandIn(StandIn):
+    """
+    LibreTranslate-compatible /translate. Each line comes back prefixed
+    with the target language and repeated `length_factor` times (rounded
+    down, at least once), so batch delimiters on their own lines survive.
+    """
+
+    name = "translate-standin"
+
+    def __init__(self, length_factor=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.length_factor = length_factor
+        self.characters = 0
+
+    def _translate(self, text, target):
+        repeat = max(1, int(self.length_factor))
+        return "\n".join(
+            line if not line.strip() or re.fullmatch(r"\s*#\s*#\s*#\s*", line)
+            else " ".join([f"[{target}] {line}"] * repeat)
+            for line in text.split("\n")
+        )
+
+    def respond(self, request, method):
+        if method != "POST" or not request.path.startswith("/translate"):
+            return request.send(404, {"error": "not found"})
+        data = json.loads(request.read_body() or b"{}")
+        time.sleep(self.delay())
+        if self.fails():
+            return request.send(500, {"error": "stand-in failure"})
+        texts = data.get("q", "")
+        with self._lock:
+            self.characters += sum(map(len, texts)) if isinstance(texts, list) else len(texts)
+        if isinstance(texts, list):
+            translated = [self._translate(text, data.get("target", "xx")) for text in texts]
+        else:
+            translated = self._translate(texts, data.get("target", "xx"))
+        request.send(200, {"translatedText": translated})
+
+    def stats(self):
+        return {**super().stats(), "characters": self.characters}
+
+STAND_INS = {
+    "whisper": (WhisperStandIn, {"cues": 600}),
+    "aeneas": (AeneasStandIn, {"max_pending": 8}),
+    "radarr": (RadarrStandIn, {"library_size": 0}),
+    "translate": (TranslateStandIn, {"length_factor": 1.0}),
+}
+
+def add_arguments(parser):
+    """
+    Adds --<service>-latency/-jitter/-error-rate/-concurrency and the
+    payload options of every stand-in to parser.
+    """
+    for service, (_, payload) in STAND_INS.items():
+        group = parser.add_argument_group(f"{service} stand-in")
+        group.add_argument(f"--{service}-latency", type=float, default=0.0)
+        group.add_argument(f"--{service}-jitter", type=float, default=0.0)
+        group.add_argument(f"--{service}-error-rate", type=float, default=0.0)
+        group.add_argument(f"--{service}-concurrency", type=int, default=0)
+        for option, default in payload.items():
+            group.add_argument(f"--{service}-{option.replace('_', '-')}", type=type(default), default=default)
+
+def start_stand_in(service, args, port=0, seed=None):
+    cls, payload = STAND_INS[service]
+    options = {option: getattr(args, f"{service}_{option}") for option in payload}
+    return cls(
+        port=port, seed=seed,
+        latency=getattr(args, f"{service}_latency"),
+        jitter=getattr(args, f"{service}_jitter"),
+        error_rate=getattr(args, f"{service}_error_rate"),
+        concurrency=getattr(args, f"{service}_concurrency"),
+        **options
+    ).start()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for service in STAND_INS:
+        parser.add_argument(f"--{service}-port", type=int, help=f"Serve the {service} stand-in on this port")
+    add_arguments(parser)
+    args = parser.parse_args()
+    started = [start_stand_in(service, args, port) for service in STAND_INS
+               if (port := getattr(args, f"{service}_port"))]
+    if not started:
+        parser.error("no --<service>-port given")
+    for stand_in in started:
+        print(f"{stand_in.name} listening on {stand_in.url}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmarks aeneas/timing.py's vectorized cue timing normalization against
+an equivalent per-cue Python loop, and checks both produce the same timings.
+
+    python bench/timing_benchmark.py [--cues 10000] [--repeat 20]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [os.path.join(ROOT, "shared"), os.path.join(ROOT, "aeneas")]
+import timing  # noqa: E402
+
+def normalize_loop(starts, ends, char_counts, params):
+    """
+    The same rules as timing.normalize, one cue at a time.
+    """
+    scale = 1.0 + params["drift_ppm"] / 1e6
+    count = len(starts)
+    new_starts, new_ends = [0.0] * count, [0.0] * count
+    previous = 0.0
+    for i in range(count):
+        start = max(starts[i] * scale + params["offset_ms"], 0.0, previous)
+        end = max(ends[i] * scale + params["offset_ms"], 0.0, start)
+        needed = max(params["min_duration_ms"], char_counts[i] * 1000.0 / params["max_cps"])
+        end = min(max(end, start + needed), start + params["max_duration_ms"])
+        new_starts[i], new_ends[i] = start, end
+        previous = start
+    for i in range(count - 1):
+        next_start = new_starts[i + 1]
+        floor = min(new_starts[i] + params["min_duration_ms"], next_start)
+        new_ends[i] = max(min(new_ends[i], next_start - params["min_gap_ms"]), floor)
+    return [int(round(value)) for value in new_starts], [int(round(value)) for value in new_ends]
+
+def synthetic_alignment(cues, seed=3):
+    """
+    Aligner-like timings: mostly sensible, with overlaps, 40 ms flashes,
+    over-long cues and fast reading speeds mixed in.
+    """
+    rng = random.Random(seed)
+    starts, ends, chars = [], [], []
+    position = 0
+    for _ in range(cues):
+        position += rng.randint(-300, 3000)
+        position = max(position, 0)
+        kind = rng.random()
+        if kind < 0.1:
+            duration = 40
+        elif kind < 0.15:
+            duration = rng.randint(9000, 20000)
+        else:
+            duration = rng.randint(600, 5000)
+        starts.append(position)
+        ends.append(position + duration)
+        chars.append(rng.randint(5, 90))
+    return starts, ends, chars
+
+def best_of(repeat, func, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cues", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    params = timing.timing_params({"offset_ms": 120, "drift_ppm": 15})
+    print(f"{'cues':>8}{'loop ms':>12}{'numpy ms':>12}{'speedup':>10}")
+    for count in args.cues:
+        starts, ends, chars = synthetic_alignment(count)
+        loop_time, expected = best_of(args.repeat, normalize_loop, starts, ends, chars, params)
+        numpy_time, result = best_of(args.repeat, timing.normalize, starts, ends, chars, params)
+        assert result[0].tolist() == expected[0] and result[1].tolist() == expected[1], "implementations disagree"
+        print(f"{count:>8}{loop_time * 1000:>12.2f}{numpy_time * 1000:>12.2f}{loop_time / numpy_time:>10.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
 import os
-import pika
 import uuid
 import time
+import threading
+from collections import deque
 import requests
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 import logging
 import traceback
-import json
-from radarr import get_movie_details
+from radarr import RadarrClient
 from sonarr import process_sonarr_webhook
-from languages import LANGUAGE_CODES
+from dedup import JobIndex, dedup_key
+from publisher import JobPublisher, Spool
+from scheduling import schedule_job, MEDIA_JOBS_QUEUE_ARGUMENTS
+from enrichment import EnrichmentConsumer, build_radarr_job, WEBHOOK_EVENTS_QUEUE
+from metrics import WEBHOOK_LATENCY, JOBS_ENQUEUED
+import tracing
 from logging.handlers import RotatingFileHandler
 
 # Set up structured logging
@@ -39,114 +45,212 @@ def validate_environment():
     if missing:
         raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
 
-def connect_rabbitmq_with_retry(host, max_retries=5, delay=5):
-    for attempt in range(max_retries):
-        try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=host,
-                    heartbeat=600,
-                    blocked_connection_timeout=300
-                )
-            )
-            channel = connection.channel()
-            # Declare the queue once at startup
-            channel.queue_declare(queue="media_jobs", durable=True)
-            return connection, channel
-        except pika.exceptions.AMQPConnectionError as e:
-            if attempt == max_retries - 1:
-                raise
-            logging.warning(f"Failed to connect to RabbitMQ (attempt {attempt + 1}/{max_retries}). Retrying in {delay} seconds...")
-            time.sleep(delay)
-
 app = Flask(__name__)
 
 # Environment variables
 RADARR_API_KEY = os.getenv("RADARR_API_KEY")
 RADARR_API_URL = os.getenv("RADARR_API_URL", "http://localhost:7878/api/v3/movie")
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+# "fast" acknowledges Radarr webhooks immediately and resolves the movie in
+# the background; "sync" looks the movie up before answering.
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "fast")
+WEBHOOK_EVENTS_SPOOL_PATH = os.getenv("WEBHOOK_EVENTS_SPOOL_PATH", "/mediacenter/.arr-subs/webhook_events_spool.db")
+
+class LatencyTracker:
+    """
+    Keeps the most recent webhook latencies per mode for percentile reporting.
+    """
+
+    def __init__(self, size=1000):
+        self._samples = {}
+        self._size = size
+        self._lock = threading.Lock()
+
+    def record(self, mode, seconds):
+        with self._lock:
+            self._samples.setdefault(mode, deque(maxlen=self._size)).append(seconds)
+
+    def percentiles(self):
+        with self._lock:
+            result = {}
+            for mode, samples in self._samples.items():
+                ordered = sorted(samples)
+                result[mode] = {
+                    "count": len(ordered),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                    "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2)
+                }
+            return result
 
-# Global RabbitMQ connection and channel
-rabbitmq_connection = None
-rabbitmq_channel = None
+# Background RabbitMQ publisher shared by all request threads
+publisher = None
+
+# Persistent index of queued jobs used to suppress duplicate webhooks
+job_index = None
+
+# Pooled, caching Radarr client
+radarr_client = None
+
+# Raw webhook events waiting for background enrichment (fast mode)
+event_publisher = None
+webhook_latency = LatencyTracker()
 
 # Initialize the application
 def init_app(app):
-    global rabbitmq_connection, rabbitmq_channel
+    global publisher, job_index, radarr_client, event_publisher
     setup_logging()
     validate_environment()
-    rabbitmq_connection, rabbitmq_channel = connect_rabbitmq_with_retry(RABBITMQ_HOST)
-
-# Call initialization
-init_app(app)
-
-@app.teardown_appcontext
-def shutdown(exception=None):
-    global rabbitmq_connection
-    if rabbitmq_connection and not rabbitmq_connection.is_closed:
-        rabbitmq_connection.close()
+    job_index = JobIndex()
+    radarr_client = RadarrClient(RADARR_API_URL, RADARR_API_KEY)
+    # Warm the movie cache without delaying startup, and keep it warm
+    threading.Thread(target=radarr_client.prefetch_periodically, name="radarr-prefetch", daemon=True).start()
+    publisher = JobPublisher(RABBITMQ_HOST, queue_arguments=MEDIA_JOBS_QUEUE_ARGUMENTS)
+    publisher.start()
+    if WEBHOOK_MODE == "fast":
+        event_publisher = JobPublisher(RABBITMQ_HOST, WEBHOOK_EVENTS_QUEUE, Spool(WEBHOOK_EVENTS_SPOOL_PATH))
+        event_publisher.start()
+        EnrichmentConsumer(RABBITMQ_HOST, radarr_client, enqueue_job).start()
 
 def publish_to_queue(job):
-    global rabbitmq_connection, rabbitmq_channel
-    
     try:
-        if not rabbitmq_connection or rabbitmq_connection.is_closed:
-            rabbitmq_connection, rabbitmq_channel = connect_rabbitmq_with_retry(RABBITMQ_HOST)
-        
-        rabbitmq_channel.basic_publish(
-            exchange="",
-            routing_key="media_jobs",
-            body=json.dumps(job),
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # Make message persistent
-                correlation_id=str(uuid.uuid4())
-            )
-        )
-        logging.info(f"Job {job['job_id']} added to the queue")
+        if not publisher.publish(job):
+            return False
+        logging.info(f"Job {job['job_id']} handed to the publisher")
         return True
     except Exception as e:
         logging.error(f"Failed to publish job to RabbitMQ: {e}")
         logging.error(f"Traceback: {traceback.format_exc()}")
         return False
 
+def enqueue_job(job):
+    """
+    Publish a job unless an equivalent one is already queued.
+
+    Returns:
+        str: "queued", "duplicate:<existing job id>" or "failed"
+    """
+    # Suppress repeated webhooks for the same file and target language,
+    # unless the sender asked for a forced re-run
+    key = dedup_key(job)
+    existing_job_id = job_index.claim(key, job["job_id"], job["file_path"])
+    if existing_job_id and not job.get("force"):
+        logging.info(f"[{job['request_id']}] Duplicate of job {existing_job_id}, not queueing")
+        JOBS_ENQUEUED.labels("duplicate").inc()
+        return f"duplicate:{existing_job_id}"
+
+    # Urgent jobs jump the transcription queue
+    schedule_job(job)
+    logging.info(f"[{job['request_id']}] Job {job['job_id']} priority {job['priority']}")
+
+    # Publish job to RabbitMQ
+    if publish_to_queue(job):
+        JOBS_ENQUEUED.labels("queued").inc()
+        return "queued"
+    # A forced re-run never took the claim; it still belongs to the original job
+    if existing_job_id is None:
+        job_index.release(key)
+    JOBS_ENQUEUED.labels("failed").inc()
+    return "failed"
+
+def queued_duplicate(data):
+    """
+    The job already queued for a Radarr webhook's movie file, found before
+    Radarr is asked anything.
+
+    The key is built from the payload's movieFile path exactly as enqueue_job
+    will build it from the resolved job, so a hit is the job the enrichment
+    stage would report as the duplicate.
+
+    Returns:
+        Optional[str]: The existing job id, None if there is none or the
+        payload does not say which file it is about
+    """
+    if data.get("force"):
+        return None
+    movie_file = data.get("movieFile") or {}
+    file_path = movie_file.get("path")
+    if not file_path and movie_file.get("relativePath") and data["movie"].get("folderPath"):
+        file_path = os.path.join(data["movie"]["folderPath"], movie_file["relativePath"])
+    if not file_path:
+        return None
+    key = dedup_key({"file_path": file_path, "target_language": data.get("target_language", "eng")})
+    return job_index.lookup(key, suppress=True)
+
+def duplicate_response(existing_job_id, request_id):
+    return jsonify({
+        "message": f"Duplicate of job {existing_job_id}",
+        "job_id": existing_job_id,
+        "request_id": request_id
+    }), 200
+
+# Call initialization, once enqueue_job exists for the enrichment consumer
+init_app(app)
+
+def webhook_source(data):
+    if isinstance(data, dict):
+        if "movie" in data:
+            return "radarr"
+        if "series" in data:
+            return "sonarr"
+    return "unknown"
+
 @app.route("/webhook", methods=["POST"])
 def webhook():
+    start_time = time.monotonic()
+    mode = WEBHOOK_MODE
     request_id = str(uuid.uuid4())
-    logging.info(f"Processing webhook request {request_id}")
-    
+    # The webhook starts the job's trace unless the caller sent one
+    with tracing.span("webhook", parent=request.headers.get(tracing.TRACEPARENT_HEADER), kind="server",
+                      request_id=request_id, mode=mode) as span:
+        logging.info(f"Processing webhook request {request_id} (trace {span.trace_id})")
+        response, status = handle_webhook(request_id, mode)
+        source = webhook_source(request.get_json(silent=True))
+        span.set_attribute("source", source)
+        span.set_attribute("http.status_code", status)
+    elapsed = time.monotonic() - start_time
+    webhook_latency.record(mode, elapsed)
+    WEBHOOK_LATENCY.labels(mode, source, str(status)).observe(elapsed)
+    return response, status
+
+def handle_webhook(request_id, mode):
     try:
         data = request.get_json()
         if not data:
             return jsonify({"message": "Invalid JSON payload"}), 400
-            
+
         job = {}
 
         # Radarr webhook processing
         if "movie" in data:
             logging.info(f"[{request_id}] Radarr webhook detected")
             tmdb_id = data["movie"].get("tmdbId")
-            
+
             if not tmdb_id or tmdb_id == 0:
                 return jsonify({"message": "Invalid or missing tmdbId"}), 400
-            
-            movie_details = get_movie_details(tmdb_id, RADARR_API_URL, RADARR_API_KEY)
-            
-            if not movie_details:
-                return jsonify({"message": f"Failed to fetch movie details for tmdbId {tmdb_id}"}), 500
 
-            movie_path = movie_details[0]["movieFile"]["path"]
-            audio_languages = movie_details[0]["movieFile"].get("languages", [])
-            language_codes = [LANGUAGE_CODES.get(lang["name"], "eng") for lang in audio_languages]
-            
-            job = {
-                "type": "radarr",
-                "job_id": str(uuid.uuid4()),
-                "file_path": movie_path,
-                "source_language": language_codes[0] if language_codes else "eng",
-                "target_language": data.get("target_language", "eng"),
-                "languages": language_codes,
-                "request_id": request_id
-            }
+            job_id = str(uuid.uuid4())
+            if mode == "fast":
+                existing_job_id = queued_duplicate(data)
+                if existing_job_id:
+                    logging.info(f"[{request_id}] Duplicate of job {existing_job_id}, not queueing")
+                    JOBS_ENQUEUED.labels("duplicate").inc()
+                    return duplicate_response(existing_job_id, request_id)
+                # Hand the raw payload to the enrichment stage and answer at
+                # once. The job_id is provisional: if the file turns out to be
+                # queued already (no path in the payload, or a concurrent
+                # webhook), enrichment drops the event and this id never runs.
+                event = {"job_id": job_id, "request_id": request_id, "payload": data}
+                if not event_publisher.publish(event):
+                    return jsonify({"message": "Failed to queue job"}), 500
+                return jsonify({
+                    "message": f"Job {job_id} accepted for enrichment",
+                    "job_id": job_id,
+                    "request_id": request_id
+                }), 202
+
+            job = build_radarr_job(data, request_id, job_id, radarr_client)
+            if not job:
+                return jsonify({"message": f"Failed to fetch movie details for tmdbId {tmdb_id}"}), 500
 
         # Sonarr webhook processing
         elif "series" in data:
@@ -158,10 +262,13 @@ def webhook():
         else:
             return jsonify({"message": "Invalid webhook payload type"}), 400
 
-        # Publish job to RabbitMQ
-        if publish_to_queue(job):
+        status = enqueue_job(job)
+        if status.startswith("duplicate:"):
+            return duplicate_response(status.split(":", 1)[1], request_id)
+        elif status == "queued":
             return jsonify({
                 "message": f"Job {job['job_id']} added to the queue",
+                "job_id": job["job_id"],
                 "request_id": request_id
             }), 202
         else:
@@ -172,6 +279,20 @@ def webhook():
         logging.error(f"[{request_id}] Traceback: {traceback.format_exc()}")
         return jsonify({"message": "Internal server error", "request_id": request_id}), 500
 
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "dedup": job_index.stats(),
+        "radarr_cache": radarr_client.stats(),
+        "publisher": publisher.stats(),
+        "webhook_events": event_publisher.stats() if event_publisher else None,
+        "webhook_latency": webhook_latency.percentiles()
+    }), 200
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     debug_mode = os.getenv("FLASK_DEBUG", "false").lower() == "true"
-    app.run(host="0.0.0.0", port=8000, debug=debug_mode)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=8000, debug=debug_mode, threaded=True)
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""
+Backfill subtitles for media that is already in the library.
+
+Finds media files without a `<name>.<target_language>.srt` sidecar, either by
+walking the media directory or by listing the Radarr library, and publishes
+jobs to media_jobs in transactional batches over a single channel.
+
+Jobs are claimed in the webhook dedup index once their batch is committed,
+so an interrupted run can be restarted and will skip anything it already
+queued. A kill between a commit and its claims re-queues at most that one
+batch, which the worker then finds up to date.
+
+The target language defaults to DEFAULT_TARGET_LANGUAGE, which must match
+the worker's setting (docker-compose.yaml sets both).
+
+Usage:
+    python backfill.py [--source filesystem|radarr] [--root /mediacenter]
+                       [--batch-size 50] [--rate 5] [--max-queue-depth 100]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+from typing import Iterator, Dict, Any, List
+import pika
+from dedup import JobIndex, dedup_key
+from languages import LANGUAGE_CODES
+from radarr import RadarrClient
+from scheduling import schedule_job, MEDIA_JOBS_QUEUE_ARGUMENTS
+
+MEDIA_EXTENSIONS = (".mkv", ".mp4", ".avi", ".m4v", ".mov", ".ts")
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+TARGET_LANGUAGE = os.getenv("DEFAULT_TARGET_LANGUAGE", "eng")
+SOURCE_LANGUAGE = os.getenv("BACKFILL_SOURCE_LANGUAGE", "eng")
+
+def walk_media(root: str) -> Iterator[str]:
+    """
+    Yield media file paths under root, skipping hidden directories.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            logging.warning(f"Cannot scan {directory}: {e}")
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.name.lower().endswith(MEDIA_EXTENSIONS):
+                yield entry.path
+
+def has_subtitle(file_path: str, target_language: str) -> bool:
+    return os.path.exists(f"{os.path.splitext(file_path)[0]}.{target_language}.srt")
+
+def filesystem_jobs(root: str) -> Iterator[Dict[str, Any]]:
+    for file_path in walk_media(root):
+        yield {"file_path": file_path, "source_language": SOURCE_LANGUAGE, "languages": []}
+
+def radarr_jobs() -> Iterator[Dict[str, Any]]:
+    client = RadarrClient(os.environ["RADARR_API_URL"], os.environ["RADARR_API_KEY"])
+    response = client.session.get(f"{client.radarr_api_url}?excludeLocalCovers=true", timeout=(5, 300))
+    response.raise_for_status()
+    for movie in response.json():
+        movie_file = movie.get("movieFile")
+        if not movie_file or not movie_file.get("path"):
+            continue
+        language_codes = [LANGUAGE_CODES.get(lang["name"], "eng") for lang in movie_file.get("languages", [])]
+        yield {
+            "file_path": movie_file["path"],
+            "source_language": language_codes[0] if language_codes else SOURCE_LANGUAGE,
+            "languages": language_codes
+        }
+
+def connect(host: str):
+    connection = pika.BlockingConnection(
+        pika.ConnectionParameters(host=host, heartbeat=600, blocked_connection_timeout=300)
+    )
+    channel = connection.channel()
+    channel.queue_declare(queue="media_jobs", durable=True, arguments=MEDIA_JOBS_QUEUE_ARGUMENTS)
+    # Each batch is committed as one transaction: the broker confirms the
+    # whole batch at once instead of one round trip per message.
+    channel.tx_select()
+    return connection, channel
+
+def queue_depth(channel) -> int:
+    return channel.queue_declare(queue="media_jobs", passive=True).method.message_count
+
+def publish_batch(channel, batch: List[Dict[str, Any]]) -> None:
+    for job in batch:
+        channel.basic_publish(
+            exchange="",
+            routing_key="media_jobs",
+            body=json.dumps(job),
+            properties=pika.BasicProperties(
+                delivery_mode=2, correlation_id=str(uuid.uuid4()), priority=job["priority"]
+            )
+        )
+    channel.tx_commit()
+
+class Backfill:
+    def __init__(self, channel, connection, job_index: JobIndex, batch_size: int, rate: float, max_queue_depth: int):
+        self.channel = channel
+        self.connection = connection
+        self.job_index = job_index
+        self.batch_size = batch_size
+        self.rate = rate
+        self.max_queue_depth = max_queue_depth
+        self.request_id = str(uuid.uuid4())
+        self.scanned = 0
+        self.enqueued = 0
+        self.skipped = 0
+        self.started_at = time.monotonic()
+        self._batch: List[Dict[str, Any]] = []
+        self._keys: List[str] = []
+
+    def report(self) -> None:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        logging.info(
+            f"Backfill: scanned {self.scanned} files ({self.scanned / elapsed:.1f} files/s), "
+            f"enqueued {self.enqueued} jobs ({self.enqueued / elapsed:.2f} jobs/s), "
+            f"skipped {self.skipped}"
+        )
+
+    def _wait_for_capacity(self) -> None:
+        # Keep the GPU queue short and the overall publish rate bounded
+        if self.rate > 0:
+            earliest = self.started_at + (self.enqueued + len(self._batch)) / self.rate
+            delay = earliest - time.monotonic()
+            if delay > 0:
+                self.connection.sleep(delay)
+        while self.max_queue_depth > 0 and queue_depth(self.channel) >= self.max_queue_depth:
+            logging.info(f"media_jobs is at {self.max_queue_depth} messages, waiting...")
+            self.connection.sleep(30)
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+        self._wait_for_capacity()
+        publish_batch(self.channel, self._batch)
+        # Claim only what the broker has committed, so a killed run leaves
+        # no claims for jobs that were never queued
+        raced = sum(1 for job, key in zip(self._batch, self._keys)
+                    if self.job_index.claim(key, job["job_id"], job["file_path"]))
+        if raced:
+            logging.info(f"Backfill: {raced} jobs in this batch were also queued by a webhook meanwhile")
+        self.enqueued += len(self._batch)
+        self._batch, self._keys = [], []
+        self.report()
+
+    def add(self, candidate: Dict[str, Any], target_language: str) -> None:
+        self.scanned += 1
+        if has_subtitle(candidate["file_path"], target_language):
+            self.skipped += 1
+            return
+        job = {
+            "type": "backfill",
+            "job_id": str(uuid.uuid4()),
+            "target_language": target_language,
+            "request_id": self.request_id,
+            **candidate
+        }
+        key = dedup_key(job)
+        if key in self._keys or self.job_index.lookup(key):
+            self.skipped += 1
+            return
+        self._batch.append(schedule_job(job))
+        self._keys.append(key)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Queue subtitle jobs for media that has none")
+    parser.add_argument("--source", choices=["filesystem", "radarr"], default="filesystem")
+    parser.add_argument("--root", default="/mediacenter")
+    parser.add_argument("--target-language", default=TARGET_LANGUAGE)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=5.0, help="Maximum jobs per second (0 = unbounded)")
+    parser.add_argument("--max-queue-depth", type=int, default=100, help="Pause while media_jobs holds this many messages (0 = never)")
+    return parser.parse_args(argv)
+
+def main(argv: List[str]) -> None:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+
+    if args.source == "radarr":
+        candidates = radarr_jobs()
+    else:
+        candidates = filesystem_jobs(args.root)
+
+    connection, channel = connect(RABBITMQ_HOST)
+    backfill = Backfill(channel, connection, JobIndex(), args.batch_size, args.rate, args.max_queue_depth)
+    try:
+        for candidate in candidates:
+            backfill.add(candidate, args.target_language)
+        backfill.flush()
+    finally:
+        backfill.report()
+        if not connection.is_closed:
+            connection.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
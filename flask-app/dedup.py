@@ -0,0 +1,150 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any
+
+DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH", "/mediacenter/.arr-subs/job_index.db")
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", str(7 * 86400)))
+# The worker's job state store, on the shared volume; claims of jobs it
+# marked dead no longer suppress new webhooks
+JOB_STATE_PATH = os.getenv("JOB_STATE_PATH", "/mediacenter/.arr-subs/job_state.db")
+
+def dedup_key(job: Dict[str, Any]) -> str:
+    """
+    Build a content key from the media file path, size, mtime and target language.
+
+    Args:
+        job: The job about to be queued
+
+    Returns:
+        str: Hex digest identifying the work the job would do
+    """
+    file_path = job["file_path"]
+    try:
+        stat = os.stat(file_path)
+        fingerprint = f"{stat.st_size}|{stat.st_mtime_ns}"
+    except OSError:
+        # The file may not be visible to this container yet; fall back to the path
+        fingerprint = "unknown"
+    raw = f"{file_path}|{fingerprint}|{job.get('target_language', '')}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class JobIndex:
+    """
+    Small persistent index of queued jobs by content key, with a TTL.
+
+    A claim suppresses duplicates while its job is in flight or completed.
+    Once the worker gives up on the job (status "dead" in its job state
+    store) the claim is void and the next webhook for the file queues again.
+    """
+
+    def __init__(self, path: str = DEDUP_DB_PATH, ttl: int = DEDUP_TTL, job_state_path: str = JOB_STATE_PATH):
+        self.ttl = ttl
+        self.job_state_path = job_state_path
+        self._job_state = None
+        self.suppressed = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                dedup_key TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        self._db.commit()
+        row = self._db.execute("SELECT value FROM counters WHERE name = 'suppressed'").fetchone()
+        self.suppressed = row[0] if row else 0
+
+    def _is_dead(self, job_id: str) -> bool:
+        """
+        Whether the worker dead-lettered job_id. False if its job state
+        store is not readable (yet).
+        """
+        if self._job_state is None:
+            if not os.path.exists(self.job_state_path):
+                return False
+            try:
+                self._job_state = sqlite3.connect(f"file:{self.job_state_path}?mode=ro", uri=True,
+                                                  check_same_thread=False)
+            except sqlite3.Error:
+                return False
+        try:
+            row = self._job_state.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        except sqlite3.Error:
+            return False
+        return bool(row) and row[0] == "dead"
+
+    def _live_claim(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT job_id FROM jobs WHERE dedup_key = ?", (key,)).fetchone()
+        if row and not self._is_dead(row[0]):
+            return row[0]
+        return None
+
+    def _count_suppressed(self) -> None:
+        self.suppressed += 1
+        self._db.execute(
+            "INSERT OR REPLACE INTO counters (name, value) VALUES ('suppressed', ?)",
+            (self.suppressed,)
+        )
+
+    def lookup(self, key: str, suppress: bool = False) -> Optional[str]:
+        """
+        Returns the job_id holding a live claim on key, without claiming it.
+        With suppress, a hit counts as a suppressed duplicate.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE created_at < ?", (time.time() - self.ttl,))
+            existing_job_id = self._live_claim(key)
+            if existing_job_id and suppress:
+                self._count_suppressed()
+            self._db.commit()
+            return existing_job_id
+
+    def claim(self, key: str, job_id: str, file_path: str) -> Optional[str]:
+        """
+        Record job_id under key unless a live entry already exists.
+
+        Returns:
+            Optional[str]: The existing job_id if this is a duplicate, None if claimed
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE created_at < ?", (now - self.ttl,))
+            existing_job_id = self._live_claim(key)
+            if existing_job_id:
+                self._count_suppressed()
+                self._db.commit()
+                return existing_job_id
+            # Replaces the claim of a dead job
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (dedup_key, job_id, file_path, created_at) VALUES (?, ?, ?, ?)",
+                (key, job_id, file_path, now)
+            )
+            self._db.commit()
+            return None
+
+    def release(self, key: str) -> None:
+        """
+        Forget a claim, e.g. when the job could not be queued after all.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE dedup_key = ?", (key,))
+            self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            tracked = self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        return {"tracked_jobs": tracked, "suppressed_duplicates": self.suppressed}
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import logging
+import threading
+import traceback
+from typing import Optional, Dict, Any, Callable
+import pika
+from languages import LANGUAGE_CODES
+from metrics import EVENTS_DEAD_LETTERED
+from radarr import RadarrClient
+from tracing import span, current_traceparent, TRACEPARENT_HEADER
+
+WEBHOOK_EVENTS_QUEUE = "webhook_events"
+# Retried events wait out their per-message expiration here and are then
+# dead-lettered back onto WEBHOOK_EVENTS_QUEUE
+WEBHOOK_EVENTS_RETRY_QUEUE = f"{WEBHOOK_EVENTS_QUEUE}.retry"
+# Events that cannot be processed, or still fail after ENRICHMENT_MAX_ATTEMPTS,
+# are parked here for inspection instead of being acked away
+WEBHOOK_EVENTS_DEAD_QUEUE = f"{WEBHOOK_EVENTS_QUEUE}.dead"
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", "10"))
+ENRICHMENT_RETRY_DELAY = int(os.getenv("ENRICHMENT_RETRY_DELAY", "30"))
+
+def build_radarr_job(data: Dict[str, Any], request_id: str, job_id: str, radarr_client: RadarrClient) -> Optional[Dict[str, Any]]:
+    """
+    Resolve the movie file path and audio languages for a Radarr webhook.
+
+    Args:
+        data: The webhook payload from Radarr
+        request_id: Unique identifier for the request
+        job_id: Identifier to give the job
+        radarr_client: Client used to look up the movie
+
+    Returns:
+        Optional[Dict[str, Any]]: The job if the movie could be resolved, None if not
+    """
+    tmdb_id = data["movie"].get("tmdbId")
+    movie_details = radarr_client.get_movie_details(tmdb_id, movie_file=data.get("movieFile"))
+    if not movie_details:
+        return None
+
+    movie_path = movie_details[0]["movieFile"]["path"]
+    audio_languages = movie_details[0]["movieFile"].get("languages", [])
+    language_codes = [LANGUAGE_CODES.get(lang["name"], "eng") for lang in audio_languages]
+
+    return {
+        "type": "radarr",
+        "job_id": job_id,
+        "file_path": movie_path,
+        "source_language": language_codes[0] if language_codes else "eng",
+        "target_language": data.get("target_language", "eng"),
+        "languages": language_codes,
+        "request_id": request_id,
+        "urgent": bool(data.get("urgent")),
+        "force": bool(data.get("force")),
+        "timing": data.get("timing"),
+        "alignment": data.get("alignment"),
+        "profile": bool(data.get("profile"))
+    }
+
+class EnrichmentConsumer:
+    """
+    Background stage that turns raw Radarr webhook events into transcription jobs.
+
+    The webhook handler only validates and enqueues the raw payload; this
+    consumer looks the movie up in Radarr and hands the resulting job to
+    enqueue_job. Events whose lookup fails are retried later through a
+    delay queue, so a slow or restarting Radarr never holds up the webhook
+    response or the consumer. An event is only acked once it has become a
+    job, a retry or a dead letter.
+    """
+
+    def __init__(self, host: str, radarr_client: RadarrClient, enqueue_job: Callable[[Dict[str, Any]], str]):
+        self.host = host
+        self.radarr_client = radarr_client
+        self.enqueue_job = enqueue_job
+        self._thread = threading.Thread(target=self._run, name="webhook-enrichment", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _process_event(self, channel, method, properties, body) -> None:
+        traceparent = (properties.headers or {}).get(TRACEPARENT_HEADER)
+        try:
+            self._enrich(channel, json.loads(body.decode("utf-8")), traceparent)
+        except Exception as e:
+            # Malformed payloads (e.g. no movie) fail the same way every time
+            logging.error(f"Failed to enrich webhook event, moving it to {WEBHOOK_EVENTS_DEAD_QUEUE}: {e}")
+            logging.error(f"Traceback: {traceback.format_exc()}")
+            self._dead_letter(channel, body, str(e), traceparent)
+            EVENTS_DEAD_LETTERED.labels("error").inc()
+        # Not reached if a publish above failed: the event is redelivered
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _enrich(self, channel, event: Dict[str, Any], traceparent: Optional[str]) -> None:
+        request_id = event["request_id"]
+        # The job, or the retried event, is published inside the span and carries the trace on
+        with span("enrich", parent=traceparent, kind="consumer", request_id=request_id, job_id=event["job_id"]):
+            job = build_radarr_job(event["payload"], request_id, event["job_id"], self.radarr_client)
+            status = self.enqueue_job(job) if job else None
+            if status and status != "failed":
+                logging.info(f"[{request_id}] Enriched webhook event {event['job_id']}: {status}")
+                return
+            error = "job could not be queued" if job else "Radarr lookup failed"
+            event["attempts"] = event.get("attempts", 0) + 1
+            event["last_error"] = error
+            if event["attempts"] >= ENRICHMENT_MAX_ATTEMPTS:
+                logging.error(f"[{request_id}] Giving up on webhook event {event['job_id']} after "
+                              f"{ENRICHMENT_MAX_ATTEMPTS} attempts, moved to {WEBHOOK_EVENTS_DEAD_QUEUE}")
+                self._dead_letter(channel, json.dumps(event), error, current_traceparent())
+                EVENTS_DEAD_LETTERED.labels("exhausted").inc()
+            else:
+                logging.warning(f"[{request_id}] {error} for event {event['job_id']}, retry {event['attempts']}")
+                self._retry_later(channel, event)
+
+    @staticmethod
+    def _dead_letter(channel, body, error: str, traceparent: Optional[str]) -> None:
+        # The original body is kept as is, so even an undecodable event can
+        # be inspected and republished by hand
+        headers = {"x-error": error}
+        if traceparent:
+            headers[TRACEPARENT_HEADER] = traceparent
+        channel.basic_publish(
+            exchange="",
+            routing_key=WEBHOOK_EVENTS_DEAD_QUEUE,
+            body=body,
+            properties=pika.BasicProperties(delivery_mode=2, headers=headers)
+        )
+
+    @staticmethod
+    def _retry_later(channel, event: Dict[str, Any]) -> None:
+        # Published before the original is acked, so a crash in between
+        # redelivers the event instead of losing it
+        traceparent = current_traceparent()
+        channel.basic_publish(
+            exchange="",
+            routing_key=WEBHOOK_EVENTS_RETRY_QUEUE,
+            body=json.dumps(event),
+            properties=pika.BasicProperties(
+                delivery_mode=2,
+                expiration=str(ENRICHMENT_RETRY_DELAY * 1000),
+                headers={TRACEPARENT_HEADER: traceparent} if traceparent else None
+            )
+        )
+
+    def _run(self) -> None:
+        while True:
+            try:
+                connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(host=self.host, heartbeat=600, blocked_connection_timeout=300)
+                )
+                channel = connection.channel()
+                channel.queue_declare(queue=WEBHOOK_EVENTS_QUEUE, durable=True)
+                # The delay comes from each message's expiration rather than
+                # a queue TTL, so ENRICHMENT_RETRY_DELAY can change freely
+                channel.queue_declare(queue=WEBHOOK_EVENTS_RETRY_QUEUE, durable=True, arguments={
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": WEBHOOK_EVENTS_QUEUE
+                })
+                channel.queue_declare(queue=WEBHOOK_EVENTS_DEAD_QUEUE, durable=True)
+                channel.basic_qos(prefetch_count=1)
+                channel.basic_consume(queue=WEBHOOK_EVENTS_QUEUE, on_message_callback=self._process_event)
+                logging.info("Webhook enrichment consumer is waiting for events...")
+                channel.start_consuming()
+            except pika.exceptions.AMQPConnectionError as e:
+                logging.warning(f"Enrichment consumer lost RabbitMQ connection: {e}. Retrying in 5 seconds...")
+            except Exception as e:
+                logging.error(f"Enrichment consumer error: {e}")
+            time.sleep(5)
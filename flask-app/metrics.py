@@ -0,0 +1,22 @@
+"""
+Prometheus metrics for the webhook service, exposed on /metrics.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+WEBHOOK_LATENCY = Histogram(
+    "webhook_latency_seconds", "Time to answer a webhook request", ["mode", "source", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+JOBS_ENQUEUED = Counter("webhook_jobs_total", "Jobs from webhooks by enqueue outcome", ["status"])
+# reason: "exhausted" (ENRICHMENT_MAX_ATTEMPTS failed lookups) or "error"
+# (the event could not be processed at all)
+EVENTS_DEAD_LETTERED = Counter("enrichment_dead_lettered_total", "Webhook events moved to the dead-letter queue", ["reason"])
+
+PUBLISHED = Counter("publisher_published_total", "Messages confirmed by RabbitMQ", ["queue"])
+# reason: "nacked" (spooled for retry), "unconfirmed" (connection lost
+# before the confirm, spooled for retry) or "dropped" (queue and spool full)
+PUBLISH_FAILURES = Counter("publisher_failures_total", "Messages RabbitMQ did not accept", ["queue", "reason"])
+# where: "memory" (handed over, not yet sent), "spool" (on disk) or
+# "unacked" (sent, awaiting the broker's confirm)
+PUBLISHER_BACKLOG = Gauge("publisher_backlog", "Messages waiting to be published or confirmed", ["queue", "where"])
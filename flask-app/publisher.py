@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+import pika
+from metrics import PUBLISHED, PUBLISH_FAILURES, PUBLISHER_BACKLOG
+from tracing import current_traceparent, TRACEPARENT_HEADER
+
+PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", "100"))
+PUBLISH_MAX_UNACKED = int(os.getenv("PUBLISH_MAX_UNACKED", "1000"))
+PUBLISH_SPOOL_PATH = os.getenv("PUBLISH_SPOOL_PATH", "/mediacenter/.arr-subs/publish_spool.db")
+PUBLISH_SPOOL_MAX = int(os.getenv("PUBLISH_SPOOL_MAX", "10000"))
+RECONNECT_DELAY = 5
+
+class Spool:
+    """
+    Bounded on-disk FIFO of jobs waiting to be published, each with the
+    trace context it was published under. A job stays in the spool until
+    RabbitMQ confirms it, so nothing accepted is lost if flask-app dies.
+    """
+
+    def __init__(self, path: str = PUBLISH_SPOOL_PATH, max_size: int = PUBLISH_SPOOL_MAX):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Every accepted webhook commits here; in WAL mode NORMAL survives a
+        # process crash and skips the fsync per commit
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL, traceparent TEXT)"
+        )
+        # Spools created before trace propagation lack the column
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(spool)")]
+        if "traceparent" not in columns:
+            self._db.execute("ALTER TABLE spool ADD COLUMN traceparent TEXT")
+        self._db.commit()
+
+    def push(self, job: Dict[str, Any], traceparent: Optional[str] = None) -> bool:
+        with self._lock:
+            if self._db.execute("SELECT COUNT(*) FROM spool").fetchone()[0] >= self.max_size:
+                return False
+            self._db.execute("INSERT INTO spool (body, traceparent) VALUES (?, ?)", (json.dumps(job), traceparent))
+            self._db.commit()
+            return True
+
+    def read_batch(self, after_id: int, limit: int) -> List[Tuple[int, Dict[str, Any], Optional[str]]]:
+        """
+        Returns up to limit (id, job, traceparent) entries with ids above
+        after_id, oldest first, leaving them in the spool.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, body, traceparent FROM spool WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ).fetchall()
+        return [(row_id, json.loads(body), traceparent) for row_id, body, traceparent in rows]
+
+    def delete(self, ids: List[int]) -> None:
+        with self._lock:
+            self._db.executemany("DELETE FROM spool WHERE id = ?", [(row_id,) for row_id in ids])
+            self._db.commit()
+
+    def requeue(self, row_id: int) -> None:
+        """
+        Moves an entry to the end of the spool.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO spool (body, traceparent) SELECT body, traceparent FROM spool WHERE id = ?", (row_id,)
+            )
+            self._db.execute("DELETE FROM spool WHERE id = ?", (row_id,))
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+class JobPublisher:
+    """
+    Publishes jobs from a single background thread.
+
+    Request handlers write jobs to the on-disk spool and return at once.
+    The publisher thread owns the only AMQP connection and publishes from
+    the spool in batches with asynchronous publisher confirms; a job is
+    removed from the spool only once the broker confirms it. Anything the
+    broker nacks goes to the back of the spool, and anything unconfirmed
+    when the connection drops is published again after reconnecting. The
+    trace context current when a job is handed over travels with it and
+    is sent in the message headers.
+    """
+
+    def __init__(self, host: str, queue_name: str = "media_jobs", spool: Spool = None,
+                 queue_arguments: Optional[Dict[str, Any]] = None):
+        self.host = host
+        self.queue_name = queue_name
+        self.queue_arguments = queue_arguments
+        # An empty Spool is falsy, so test for None
+        self.spool = spool if spool is not None else Spool()
+        self.published = 0
+        self.nacked = 0
+        # Delivery tag -> spool id of every message awaiting a confirm
+        self._unacked: Dict[int, int] = {}
+        # Highest spool id published on the current connection
+        self._cursor = 0
+        self._connection = None
+        self._channel = None
+        self._delivery_tag = 0
+        self._ready = False
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="rabbitmq-publisher", daemon=True)
+        PUBLISHER_BACKLOG.labels(queue_name, "spool").set_function(lambda: len(self.spool))
+        PUBLISHER_BACKLOG.labels(queue_name, "unacked").set_function(lambda: len(self._unacked))
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping = True
+        connection = self._connection
+        if connection and connection.is_open:
+            connection.ioloop.add_callback_threadsafe(connection.close)
+        self._thread.join(timeout=10)
+
+    def publish(self, job: Dict[str, Any]) -> bool:
+        """
+        Spool a job for publishing without blocking on the broker.
+
+        Returns:
+            bool: True once the job is on disk, False if the spool is full
+        """
+        if not self.spool.push(job, current_traceparent()):
+            logging.error(f"Publish spool is full, dropping job {job['job_id']}")
+            PUBLISH_FAILURES.labels(self.queue_name, "dropped").inc()
+            return False
+        self._wake()
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            # Includes the unacked jobs, which stay spooled until confirmed
+            "spooled": len(self.spool),
+            "unacked": len(self._unacked),
+            "published": self.published,
+            "nacked": self.nacked,
+            "connected": int(self._ready)
+        }
+
+    def _wake(self) -> None:
+        connection = self._connection
+        if connection and self._ready:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._drain)
+            except Exception:
+                # The periodic drain picks the job up once reconnected
+                pass
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._connection = pika.SelectConnection(
+                pika.ConnectionParameters(host=self.host, heartbeat=600, blocked_connection_timeout=300),
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_open_error,
+                on_close_callback=self._on_connection_closed
+            )
+            self._connection.ioloop.start()
+            if not self._stopping:
+                time.sleep(RECONNECT_DELAY)
+
+    def _on_connection_open(self, connection) -> None:
+        logging.info("Publisher connected to RabbitMQ")
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error) -> None:
+        logging.warning(f"Publisher failed to connect to RabbitMQ: {error}. Retrying in {RECONNECT_DELAY} seconds...")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason) -> None:
+        self._ready = False
+        self._channel = None
+        # Anything the broker never confirmed is still spooled and is
+        # published again after reconnecting
+        if self._unacked:
+            PUBLISH_FAILURES.labels(self.queue_name, "unconfirmed").inc(len(self._unacked))
+        self._unacked.clear()
+        if not self._stopping:
+            logging.warning(f"Publisher connection closed: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel) -> None:
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.queue_declare(
+            queue=self.queue_name, durable=True, arguments=self.queue_arguments, callback=self._on_queue_declared
+        )
+
+    def _on_channel_closed(self, channel, reason) -> None:
+        logging.warning(f"Publisher channel closed: {reason}")
+        if self._connection and self._connection.is_open:
+            self._connection.close()
+
+    def _on_queue_declared(self, frame) -> None:
+        self._channel.confirm_delivery(self._on_delivery_confirmation, callback=self._on_confirm_selected)
+
+    def _on_confirm_selected(self, frame) -> None:
+        self._delivery_tag = 0
+        self._cursor = 0
+        self._ready = True
+        self._schedule_drain()
+
+    def _schedule_drain(self) -> None:
+        # Safety net so spooled jobs are retried even without new traffic
+        self._drain()
+        if self._ready:
+            self._connection.ioloop.call_later(1, self._schedule_drain)
+
+    def _drain(self) -> None:
+        if not self._ready:
+            return
+        budget = min(PUBLISH_BATCH_SIZE, PUBLISH_MAX_UNACKED - len(self._unacked))
+        if budget <= 0:
+            return
+        batch = self.spool.read_batch(self._cursor, budget)
+        for row_id, job, traceparent in batch:
+            self._channel.basic_publish(
+                exchange="",
+                routing_key=self.queue_name,
+                body=json.dumps(job),
+                properties=pika.BasicProperties(
+                    delivery_mode=2,  # Make message persistent
+                    correlation_id=str(uuid.uuid4()),
+                    priority=job.get("priority"),
+                    headers={TRACEPARENT_HEADER: traceparent} if traceparent else None
+                )
+            )
+            self._delivery_tag += 1
+            self._unacked[self._delivery_tag] = row_id
+            self._cursor = row_id
+        # A full batch means a burst is in progress; keep going on the next loop turn
+        if len(batch) == budget:
+            self._connection.ioloop.call_later(0, self._drain)
+
+    def _on_delivery_confirmation(self, frame) -> None:
+        method = frame.method
+        if method.multiple:
+            tags = [tag for tag in self._unacked if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag]
+        row_ids = [row_id for row_id in (self._unacked.pop(tag, None) for tag in tags) if row_id is not None]
+        if not row_ids:
+            return
+        if isinstance(method, pika.spec.Basic.Ack):
+            self.spool.delete(row_ids)
+            self.published += len(row_ids)
+            PUBLISHED.labels(self.queue_name).inc(len(row_ids))
+            logging.debug(f"{len(row_ids)} messages confirmed by RabbitMQ")
+        else:
+            # Requeued entries get ids past the cursor, so the next drain retries them
+            for row_id in row_ids:
+                self.spool.requeue(row_id)
+            self.nacked += len(row_ids)
+            PUBLISH_FAILURES.labels(self.queue_name, "nacked").inc(len(row_ids))
+            logging.warning(f"{len(row_ids)} messages were nacked by RabbitMQ, retrying them from the spool")
@@ -1,52 +1,176 @@
-import requests
+import os
+import time
 import logging
+import threading
 import traceback
+from collections import OrderedDict
 from typing import Optional, Dict, List, Any
+import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException, HTTPError, Timeout
+from urllib3.util.retry import Retry
 
-def get_movie_details(tmdb_id: int, radarr_api_url: str, radarr_api_key: str) -> Optional[List[Dict[str, Any]]]:
+RADARR_CACHE_TTL = int(os.getenv("RADARR_CACHE_TTL", "3600"))
+RADARR_CACHE_SIZE = int(os.getenv("RADARR_CACHE_SIZE", "20000"))
+RADARR_POOL_SIZE = int(os.getenv("RADARR_POOL_SIZE", "10"))
+# The library is prefetched again on this interval, before prefetched entries
+# expire; 0 prefetches once at startup only
+RADARR_PREFETCH_INTERVAL = int(os.getenv("RADARR_PREFETCH_INTERVAL", str(RADARR_CACHE_TTL // 2)))
+
+class RadarrClient:
     """
-    Fetch movie details from Radarr API using TMDb ID.
-    
-    Args:
-        tmdb_id: The TMDb ID of the movie
-        radarr_api_url: Base URL for the Radarr API
-        radarr_api_key: API key for authentication
-        
-    Returns:
-        Optional[List[Dict[str, Any]]]: Movie details if successful, None if failed
+    Radarr API client with a keep-alive connection pool and a TTL cache of
+    movie details keyed by tmdbId.
     """
-    url = f"{radarr_api_url}?tmdbId={tmdb_id}&excludeLocalCovers=true"
-    url = url.strip('"').strip()
-    
-    logging.debug(f"Requesting movie details from Radarr: {url}")
-    
-    try:
-        response = requests.get(
-            url,
-            headers={"X-Api-Key": radarr_api_key},
-            timeout=30  # Add timeout
+
+    def __init__(self, radarr_api_url: str, radarr_api_key: str,
+                 cache_ttl: int = RADARR_CACHE_TTL, cache_size: int = RADARR_CACHE_SIZE):
+        self.radarr_api_url = radarr_api_url.strip('"').strip()
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers.update({"X-Api-Key": radarr_api_key})
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=RADARR_POOL_SIZE,
+            max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504])
         )
-        response.raise_for_status()
-        
-        movie_data = response.json()
-        if not movie_data:
-            logging.warning(f"No movie data found for TMDb ID: {tmdb_id}")
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _cache_get(self, tmdb_id: int) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._cache.get(tmdb_id)
+            if not entry:
+                return None
+            expires_at, movie_data = entry
+            if expires_at < time.monotonic():
+                del self._cache[tmdb_id]
+                return None
+            self._cache.move_to_end(tmdb_id)
+            return movie_data
+
+    def _cache_put(self, tmdb_id: int, movie_data: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._cache[tmdb_id] = (time.monotonic() + self.cache_ttl, movie_data)
+            self._cache.move_to_end(tmdb_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, tmdb_id: int) -> None:
+        with self._lock:
+            self._cache.pop(tmdb_id, None)
+
+    @staticmethod
+    def _is_stale(movie_data: List[Dict[str, Any]], movie_file: Optional[Dict[str, Any]]) -> bool:
+        """
+        A cached record is stale when the webhook reports a movie file that
+        differs from the one Radarr returned earlier.
+        """
+        if not movie_file:
+            return False
+        cached_file = movie_data[0].get("movieFile")
+        if not cached_file:
+            return True
+        for field in ("id", "relativePath", "size"):
+            if field in movie_file and movie_file[field] != cached_file.get(field):
+                return True
+        return False
+
+    def get_movie_details(self, tmdb_id: int, movie_file: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fetch movie details from the cache or the Radarr API using TMDb ID.
+
+        Args:
+            tmdb_id: The TMDb ID of the movie
+            movie_file: The webhook's movieFile, used to detect stale cache entries
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: Movie details if successful, None if failed
+        """
+        movie_data = self._cache_get(tmdb_id)
+        if movie_data and not self._is_stale(movie_data, movie_file):
+            with self._lock:
+                self.hits += 1
+            return movie_data
+        if movie_data:
+            logging.info(f"Webhook carries a newer movieFile for TMDb ID {tmdb_id}, refreshing cache")
+            self.invalidate(tmdb_id)
+        with self._lock:
+            self.misses += 1
+
+        url = f"{self.radarr_api_url}?tmdbId={tmdb_id}&excludeLocalCovers=true"
+        logging.debug(f"Requesting movie details from Radarr: {url}")
+
+        try:
+            response = self.session.get(url, timeout=(5, 30))
+            response.raise_for_status()
+
+            movie_data = response.json()
+            if not movie_data:
+                logging.warning(f"No movie data found for TMDb ID: {tmdb_id}")
+                return None
+
+            self._cache_put(tmdb_id, movie_data)
+            return movie_data
+
+        except Timeout:
+            logging.error(f"Timeout while fetching movie details for TMDb ID: {tmdb_id}")
+            return None
+        except HTTPError as e:
+            logging.error(f"HTTP error occurred while fetching movie details: {e}")
+            return None
+        except RequestException as e:
+            logging.error(f"Request failed: {e}")
+            logging.error(f"Traceback: {traceback.format_exc()}")
             return None
-            
-        return movie_data
-        
-    except Timeout:
-        logging.error(f"Timeout while fetching movie details for TMDb ID: {tmdb_id}")
-        return None
-    except HTTPError as e:
-        logging.error(f"HTTP error occurred while fetching movie details: {e}")
-        return None
-    except RequestException as e:
-        logging.error(f"Request failed: {e}")
-        logging.error(f"Traceback: {traceback.format_exc()}")
-        return None
-    except Exception as e:
-        logging.error(f"Unexpected error while fetching movie details: {e}")
-        logging.error(f"Traceback: {traceback.format_exc()}")
-        return None
\ No newline at end of file
+        except Exception as e:
+            logging.error(f"Unexpected error while fetching movie details: {e}")
+            logging.error(f"Traceback: {traceback.format_exc()}")
+            return None
+
+    def prefetch(self) -> int:
+        """
+        Load the whole Radarr library into the cache with a single request.
+
+        Returns:
+            int: Number of movies cached
+        """
+        start_time = time.monotonic()
+        try:
+            response = self.session.get(f"{self.radarr_api_url}?excludeLocalCovers=true", timeout=(5, 300))
+            response.raise_for_status()
+            movies = response.json()
+        except Exception as e:
+            logging.error(f"Failed to prefetch Radarr library: {e}")
+            return 0
+
+        cached = 0
+        for movie in movies[-self.cache_size:]:
+            tmdb_id = movie.get("tmdbId")
+            if tmdb_id:
+                self._cache_put(tmdb_id, [movie])
+                cached += 1
+        logging.info(f"Prefetched {cached} Radarr movies in {time.monotonic() - start_time:.1f}s")
+        return cached
+
+    def prefetch_periodically(self, interval: int = RADARR_PREFETCH_INTERVAL) -> None:
+        """
+        Prefetch now and then every interval seconds, so webhooks keep
+        hitting the cache after the first RADARR_CACHE_TTL. Runs forever
+        unless interval is 0.
+        """
+        while True:
+            self.prefetch()
+            if interval <= 0:
+                return
+            time.sleep(interval)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
@@ -0,0 +1,26 @@
+import time
+from typing import Dict, Any
+
+# media_jobs is a priority queue; every declaration must use the same arguments
+MAX_PRIORITY = 10
+MEDIA_JOBS_QUEUE_ARGUMENTS = {"x-max-priority": MAX_PRIORITY}
+
+# Every job is published at NORMAL_PRIORITY, and urgent ones (the webhook's
+# "urgent" flag) at MAX_PRIORITY. Ordering by duration is left to the
+# worker, which probes the media while jobs wait in its scheduling window
+# (see SCHEDULING_POLICY there): probing here would only be possible off the
+# webhook request path, for some jobs, and mixed probed and unprobed
+# priorities would no longer follow duration.
+NORMAL_PRIORITY = 5
+
+def job_priority(urgent: bool = False) -> int:
+    return MAX_PRIORITY if urgent else NORMAL_PRIORITY
+
+def schedule_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Annotate a job with its priority and enqueue time.
+    """
+    job["urgent"] = bool(job.get("urgent"))
+    job["priority"] = job_priority(job["urgent"])
+    job.setdefault("enqueued_at", time.time())
+    return job
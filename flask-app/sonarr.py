@@ -39,6 +39,11 @@ def process_sonarr_webhook(data: Dict[str, Any], request_id: str) -> Optional[Di
             "source_language": source_language,
             "target_language": target_language,
             "request_id": request_id,
+            "urgent": bool(data.get("urgent")),
+            "force": bool(data.get("force")),
+            "timing": data.get("timing"),
+            "alignment": data.get("alignment"),
+            "profile": bool(data.get("profile")),
             "series_name": data.get("series", {}).get("title", "Unknown Series"),
             "episode_info": {
                 "season": data.get("episodes", [{}])[0].get("seasonNumber"),
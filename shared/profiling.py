@@ -0,0 +1,65 @@
+"""
+On-demand cProfile capture of a job's hot path.
+
+A job is profiled when its "profile" field is true or PROFILE_JOBS is set.
+The profile of the calling thread is written next to the job's artifacts
+as <media base>.<name>.prof, for `python -m pstats` or snakeviz.
+
+This file lives in shared/ and is copied into the worker and aeneas images
+through the "shared" build context in docker-compose.yaml.
+"""
+
+import os
+import pstats
+import cProfile
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILE_JOBS = os.getenv("PROFILE_JOBS", "false").lower() == "true"
+
+def profiling_enabled(requested=None):
+    return bool(requested) or PROFILE_JOBS
+
+def profile_path(media_path, name):
+    return f"{os.path.splitext(media_path)[0]}.{name}.prof"
+
+@contextmanager
+def profiled(path, enabled=True):
+    """
+    Profiles the block with cProfile and dumps the stats to path. Only the
+    calling thread is profiled; work it hands to other threads or
+    processes needs its own profiled() block.
+    """
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            profiler.dump_stats(path)
+            logger.info(f"Wrote profile {path}")
+        except OSError as e:
+            logger.warning(f"Could not write profile {path}: {str(e)}")
+
+def merge_profiles(paths, path):
+    """
+    Combines the profiles in paths (e.g. one per worker process) into path
+    and removes them.
+    """
+    existing = [part for part in paths if os.path.exists(part)]
+    if not existing:
+        return
+    try:
+        pstats.Stats(*existing).dump_stats(path)
+        logger.info(f"Wrote profile {path} from {len(existing)} parts")
+    except (OSError, TypeError) as e:
+        logger.warning(f"Could not merge profiles into {path}: {str(e)}")
+    finally:
+        for part in existing:
+            os.remove(part)
@@ -0,0 +1,270 @@
+"""
+Streaming SRT parser and serializer shared by the worker and aeneas service.
+
+Cues are parsed one at a time from any iterable of lines, so a file is never
+held in memory as a whole. Timestamps are integer milliseconds. The parser
+tolerates a UTF-8 BOM, CRLF line endings, missing blank lines between cues,
+all-digit text lines and stray lines outside any cue. When a cue carries
+more than one timestamp line before its text (aeneas output for an SRT fed
+in as "subtitles" text), the last one wins.
+
+This file lives in shared/ and is copied into the worker and aeneas images
+through the "shared" build context in docker-compose.yaml.
+"""
+
+import os
+import re
+import itertools
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH = 1024
+READ_CHUNK = 1 << 20
+
+# Fast path for the canonical "HH:MM:SS,mmm --> HH:MM:SS,mmm" line
+CANONICAL_TIMESTAMP_PATTERN = re.compile(
+    r"(\d\d):(\d\d):(\d\d)[,.](\d\d\d) --> (\d\d):(\d\d):(\d\d)[,.](\d\d\d)$"
+)
+# Exactly what format_timestamp() produces, so a matching line can be
+# written back as is instead of being decoded and re-encoded
+FORMATTED_TIMING_PATTERN = re.compile(
+    r"(?:\d\d|[1-9]\d\d+):[0-5]\d:[0-5]\d,\d\d\d --> (?:\d\d|[1-9]\d\d+):[0-5]\d:[0-5]\d,\d\d\d$"
+)
+# Millisecond values of the fixed-width fields, looked up instead of int()
+_HOURS = {f"{value:02d}": value * 3600000 for value in range(100)}
+_MINUTES = {f"{value:02d}": value * 60000 for value in range(100)}
+_SECONDS = {f"{value:02d}": value * 1000 for value in range(100)}
+_MILLISECONDS = {f"{value:03d}": value for value in range(1000)}
+TIMESTAMP_PATTERN = re.compile(
+    r"^(\d+):(\d{2}):(\d{2})(?:[,.](\d{1,3}))?\s*-->\s*(\d+):(\d{2}):(\d{2})(?:[,.](\d{1,3}))?"
+)
+
+class Cue:
+    """
+    One subtitle: start and end in milliseconds, text as a list of lines.
+
+    iter_cues() leaves a timing line in format_timestamp() form undecoded in
+    cue.timing; start and end decode it on first access, and format_cue()
+    writes it back verbatim unless either was assigned.
+    """
+
+    __slots__ = ("index", "_start", "_end", "lines", "timing")
+
+    def __init__(self, start, end, lines, index=None, timing=None):
+        self.index = index
+        self._start = start
+        self._end = end
+        self.lines = lines
+        self.timing = timing
+
+    def _decode(self):
+        if self._start is None and self.timing is not None:
+            self._start, self._end = parse_timestamp_line(self.timing)
+
+    @property
+    def start(self):
+        self._decode()
+        return self._start
+
+    @start.setter
+    def start(self, value):
+        self._decode()
+        self._start, self.timing = value, None
+
+    @property
+    def end(self):
+        self._decode()
+        return self._end
+
+    @end.setter
+    def end(self, value):
+        self._decode()
+        self._end, self.timing = value, None
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
+
+    def __repr__(self):
+        return f"Cue({self.start}, {self.end}, {self.lines!r}, index={self.index!r})"
+
+    def __eq__(self, other):
+        return (isinstance(other, Cue) and self.start == other.start
+                and self.end == other.end and self.lines == other.lines)
+
+def _milliseconds(h, m, s, ms):
+    return ((int(h) * 60 + int(m)) * 60 + int(s)) * 1000 + (int(ms.ljust(3, "0")) if ms else 0)
+
+def parse_timestamp_line(line):
+    """
+    Returns (start, end) in milliseconds, or None if line is not a timing line.
+    """
+    match = CANONICAL_TIMESTAMP_PATTERN.match(line)
+    if match:
+        h1, m1, s1, ms1, h2, m2, s2, ms2 = match.groups()
+        return (_HOURS[h1] + _MINUTES[m1] + _SECONDS[s1] + _MILLISECONDS[ms1],
+                _HOURS[h2] + _MINUTES[m2] + _SECONDS[s2] + _MILLISECONDS[ms2])
+    match = TIMESTAMP_PATTERN.match(line)
+    if not match:
+        return None
+    groups = match.groups()
+    return _milliseconds(*groups[:4]), _milliseconds(*groups[4:])
+
+def format_timestamp(ms):
+    seconds, ms = divmod(max(0, int(ms)), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d,%03d" % (hours, minutes, seconds, ms)
+
+def parse(lines):
+    """
+    Yields a Cue for every timed block in lines. Cues without text are kept
+    so a round trip does not renumber the file; callers filter them if needed.
+    """
+    skipped = [0]
+    lines = iter(lines)
+    # str.strip() keeps a BOM left by a plain utf-8 decode of the first line
+    first = next(lines, "").lstrip("\ufeff")
+    yield from _parse_lines(itertools.chain((first,), lines), skipped)
+    _log_skipped(skipped)
+
+def _log_skipped(skipped):
+    if skipped[0]:
+        logger.warning(f"Skipped {skipped[0]} malformed SRT lines")
+
+def _parse_lines(lines, skipped):
+    # The line-by-line state machine behind parse(); adds the number of
+    # malformed lines to skipped[0]. A blank line always resets the state.
+    cue = None
+    pending_number = None
+    for line in lines:
+        line = line.strip()
+
+        if not line:
+            if cue is not None:
+                if pending_number is not None:
+                    cue.lines.append(pending_number)
+                yield cue
+            cue, pending_number = None, None
+            continue
+
+        timing = parse_timestamp_line(line) if "-->" in line else None
+        if timing:
+            if cue is not None and cue.lines:
+                # Missing blank line: this timing starts the next cue
+                yield cue
+                cue = None
+            if cue is None:
+                cue = Cue(timing[0], timing[1], [], pending_number)
+            else:
+                # Repeated header before any text; the last timing wins
+                cue.start, cue.end = timing
+            pending_number = None
+        elif line.isdigit():
+            # Either the number of the next cue or all-digit text; decided
+            # by whether a timing line follows
+            if pending_number is not None:
+                if cue is not None:
+                    cue.lines.append(pending_number)
+                else:
+                    skipped[0] += 1
+            pending_number = line
+        elif cue is not None:
+            if pending_number is not None:
+                cue.lines.append(pending_number)
+                pending_number = None
+            cue.lines.append(line)
+        else:
+            skipped[0] += 1
+            pending_number = None
+
+    if cue is not None:
+        if pending_number is not None:
+            cue.lines.append(pending_number)
+        yield cue
+
+def _canonical_cue(block):
+    """
+    Returns the Cue of a "number, canonical timing, text" block, or None when
+    the block needs the line-by-line parser. Most real files are nothing but
+    such blocks, and these few C-level string operations per block are what
+    keeps iter_cues() close to a plain read of the file.
+    """
+    lines = block.split("\n")
+    if len(lines) < 3 or block.count("-->") != 1:
+        return None
+    number, timing = lines[0].strip(), lines[1].strip()
+    if not number.isdigit() or FORMATTED_TIMING_PATTERN.match(timing) is None:
+        return None
+    text = [line.strip() for line in lines[2:]]
+    if "" in text:
+        return None
+    return Cue(None, None, text, number, timing)
+
+def iter_cues(path):
+    """
+    Streams the cues of an SRT file, READ_CHUNK characters at a time.
+    """
+    skipped = [0]
+    # newline=None turns CRLF and CR into "\n"; utf-8-sig drops a BOM
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline=None) as file:
+        remainder = ""
+        while True:
+            chunk = file.read(READ_CHUNK)
+            if not chunk:
+                break
+            blocks = (remainder + chunk).split("\n\n")
+            remainder = blocks.pop()
+            if not blocks and len(remainder) > READ_CHUNK:
+                # No blank lines to split on (every separator missing): go
+                # line by line rather than buffer the rest of the file
+                lines = remainder.split("\n")
+                partial = lines.pop() + next(file, "")
+                yield from _parse_lines(itertools.chain(lines, (partial,), file), skipped)
+                remainder = ""
+                break
+            for block in blocks:
+                # Blocks are independent: the line parser resets at every blank line
+                cue = _canonical_cue(block)
+                if cue is None:
+                    yield from _parse_lines(block.split("\n"), skipped)
+                else:
+                    yield cue
+        if remainder:
+            yield from _parse_lines(remainder.split("\n"), skipped)
+    _log_skipped(skipped)
+
+def read_cues(path):
+    return list(iter_cues(path))
+
+def format_cue(cue, number):
+    timing = cue.timing or f"{format_timestamp(cue.start)} --> {format_timestamp(cue.end)}"
+    return f"{number}\n{timing}\n{cue.text}\n\n"
+
+def write_cues(path, cues):
+    """
+    Writes cues, numbered from 1, to path atomically: readers see either the
+    old file or the complete new one. Returns the number of cues written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".srt-", dir=directory)
+    count = 0
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as file:
+            # Joining a batch of cues per write() is markedly cheaper than one call per cue
+            batch = []
+            for count, cue in enumerate(cues, 1):
+                batch.append(format_cue(cue, count))
+                if len(batch) >= WRITE_BATCH:
+                    file.write("".join(batch))
+                    batch.clear()
+            file.write("".join(batch))
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return count
@@ -0,0 +1,248 @@
+"""
+Lightweight distributed tracing shared by flask-app, the worker and aeneas.
+
+Spans follow the W3C Trace Context model: every span of a job carries the
+job's trace id, its own span id and its parent's span id. The context
+travels between services as a "traceparent" value, in AMQP message headers
+and in HTTP request headers.
+
+Finished spans are exported from a background thread to TRACE_FILE (one
+JSON object per line) and/or, as OTLP/JSON, to TRACE_COLLECTOR_URL (e.g.
+http://otel-collector:4318/v1/traces). With neither set spans are still
+created and propagated, but not recorded.
+
+This file lives in shared/ and is copied into every image through the
+"shared" build context in docker-compose.yaml.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import logging
+import secrets
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "arr-subs")
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "")
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "5"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+TRACE_BATCH_SIZE = 512
+
+TRACEPARENT_HEADER = "traceparent"
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# OTLP enum values
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_ns", "end_ns", "error")
+
+    def __init__(self, name, trace_id, parent_id=None, kind="internal", attributes=None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            "service": TRACE_SERVICE_NAME,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def parse_traceparent(value):
+    """
+    Returns (trace_id, span_id) from a traceparent value, or None.
+    """
+    match = TRACEPARENT_PATTERN.match((value or "").strip().lower())
+    return match.groups() if match else None
+
+def current_span():
+    return _current_span.get()
+
+def current_traceparent():
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+def inject(headers=None):
+    """
+    Adds the current span's traceparent to headers (a new dict if None).
+    """
+    headers = dict(headers or {})
+    traceparent = current_traceparent()
+    if traceparent:
+        headers[TRACEPARENT_HEADER] = traceparent
+    return headers
+
+@contextmanager
+def span(name, parent=None, kind="internal", **attributes):
+    """
+    Runs the block in a new span, the child of parent (a Span or a
+    traceparent value) or else of the current span; with neither, the span
+    starts a new trace. Exceptions are recorded on the span and re-raised.
+
+    Job threads do not inherit the submitting thread's current span, so
+    work handed to a thread pool passes it as parent explicitly.
+    """
+    if parent is None:
+        parent = _current_span.get()
+    if isinstance(parent, Span):
+        context = (parent.trace_id, parent.span_id)
+    else:
+        context = parse_traceparent(parent)
+    trace_id, parent_id = context if context else (secrets.token_hex(16), None)
+
+    new_span = Span(name, trace_id, parent_id, kind, attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end_ns = time.time_ns()
+        _exporter.export(new_span)
+
+class _Exporter:
+    """
+    Batches finished spans on a background thread. Spans are dropped, not
+    queued without bound, when the exporter falls behind.
+    """
+
+    def __init__(self):
+        self.enabled = bool(TRACE_FILE or TRACE_COLLECTOR_URL)
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        if not self.enabled:
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=10):
+        """
+        Exports everything still queued, including the batch the exporter
+        thread is collecting. Registered to run at interpreter exit.
+        """
+        if self._thread is None:
+            return
+        try:
+            # None tells the exporter thread to write what it has and stop
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch, stopping = [], False
+            deadline = time.monotonic() + TRACE_EXPORT_INTERVAL
+            while len(batch) < TRACE_BATCH_SIZE:
+                try:
+                    span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stopping = True
+                    break
+                batch.append(span)
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch):
+        with self._lock:
+            if TRACE_FILE:
+                try:
+                    os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+                    with open(TRACE_FILE, "a", encoding="utf-8") as trace_file:
+                        trace_file.write("".join(json.dumps(span.to_dict()) + "\n" for span in batch))
+                except OSError as e:
+                    logger.warning(f"Could not write {len(batch)} spans to {TRACE_FILE}: {str(e)}")
+            if TRACE_COLLECTOR_URL:
+                self._post(batch)
+
+    def _post(self, batch):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", TRACE_SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "arr-subs"}, "spans": [span.to_otlp() for span in batch]}]
+        }]}
+        request = urllib.request.Request(
+            TRACE_COLLECTOR_URL, data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+        except Exception as e:
+            logger.warning(f"Could not export {len(batch)} spans to {TRACE_COLLECTOR_URL}: {str(e)}")
+
+_exporter = _Exporter()
+atexit.register(_exporter.close)
@@ -0,0 +1,128 @@
+"""
+Round-trip and edge-case tests for shared/srt_io.py.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import srt_io  # noqa: E402
+
+SAMPLE = (
+    "1\n00:00:01,000 --> 00:00:02,500\nHello there\n\n"
+    "2\n00:00:03,000 --> 00:00:04,000\nTwo lines\nof text\n\n"
+    "3\n01:02:03,004 --> 01:02:05,000\n- Who?\n- Me.\n\n"
+)
+
+def parsed(text):
+    return [(cue.start, cue.end, cue.lines) for cue in srt_io.parse(text.splitlines(keepends=True))]
+
+def write_raw(path, text):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write(text)
+
+def test_round_trip_is_byte_identical(tmp_path):
+    path = tmp_path / "sample.srt"
+    write_raw(path, SAMPLE)
+    cues = srt_io.read_cues(path)
+    copy = tmp_path / "copy.srt"
+    assert srt_io.write_cues(copy, cues) == 3
+    assert copy.read_text(encoding="utf-8") == SAMPLE
+    assert srt_io.read_cues(copy) == cues
+
+def test_bom_is_dropped(tmp_path):
+    path = tmp_path / "bom.srt"
+    write_raw(path, "\ufeff" + SAMPLE)
+    assert srt_io.read_cues(path)[0].start == 1000
+    # A plain utf-8 decode leaves the BOM on the first line
+    assert parsed("\ufeff" + SAMPLE)[0] == (1000, 2500, ["Hello there"])
+
+def test_crlf_line_endings(tmp_path):
+    path = tmp_path / "crlf.srt"
+    write_raw(path, SAMPLE.replace("\n", "\r\n"))
+    assert [(cue.start, cue.end, cue.lines) for cue in srt_io.iter_cues(path)] == parsed(SAMPLE)
+    assert parsed(SAMPLE.replace("\n", "\r\n")) == parsed(SAMPLE)
+
+@pytest.mark.parametrize("text, expected", [
+    # All-digit text is text, not the number of the next cue
+    ("1\n00:00:01,000 --> 00:00:02,000\n1984\n\n", [(1000, 2000, ["1984"])]),
+    ("1\n00:00:01,000 --> 00:00:02,000\n42\n7\n\n", [(1000, 2000, ["42", "7"])]),
+    ("1\n00:00:01,000 --> 00:00:02,000\nYear\n2049\n", [(1000, 2000, ["Year", "2049"])]),
+])
+def test_all_digit_text(text, expected):
+    assert parsed(text) == expected
+
+@pytest.mark.parametrize("text, expected", [
+    # Missing blank line between cues
+    ("1\n00:00:01,000 --> 00:00:02,000\nA\n2\n00:00:03,000 --> 00:00:04,000\nB\n",
+     [(1000, 2000, ["A"]), (3000, 4000, ["B"])]),
+    # Repeated header (aeneas output of an SRT fed as text): last timing wins
+    ("1\n00:00:05,000 --> 00:00:06,000\n1\n00:00:01,000 --> 00:00:02,000\nA\n\n", [(1000, 2000, ["A"])]),
+    # Stray lines and a block without timing are skipped
+    ("garbage\n\n2\nno timing here\n\n3\n00:00:01.5 --> 00:00:02.25\nB\n", [(1500, 2250, ["B"])]),
+    # Broken timing lines do not start a cue
+    ("1\n00:00:01,000 -> 00:00:02,000\nA\n\n2\n00:00:03,000 --> 00:00:04,000\nB\n\n", [(3000, 4000, ["B"])]),
+    # A cue without text is kept so a round trip does not renumber the file
+    ("1\n00:00:01,000 --> 00:00:02,000\n\n2\n00:00:03,000 --> 00:00:04,000\nB\n\n",
+     [(1000, 2000, []), (3000, 4000, ["B"])]),
+    ("", []),
+])
+def test_malformed_blocks(text, expected):
+    assert parsed(text) == expected
+
+@pytest.mark.parametrize("read_chunk", [7, 64, 1 << 20])
+def test_chunked_read_matches_line_parser(tmp_path, monkeypatch, read_chunk):
+    # Every block shape the canonical fast path has to hand back to the line parser
+    text = (SAMPLE + "garbage\n\n\n4\n00:00:05.000 --> 00:00:06,000\n1984\n\n"
+            "5\n00:00:07,000 --> 00:00:08,000\nA\n6\n00:00:09,000 --> 00:00:10,000\n \nB\n\n"
+            "7\n00:00:11,000 --> 00:00:12,000\n\n8\n100:00:00,000 --> 100:00:01,000\nlast")
+    path = tmp_path / "chunked.srt"
+    write_raw(path, text)
+    monkeypatch.setattr(srt_io, "READ_CHUNK", read_chunk)
+    streamed = [(cue.start, cue.end, cue.lines, cue.index) for cue in srt_io.iter_cues(path)]
+    expected = [(cue.start, cue.end, cue.lines, cue.index)
+                for cue in srt_io.parse(text.splitlines(keepends=True))]
+    assert streamed == expected
+    assert len(expected) == 8
+
+def test_unchanged_timing_is_written_back_verbatim(tmp_path):
+    path = tmp_path / "sample.srt"
+    write_raw(path, SAMPLE)
+    first, second, third = srt_io.read_cues(path)
+    assert first.timing == "00:00:01,000 --> 00:00:02,500"
+    second.end += 250
+    assert second.timing is None
+    assert (second.start, second.end) == (3000, 4250)
+    copy = tmp_path / "copy.srt"
+    srt_io.write_cues(copy, [first, second, third])
+    assert copy.read_text(encoding="utf-8") == SAMPLE.replace("00:00:04,000", "00:00:04,250")
+
+def test_timestamp_formatting():
+    assert srt_io.format_timestamp(3723004) == "01:02:03,004"
+    assert srt_io.format_timestamp(-5) == "00:00:00,000"
+    assert srt_io.parse_timestamp_line("01:02:03,004 --> 01:02:05,000") == (3723004, 3725000)
+    assert srt_io.parse_timestamp_line("1:02:03 --> 1:02:04,5") == (3723000, 3724500)
+    assert srt_io.parse_timestamp_line("not a timing") is None
+
+def test_write_is_atomic_on_error(tmp_path):
+    path = tmp_path / "target.srt"
+    write_raw(path, SAMPLE)
+
+    def failing_cues():
+        yield srt_io.Cue(0, 1000, ["first"])
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        srt_io.write_cues(path, failing_cues())
+    assert path.read_text(encoding="utf-8") == SAMPLE
+    assert os.listdir(tmp_path) == ["target.srt"]
+
+def test_rewrite_in_place_while_streaming(tmp_path):
+    path = tmp_path / "clean.srt"
+    write_raw(path, "5\n00:00:01,000 --> 00:00:02,000\n\n9\n00:00:03,000 --> 00:00:04,000\nB\n\n")
+    assert srt_io.write_cues(path, (cue for cue in srt_io.iter_cues(path) if cue.lines)) == 1
+    assert path.read_text(encoding="utf-8") == "1\n00:00:03,000 --> 00:00:04,000\nB\n\n"
@@ -1,30 +1,98 @@
+import os
+import time
+import random
 import requests
 import logging
+import tracing
 
 logger = logging.getLogger(__name__)
 
-AENEAS_URL = "http://aeneas:5001/sync"
+AENEAS_JOBS_URL = os.getenv("AENEAS_JOBS_URL", "http://aeneas:5001/jobs")
+AENEAS_POLL_INTERVAL = float(os.getenv("AENEAS_POLL_INTERVAL", "10"))
+AENEAS_JOB_TIMEOUT = int(os.getenv("AENEAS_JOB_TIMEOUT", "14400"))
+AENEAS_REQUEST_TIMEOUT = 30
 
-def sync_subtitles(video_path, srt_path, language):
-    try:
-        logger.info(f"Starting Aeneas sync...")
-        aeneas_response = requests.post(
-            AENEAS_URL,
+class AeneasJobLost(Exception):
+    """Raised when the aeneas service no longer knows a job, e.g. after a restart."""
+
+def submit_sync_job(video_path, srt_path, language, deadline, timing=None, profile=False):
+    """
+    Submits a sync job, waiting out 429 responses until the deadline.
+    timing overrides the service's cue timing normalization parameters;
+    profile asks the service to profile the job.
+    """
+    while True:
+        response = requests.post(
+            AENEAS_JOBS_URL,
             json={
                 "video_path": video_path,
                 "srt_path": srt_path,
-                "language": language
-            }
+                "language": language,
+                "timing": timing,
+                "profile": profile
+            },
+            headers=tracing.inject(),
+            timeout=AENEAS_REQUEST_TIMEOUT
         )
-        aeneas_response.raise_for_status()
+        if response.status_code != 429:
+            response.raise_for_status()
+            return response.json()["job_id"]
+
+        # Jitter keeps workers that were refused together from retrying together
+        retry_after = float(response.headers.get("Retry-After", AENEAS_POLL_INTERVAL))
+        delay = retry_after * random.uniform(1.0, 1.5)
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError("Aeneas stayed busy until the sync deadline")
+        logger.info(f"Aeneas is busy, retrying submission in {delay:.0f}s")
+        time.sleep(delay)
+
+def wait_for_sync_job(job_id, deadline):
+    """
+    Polls a sync job until it finishes. Raises AeneasJobLost on a 404: jobs
+    live in the service's memory and do not survive a restart.
+    """
+    status_url = f"{AENEAS_JOBS_URL}/{job_id}"
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(status_url, timeout=AENEAS_REQUEST_TIMEOUT)
+        except requests.ConnectionError as e:
+            # Most likely restarting; the next poll tells whether the job survived
+            logger.warning(f"Aeneas unreachable while polling job {job_id}: {str(e)}")
+            time.sleep(AENEAS_POLL_INTERVAL)
+            continue
+        if response.status_code == 404:
+            raise AeneasJobLost(f"Aeneas no longer knows job {job_id}")
+        response.raise_for_status()
+        job = response.json()
+        if job["status"] == "done":
+            return job
+        if job["status"] == "failed":
+            raise RuntimeError(f"Aeneas job {job_id} failed: {job.get('error')}")
+        time.sleep(AENEAS_POLL_INTERVAL)
+    raise TimeoutError(f"Aeneas job {job_id} did not finish within {AENEAS_JOB_TIMEOUT}s")
 
-        synced_srt_path = aeneas_response.json().get("synced_srt", "")
+def sync_subtitles(video_path, srt_path, language, timing=None, profile=False):
+    try:
+        logger.info(f"Starting Aeneas sync...")
+        deadline = time.monotonic() + AENEAS_JOB_TIMEOUT
+        with tracing.span("aeneas.sync", kind="client", language=language) as span:
+            while True:
+                job_id = submit_sync_job(video_path, srt_path, language, deadline, timing, profile)
+                span.set_attribute("aeneas_job_id", job_id)
+                logger.info(f"Aeneas sync job {job_id} queued")
+                try:
+                    job = wait_for_sync_job(job_id, deadline)
+                    break
+                except AeneasJobLost as e:
+                    logger.warning(f"{str(e)}, resubmitting")
+
+        synced_srt_path = job.get("synced_srt", "")
         if not synced_srt_path:
             raise ValueError("Aeneas did not return a valid synced SRT.")
-        
+
         logger.info(f"Sync completed. Synced SRT at {synced_srt_path}")
         return {"synced_srt_path": synced_srt_path}
 
     except Exception as e:
         logger.error(f"Subtitle sync error: {str(e)}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,104 @@
+"""
+Splitting long audio into chunks for parallel transcription and stitching
+the per-chunk results back together.
+
+Chunks are cut in silences found by ffmpeg's silencedetect, close to every
+CHUNK_SECONDS. Where no silence is near, the cut is hard and the chunk's
+audio runs CHUNK_OVERLAP_SECONDS past it so the word crossing the cut is
+still heard whole. Every cue (or word) belongs to the chunk in which it
+starts; a leading cue of the next chunk that repeats the tail of the
+previous one is dropped.
+"""
+
+import os
+import re
+import subprocess
+import logging
+from srt_io import Cue
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SECONDS = float(os.getenv("CHUNK_SECONDS", "600"))
+CHUNK_SEARCH_SECONDS = float(os.getenv("CHUNK_SEARCH_SECONDS", "60"))
+CHUNK_OVERLAP_SECONDS = float(os.getenv("CHUNK_OVERLAP_SECONDS", "2"))
+SILENCE_NOISE_DB = os.getenv("SILENCE_NOISE_DB", "-35dB")
+SILENCE_MIN_SECONDS = float(os.getenv("SILENCE_MIN_SECONDS", "0.5"))
+
+SILENCE_PATTERN = re.compile(r"silence_(start|end): (-?[\d.]+)")
+WORD_PATTERN = re.compile(r"\w+")
+
+def detect_silences(file_path, audio_index):
+    """
+    Returns [(start, end)] silences in seconds for the selected audio stream.
+    """
+    result = subprocess.run([
+        "ffmpeg", "-nostdin", "-v", "info", "-i", file_path, "-map", f"0:a:{audio_index}", "-vn",
+        "-af", f"silencedetect=noise={SILENCE_NOISE_DB}:d={SILENCE_MIN_SECONDS}", "-f", "null", "-"
+    ], capture_output=True, text=True, check=True)
+    silences, start = [], None
+    for kind, value in SILENCE_PATTERN.findall(result.stderr):
+        if kind == "start":
+            start = max(0.0, float(value))
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    return silences
+
+def plan_chunks(duration, silences):
+    """
+    Returns [(start, end, overlap)] chunks in seconds covering the media.
+    end is where the next chunk starts; overlap is the extra audio sent past it.
+    """
+    chunks = []
+    start = 0.0
+    while duration - start > CHUNK_SECONDS + CHUNK_SEARCH_SECONDS:
+        target = start + CHUNK_SECONDS
+        candidates = [
+            (begin + end) / 2 for begin, end in silences
+            if target - CHUNK_SEARCH_SECONDS <= (begin + end) / 2 <= target + CHUNK_SEARCH_SECONDS
+        ]
+        if candidates:
+            cut = min(candidates, key=lambda point: abs(point - target))
+            chunks.append((start, cut, 0.0))
+        else:
+            cut = target
+            chunks.append((start, cut, CHUNK_OVERLAP_SECONDS))
+        start = cut
+    chunks.append((start, duration, 0.0))
+    return chunks
+
+def _words(text):
+    return WORD_PATTERN.findall(text.lower())
+
+def _repeats(previous, cue):
+    """
+    True if cue repeats previous: it overlaps it for most of its length or
+    its words (at least two, so a genuinely repeated "no" survives) are a
+    tail of previous's words.
+    """
+    overlap = min(previous.end, cue.end) - max(previous.start, cue.start)
+    if cue.end > cue.start and overlap > 0.5 * (cue.end - cue.start):
+        return True
+    words, previous_words = _words(cue.text), _words(previous.text)
+    return 2 <= len(words) <= len(previous_words) and previous_words[-len(words):] == words
+
+def stitch(chunks, results):
+    """
+    Shifts each chunk's cues by the chunk start, keeps the cues each chunk
+    owns and drops repeats at chunk boundaries. results[i] is the list of
+    Cue (timed relative to the chunk) returned for chunks[i].
+    """
+    stitched = []
+    for (start, end, _), cues in zip(chunks, results):
+        offset, limit = int(round(start * 1000)), int(round(end * 1000))
+        first = True
+        for cue in cues:
+            cue = Cue(cue.start + offset, cue.end + offset, cue.lines)
+            if cue.start >= limit:
+                continue
+            if first and stitched and _repeats(stitched[-1], cue):
+                logger.debug(f"Dropping repeated cue at chunk boundary {offset} ms: {cue.text!r}")
+                continue
+            first = False
+            stitched.append(cue)
+    return stitched
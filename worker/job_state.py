@@ -0,0 +1,148 @@
+"""
+Durable job state for the staged pipeline.
+
+Records, per job, every completed stage with the job as that stage handed
+it on (including its artifact paths), plus the job's current status. A job
+that is redelivered or retried skips the stages it has already completed
+and resumes at the first incomplete one.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+JOB_STATE_PATH = os.getenv("JOB_STATE_PATH", "/mediacenter/.arr-subs/job_state.db")
+# Finished and dead jobs are forgotten after this many seconds
+JOB_STATE_TTL = int(os.getenv("JOB_STATE_TTL", str(30 * 86400)))
+# Long-running workers prune again after this many checkpoints and finished
+# or failed jobs
+JOB_STATE_PRUNE_EVERY = int(os.getenv("JOB_STATE_PRUNE_EVERY", "1000"))
+
+class JobStateStore:
+    def __init__(self, path=JOB_STATE_PATH, ttl=JOB_STATE_TTL, prune_every=JOB_STATE_PRUNE_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._writes_since_prune = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                job TEXT NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (job_id, stage)
+            )
+        """)
+        self._db.commit()
+        self.prune()
+
+    def _set_status(self, job, stage, status, error=None):
+        self._db.execute(
+            "INSERT INTO jobs (job_id, file_path, status, stage, attempts, error, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (job_id) DO UPDATE SET status = excluded.status, stage = excluded.stage, "
+            "attempts = excluded.attempts, error = excluded.error, updated_at = excluded.updated_at",
+            (job["job_id"], job["file_path"], status, stage, job.get("attempts", 0), error, time.time())
+        )
+        self._db.commit()
+
+    def _count_write(self):
+        # Called with the lock held; True when a prune is due
+        self._writes_since_prune += 1
+        return self._writes_since_prune >= self.prune_every
+
+    def checkpoint(self, job_id, stage):
+        """
+        Returns the job as the stage completed it, or None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT job FROM checkpoints WHERE job_id = ? AND stage = ?", (job_id, stage)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def start_stage(self, job, stage):
+        with self._lock:
+            self._set_status(job, stage, "running")
+
+    def complete_stage(self, job, stage):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, stage, job, completed_at) VALUES (?, ?, ?, ?)",
+                (job["job_id"], stage, json.dumps(job), time.time())
+            )
+            self._set_status(job, stage, "completed")
+            due = self._count_write()
+        if due:
+            self.prune()
+
+    def finish(self, job, stage):
+        with self._lock:
+            self._set_status(job, stage, "done")
+            due = self._count_write()
+        if due:
+            self.prune()
+
+    def fail(self, job, stage, error, dead=False):
+        with self._lock:
+            self._set_status(job, stage, "dead" if dead else "retrying", error)
+            due = self._count_write()
+        if due:
+            self.prune()
+
+    def prune(self):
+        with self._lock:
+            self._writes_since_prune = 0
+            cutoff = time.time() - self.ttl
+            expired = [row[0] for row in self._db.execute(
+                "SELECT job_id FROM jobs WHERE status IN ('done', 'dead') AND updated_at < ?", (cutoff,)
+            )]
+            self._db.executemany("DELETE FROM checkpoints WHERE job_id = ?", [(job_id,) for job_id in expired])
+            self._db.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in expired])
+            self._db.commit()
+        if expired:
+            logger.info(f"Job state pruned {len(expired)} finished jobs")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_job_state():
+    """
+    Returns the process-wide job state store, or None if it cannot be opened.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = JobStateStore()
+            except Exception as e:
+                logger.error(f"Job state store unavailable at {JOB_STATE_PATH}: {str(e)}")
+                return None
+        return _store
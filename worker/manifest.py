@@ -0,0 +1,121 @@
+"""
+Sidecar manifest for make-style incremental processing.
+
+Next to each media file the worker keeps `<name>.arr-subs.json`, recording
+for every stage the fingerprints of its inputs, its parameters and the
+files it wrote. A stage is up to date when its inputs and parameters are
+unchanged and its outputs are still exactly what the pipeline last wrote.
+"""
+
+import os
+import json
+import fcntl
+import hashlib
+import logging
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# Media files are fingerprinted from their head and tail instead of a full
+# read; a remux or re-encode changes size, mtime or these bytes.
+SAMPLE_BYTES = 4 * 1024 * 1024
+
+def manifest_path(file_path):
+    return f"{os.path.splitext(file_path)[0]}.arr-subs.json"
+
+def media_fingerprint(file_path):
+    stat = os.stat(file_path)
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        digest.update(file.read(SAMPLE_BYTES))
+        if stat.st_size > 2 * SAMPLE_BYTES:
+            file.seek(-SAMPLE_BYTES, os.SEEK_END)
+            digest.update(file.read(SAMPLE_BYTES))
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+
+def file_fingerprint(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return {"size": os.path.getsize(file_path), "sha256": digest.hexdigest()}
+
+@contextlib.contextmanager
+def _locked(file_path):
+    # Stages of the same job may run in different threads or containers
+    with open(f"{manifest_path(file_path)}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load(file_path):
+    try:
+        with open(manifest_path(file_path), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {"stages": {}, "files": {}}
+
+def _save(file_path, manifest):
+    path = manifest_path(file_path)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_path, path)
+
+def pipeline_outputs(file_path):
+    """
+    Returns the set of paths the pipeline itself has written for file_path.
+    """
+    return set(load(file_path)["files"])
+
+def stage_output_fingerprint(file_path, stage, name):
+    record = load(file_path)["stages"].get(stage)
+    if not record:
+        return None
+    return record["output_fingerprints"].get(name)
+
+def is_fresh(file_path, stage, inputs, params):
+    """
+    Returns the stage's recorded outputs if it is up to date, otherwise None.
+    """
+    manifest = load(file_path)
+    record = manifest["stages"].get(stage)
+    if not record:
+        return None
+    if record["inputs"] != inputs:
+        logger.info(f"{stage} is stale for {file_path}: inputs changed")
+        return None
+    if record["params"] != params:
+        logger.info(f"{stage} is stale for {file_path}: parameters changed")
+        return None
+    for output_path in record["outputs"].values():
+        if not os.path.exists(output_path) or file_fingerprint(output_path) != manifest["files"].get(output_path):
+            logger.info(f"{stage} is stale for {file_path}: {output_path} is missing or was modified")
+            return None
+    return record["outputs"]
+
+def record_stage(file_path, stage, inputs, params, outputs):
+    """
+    Records a completed stage and fingerprints the files it wrote. Failing to
+    write the manifest only costs a re-run later, so it never fails the job.
+    """
+    try:
+        _record_stage(file_path, stage, inputs, params, outputs)
+    except OSError as e:
+        logger.warning(f"Could not update manifest for {file_path}: {str(e)}")
+
+def _record_stage(file_path, stage, inputs, params, outputs):
+    with _locked(file_path):
+        manifest = load(file_path)
+        output_fingerprints = {name: file_fingerprint(path) for name, path in outputs.items()}
+        manifest["stages"][stage] = {
+            "inputs": inputs,
+            "params": params,
+            "outputs": outputs,
+            "output_fingerprints": output_fingerprints
+        }
+        for name, path in outputs.items():
+            manifest["files"][path] = output_fingerprints[name]
+        _save(file_path, manifest)
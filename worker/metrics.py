@@ -0,0 +1,47 @@
+"""
+Prometheus metrics for the worker, served over HTTP on METRICS_PORT.
+
+Stage durations, in-flight jobs and queue depths are what GPU (transcribe)
+and CPU (align, translate) capacity should be sized from.
+"""
+
+import os
+import logging
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the metrics endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Stages run from seconds (checkpoint hits, short translations) to hours
+# (feature-length transcription on a busy GPU)
+STAGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+
+STAGE_DURATION = Histogram(
+    "worker_stage_duration_seconds", "Wall time of one pipeline stage for one job",
+    ["stage", "outcome"], buckets=STAGE_BUCKETS
+)
+JOBS_IN_FLIGHT = Gauge("worker_jobs_in_flight", "Jobs currently running a stage", ["stage"])
+DELIVERIES = Counter("worker_deliveries_total", "Messages delivered to stage consumers", ["stage", "redelivered"])
+RETRIES = Counter("worker_retries_total", "Failed stage runs sent to a retry queue", ["stage"])
+DEAD_LETTERED = Counter("worker_dead_lettered_total", "Jobs moved to the dead-letter queue", ["stage"])
+QUEUE_DEPTH = Gauge("worker_queue_depth", "Messages ready in a RabbitMQ queue", ["queue"])
+
+WHISPER_UPLOAD_BYTES = Counter("worker_whisper_upload_bytes_total", "Audio or media bytes uploaded to Whisper")
+WHISPER_REQUEST_DURATION = Histogram(
+    "worker_whisper_request_seconds", "Wall time of one Whisper request (whole file or chunk)",
+    ["endpoint"], buckets=STAGE_BUCKETS
+)
+
+TRANSLATED_CUES = Counter("worker_translated_cues_total", "Cues translated", ["source"])
+TRANSLATION_THROUGHPUT = Histogram(
+    "worker_translation_cues_per_second", "Cues per second of one subtitle translation",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+)
+
+def start_metrics_server():
+    if not METRICS_PORT:
+        return
+    start_http_server(METRICS_PORT)
+    logger.info(f"Serving metrics on port {METRICS_PORT}")
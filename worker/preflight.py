@@ -0,0 +1,156 @@
+"""
+Pre-flight checks that skip Whisper when usable subtitles already exist.
+
+Looks for a sidecar `.srt` or an embedded text subtitle stream in the target
+language (nothing left to do) or the source language (go straight to
+translation). Forced-only tracks are never used; SDH tracks only when no
+plain track exists.
+"""
+
+import os
+import re
+import json
+import logging
+import subprocess
+from google_lang import GOOGLE_LANG_CODES
+
+logger = logging.getLogger(__name__)
+
+TEXT_SUBTITLE_CODECS = {"subrip", "srt", "ass", "ssa", "mov_text", "webvtt", "text"}
+# ISO 639-2/B codes, common in Matroska language tags, for the ISO 639-2/T
+# codes the pipeline uses
+BIBLIOGRAPHIC_CODES = {
+    "bod": "tib", "ces": "cze", "cym": "wel", "deu": "ger", "ell": "gre", "eus": "baq",
+    "fas": "per", "fra": "fre", "hye": "arm", "isl": "ice", "kat": "geo", "mkd": "mac",
+    "mri": "mao", "msa": "may", "mya": "bur", "nld": "dut", "ron": "rum", "slk": "slo",
+    "sqi": "alb", "zho": "chi"
+}
+TERMINOLOGIC_CODES = {bibliographic: terminologic for terminologic, bibliographic in BIBLIOGRAPHIC_CODES.items()}
+SDH_TITLE_PATTERN = re.compile(r"\bsdh\b", re.IGNORECASE)
+# Whisper GPU seconds spent per second of media, used to report savings
+WHISPER_REALTIME_FACTOR = float(os.getenv("WHISPER_REALTIME_FACTOR", "0.1"))
+
+gpu_minutes_saved = 0.0
+
+def language_aliases(language):
+    language = TERMINOLOGIC_CODES.get(language.lower(), language.lower())
+    aliases = {language}
+    if language in GOOGLE_LANG_CODES:
+        aliases.add(GOOGLE_LANG_CODES[language])
+    if language in BIBLIOGRAPHIC_CODES:
+        aliases.add(BIBLIOGRAPHIC_CODES[language])
+    return aliases
+
+def find_sidecar(file_path, language, exclude=()):
+    base_path = os.path.splitext(file_path)[0]
+    for alias in sorted(language_aliases(language)):
+        candidate = f"{base_path}.{alias}.srt"
+        if os.path.exists(candidate) and candidate not in exclude:
+            return candidate
+    return None
+
+def probe_text_subtitles(file_path):
+    """
+    Returns [(subtitle index, language tag, forced, sdh)] for text subtitle
+    streams. sdh is set from the hearing_impaired disposition or, since few
+    muxers set that, an "SDH" in the track title.
+    """
+    try:
+        result = subprocess.run([
+            "ffprobe", "-v", "error", "-select_streams", "s",
+            "-show_entries", "stream=index,codec_name:stream_disposition=forced,hearing_impaired"
+                             ":stream_tags=language,title",
+            "-of", "json", file_path
+        ], capture_output=True, check=True, text=True, timeout=60)
+        streams = json.loads(result.stdout).get("streams", [])
+    except Exception as e:
+        logger.warning(f"Could not probe subtitle streams of {file_path}: {str(e)}")
+        return []
+    subtitles = []
+    for subtitle_index, stream in enumerate(streams):
+        if stream.get("codec_name") not in TEXT_SUBTITLE_CODECS:
+            continue
+        tags = stream.get("tags", {})
+        disposition = stream.get("disposition", {})
+        sdh = disposition.get("hearing_impaired") == 1 or bool(SDH_TITLE_PATTERN.search(tags.get("title", "")))
+        subtitles.append((subtitle_index, tags.get("language", "").lower(), disposition.get("forced") == 1, sdh))
+    return subtitles
+
+def extract_subtitle(file_path, subtitle_index, output_path):
+    subprocess.run([
+        "ffmpeg", "-nostdin", "-v", "error", "-i", file_path,
+        "-map", f"0:s:{subtitle_index}", "-c:s", "srt", "-y", output_path
+    ], check=True, timeout=600)
+    return output_path
+
+def find_embedded(streams, language):
+    """
+    Returns the subtitle index of the best full track in language: the first
+    plain one, else the first SDH one. Forced tracks only cover foreign
+    dialogue and are skipped.
+    """
+    aliases = language_aliases(language)
+    sdh_index = None
+    for subtitle_index, tag, forced, sdh in streams:
+        if tag not in aliases or forced:
+            continue
+        if not sdh:
+            return subtitle_index
+        if sdh_index is None:
+            sdh_index = subtitle_index
+    return sdh_index
+
+def media_duration(file_path):
+    try:
+        result = subprocess.run([
+            "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", file_path
+        ], capture_output=True, check=True, text=True, timeout=30)
+        return float(json.loads(result.stdout)["format"]["duration"])
+    except Exception:
+        return None
+
+def record_savings(job):
+    global gpu_minutes_saved
+    duration = job.get("duration") or media_duration(job["file_path"])
+    if duration:
+        saved = duration * WHISPER_REALTIME_FACTOR / 60
+        gpu_minutes_saved += saved
+        logger.info(f"Job {job['job_id']}: skipped Whisper, saved ~{saved:.1f} GPU minutes "
+                    f"({gpu_minutes_saved:.1f} total since start)")
+
+def run_preflight(job, target_language, exclude=()):
+    """
+    Returns "done" if target-language subtitles exist, "translate" with
+    job["synced_srt_path"] set if source-language subtitles exist, or None
+    if the file needs transcribing. Sidecars in exclude (the pipeline's own
+    outputs) are left to the manifest freshness checks.
+    """
+    file_path = job["file_path"]
+    base_path = os.path.splitext(file_path)[0]
+
+    target_srt = find_sidecar(file_path, target_language, exclude)
+    if target_srt:
+        logger.info(f"Job {job['job_id']}: found {target_language} sidecar {target_srt}, nothing to do")
+        job["translated_srt_path"] = target_srt
+        return "done"
+
+    source_srt = find_sidecar(file_path, job["source_language"], exclude)
+    if not source_srt:
+        streams = probe_text_subtitles(file_path)
+        subtitle_index = find_embedded(streams, target_language)
+        if subtitle_index is not None:
+            target_srt = extract_subtitle(file_path, subtitle_index, f"{base_path}.{target_language}.srt")
+            logger.info(f"Job {job['job_id']}: extracted embedded {target_language} subtitles to {target_srt}")
+            job["translated_srt_path"] = target_srt
+            return "done"
+
+        subtitle_index = find_embedded(streams, job["source_language"])
+        if subtitle_index is not None:
+            source_srt = extract_subtitle(file_path, subtitle_index, f"{base_path}.{job['source_language']}.srt")
+            logger.info(f"Job {job['job_id']}: extracted embedded {job['source_language']} subtitles to {source_srt}")
+
+    if source_srt:
+        logger.info(f"Job {job['job_id']}: using existing {job['source_language']} subtitles {source_srt}")
+        job["synced_srt_path"] = source_srt
+        return "translate"
+    return None
@@ -3,52 +3,354 @@ import json
 import pika
 import logging
 import time
-import requests
-from whisper_transcription import process_whisper_transcription
+import signal
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import manifest
+from whisper_transcription import process_whisper_transcription, WHISPER_MODEL
+from segmentation import segmentation_params
+from aeneas_sync import sync_subtitles
 from subtitle_translation import translate_srt
+from preflight import run_preflight, record_savings, media_duration
+from job_state import get_job_state
+import metrics
+import tracing
+from profiling import profiled, profile_path, profiling_enabled
 
 logger = logging.getLogger(__name__)
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
-WHISPER_URL = "http://whisper:9000/asr?encode=true&task=transcribe&word_timestamps=false&output=srt"
-AENEAS_URL = "http://aeneas:5001/sync"
 DEFAULT_TARGET_LANGUAGE = os.getenv("DEFAULT_TARGET_LANGUAGE", "eng")
+# Comma-separated subset of STAGES this worker consumes
+WORKER_STAGES = os.getenv("WORKER_STAGES", "transcribe,align,translate")
+QUEUE_DEPTH_INTERVAL = int(os.getenv("QUEUE_DEPTH_INTERVAL", "60"))
+# Job bodies run off the connection thread, so heartbeats keep flowing and
+# a short interval detects dead connections quickly
+RABBITMQ_HEARTBEAT = int(os.getenv("RABBITMQ_HEARTBEAT", "60"))
+# A delivery is acked only once its job has finished, so the broker's
+# consumer_timeout (30 minutes unless raised, as rabbitmq/arr-subs.conf does)
+# must exceed JOB_MAX_SECONDS, the longest a job may run (the aeneas job
+# timeout). Otherwise RabbitMQ closes the channel under a long job and
+# redelivers it. RABBITMQ_CONSUMER_TIMEOUT mirrors the broker setting in
+# seconds; 0 means the broker enforces none.
+RABBITMQ_CONSUMER_TIMEOUT = int(os.getenv("RABBITMQ_CONSUMER_TIMEOUT", "1800"))
+JOB_MAX_SECONDS = int(os.getenv("JOB_MAX_SECONDS", "14400"))
+# On SIGTERM, in-flight jobs get this long to finish. After that the worker
+# exits without acking them and RabbitMQ redelivers them to resume from
+# their checkpoints.
+SHUTDOWN_GRACE_SECONDS = int(os.getenv("SHUTDOWN_GRACE_SECONDS", "120"))
+# The transcribe stage holds up to SCHEDULER_WINDOW queued jobs and runs the
+# one with the lowest duration minus AGING_FACTOR * seconds waited, so short
+# media goes first but long media cannot starve. Held jobs are unacked
+# deliveries waiting behind the running one, so the window is capped to
+# what the consumer timeout allows (see scheduler_window); the default of 1
+# holds nothing beyond the running job.
+SCHEDULER_WINDOW = int(os.getenv("SCHEDULER_WINDOW", "1"))
+AGING_FACTOR = float(os.getenv("AGING_FACTOR", "1.0"))
+# "sjf" as above; "fifo" runs held jobs in arrival order. flask-app publishes
+# every non-urgent job at one priority, so this is the only duration ordering.
+SCHEDULING_POLICY = os.getenv("SCHEDULING_POLICY", "sjf")
+UNKNOWN_DURATION = 3600
+# A failed stage is retried after RETRY_BASE_DELAY * 2^(attempt - 1) seconds,
+# up to RETRY_MAX_ATTEMPTS times, then moved to DEAD_LETTER_QUEUE
+RETRY_BASE_DELAY = int(os.getenv("RETRY_BASE_DELAY", "60"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+DEAD_LETTER_QUEUE = os.getenv("DEAD_LETTER_QUEUE", "dead_jobs")
+# "aeneas" aligns Whisper's SRT in a separate pass; "words" builds cues from
+# Whisper word timestamps and skips alignment. WORD_TIMESTAMP_LANGUAGES
+# switches individual source languages to "words"; a job's "alignment"
+# field overrides both.
+ALIGNMENT_MODE = os.getenv("ALIGNMENT_MODE", "aeneas")
+WORD_TIMESTAMP_LANGUAGES = {
+    language.strip().lower() for language in os.getenv("WORD_TIMESTAMP_LANGUAGES", "").split(",") if language.strip()
+}
 
-def process_job(channel, method, properties, body):
+shutdown_event = threading.Event()
+# flask-app queues jobs without probing the media; scheduled stages probe the
+# duration here, off the connection thread, while the job waits in the window
+duration_probes = ThreadPoolExecutor(max_workers=2, thread_name_prefix="duration-probe")
+delivery_stats = {}
+delivery_stats_lock = threading.Lock()
+
+def alignment_mode(job):
+    if job.get("alignment") in ("aeneas", "words"):
+        return job["alignment"]
+    if job["source_language"].lower() in WORD_TIMESTAMP_LANGUAGES:
+        return "words"
+    return ALIGNMENT_MODE
+
+def up_to_date(job, stage_name, inputs, params):
+    """
+    Returns the recorded outputs of a stage whose inputs and parameters are
+    unchanged since it last ran, unless the job sets "force".
+    """
+    if job.get("force"):
+        return None
+    outputs = manifest.is_fresh(job["file_path"], stage_name, inputs, params)
+    if outputs:
+        logger.info(f"Job {job['job_id']}: {stage_name} is up to date, skipping")
+    return outputs
+
+def transcribe_stage(job):
+    file_path = job["file_path"]
+    if not job.get("force"):
+        # Skip Whisper (and alignment) when usable subtitles already exist
+        route = run_preflight(job, DEFAULT_TARGET_LANGUAGE, exclude=manifest.pipeline_outputs(file_path))
+        if route:
+            record_savings(job)
+            job["next_stage"] = "translate" if route == "translate" else None
+            return job
+
+    word_timestamps = alignment_mode(job) == "words"
+    inputs = {"media": manifest.media_fingerprint(file_path)}
+    params = {"model": WHISPER_MODEL, "language": job["source_language"], "word_timestamps": word_timestamps}
+    if word_timestamps:
+        params["segmentation"] = segmentation_params()
+    outputs = up_to_date(job, "transcribe", inputs, params)
+    if outputs:
+        record_savings(job)
+    else:
+        result = process_whisper_transcription(file_path, job["source_language"], word_timestamps)
+        if not result:
+            return None
+        outputs = {"srt": result["srt_path"]}
+        manifest.record_stage(file_path, "transcribe", inputs, params, outputs)
+
+    job["source_srt_path"] = outputs["srt"]
+    if word_timestamps:
+        # Cues built from word timings are already aligned
+        job["synced_srt_path"] = outputs["srt"]
+        job["next_stage"] = "translate"
+    return job
+
+def align_stage(job):
+    file_path = job["file_path"]
+    # Alignment rewrites the SRT in place, so its input is the file as
+    # transcription left it rather than whatever is on disk now
+    source_srt = (manifest.stage_output_fingerprint(file_path, "transcribe", "srt")
+                  or manifest.file_fingerprint(job["source_srt_path"]))
+    inputs = {"media": manifest.media_fingerprint(file_path), "srt": source_srt}
+    params = {"language": job["source_language"], "timing": job.get("timing")}
+    outputs = up_to_date(job, "align", inputs, params)
+    if outputs:
+        job["synced_srt_path"] = outputs["srt"]
+        return job
+
+    result = sync_subtitles(file_path, job["source_srt_path"], job["source_language"], job.get("timing"),
+                            profiling_enabled(job.get("profile")))
+    if not result:
+        return None
+    manifest.record_stage(file_path, "align", inputs, params, {"srt": result["synced_srt_path"]})
+    job["synced_srt_path"] = result["synced_srt_path"]
+    return job
+
+def translate_stage(job):
+    file_path = job["file_path"]
+    inputs = {"srt": manifest.file_fingerprint(job["synced_srt_path"])}
+    params = {"source": job["source_language"], "target": DEFAULT_TARGET_LANGUAGE}
+    outputs = up_to_date(job, "translate", inputs, params)
+    if outputs:
+        job["translated_srt_path"] = outputs["srt"]
+        return job
+
+    # Always translate to DEFAULT_TARGET_LANGUAGE
+    translated_srt_path = translate_srt(
+        job["synced_srt_path"], DEFAULT_TARGET_LANGUAGE, source_language=job["source_language"]
+    )
+    if not translated_srt_path:
+        return None
+    manifest.record_stage(file_path, "translate", inputs, params, {"srt": translated_srt_path})
+    job["translated_srt_path"] = translated_srt_path
+    return job
+
+# Each stage consumes its own durable queue and hands the job, with the
+# artifacts it produced, to the next stage's queue. A handler can set
+# job["next_stage"] to skip ahead (or to None to finish the pipeline).
+STAGES = {
+    "transcribe": {
+        "queue": "media_jobs",
+        # Must match the flask-app declaration of the priority queue
+        "arguments": {"x-max-priority": 10},
+        "next_queue": "align_jobs",
+        "handler": transcribe_stage,
+        "concurrency": int(os.getenv("TRANSCRIBE_CONCURRENCY", "1")),
+        "scheduled": True
+    },
+    "align": {
+        "queue": "align_jobs",
+        "next_queue": "translate_jobs",
+        "handler": align_stage,
+        "concurrency": int(os.getenv("ALIGN_CONCURRENCY", "1"))
+    },
+    "translate": {
+        "queue": "translate_jobs",
+        "next_queue": None,
+        "handler": translate_stage,
+        "concurrency": int(os.getenv("TRANSLATE_CONCURRENCY", "2"))
+    }
+}
+
+def retry_queue(stage, attempt):
+    return f"{stage['queue']}.retry.{attempt}"
+
+def retry_delay(attempt):
+    return RETRY_BASE_DELAY * 2 ** (attempt - 1)
+
+def declare_queues(channel):
+    for stage in STAGES.values():
+        channel.queue_declare(queue=stage["queue"], durable=True, arguments=stage.get("arguments"))
+        # One delay queue per attempt: messages wait out their expiration
+        # and are then dead-lettered back onto the stage queue. The delay is
+        # set per message, not as a queue TTL, so changing RETRY_BASE_DELAY
+        # does not change the queue arguments. Queues declared with the
+        # older x-message-ttl argument must be deleted once.
+        for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+            channel.queue_declare(queue=retry_queue(stage, attempt), durable=True, arguments={
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": stage["queue"]
+            })
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+
+def publish_job(channel, queue_name, job, traceparent=None, expiration_ms=None):
+    channel.basic_publish(
+        exchange="",
+        routing_key=queue_name,
+        body=json.dumps(job),
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            priority=job.get("priority"),
+            expiration=str(expiration_ms) if expiration_ms is not None else None,
+            headers={tracing.TRACEPARENT_HEADER: traceparent} if traceparent else None
+        )
+    )
+
+def retry_or_dead_letter(channel, job, stage_name, error, traceparent=None):
+    """
+    Sends a failed job to the next delay queue of its stage, or to the
+    dead-letter queue once RETRY_MAX_ATTEMPTS is exhausted.
+    """
+    state = get_job_state()
+    job["attempts"] = job.get("attempts", 0) + 1
+    job["last_error"] = error
+    if job["attempts"] > RETRY_MAX_ATTEMPTS:
+        job["failed_stage"] = stage_name
+        publish_job(channel, DEAD_LETTER_QUEUE, job, traceparent)
+        metrics.DEAD_LETTERED.labels(stage_name).inc()
+        if state:
+            state.fail(job, stage_name, error, dead=True)
+        logger.error(f"Job {job['job_id']}: {stage_name} failed {RETRY_MAX_ATTEMPTS + 1} times, "
+                     f"moved to {DEAD_LETTER_QUEUE}: {error}")
+        return
+    delay = retry_delay(job["attempts"])
+    publish_job(channel, retry_queue(STAGES[stage_name], job["attempts"]), job, traceparent, delay * 1000)
+    metrics.RETRIES.labels(stage_name).inc()
+    if state:
+        state.fail(job, stage_name, error)
+    logger.warning(f"Job {job['job_id']}: {stage_name} failed ({error}), retry {job['attempts']} in {delay}s")
+
+def run_stage(job, stage_name):
+    """
+    Runs a stage handler unless a checkpoint shows the stage already
+    completed for this job, and checkpoints the result.
+    """
+    state = get_job_state()
+    if state:
+        checkpoint = state.checkpoint(job["job_id"], stage_name)
+        if checkpoint:
+            logger.info(f"Job {job['job_id']}: {stage_name} already completed, resuming from checkpoint")
+            return checkpoint
+        state.start_stage(job, stage_name)
+    result = STAGES[stage_name]["handler"](job)
+    if result:
+        result.pop("attempts", None)
+        result.pop("last_error", None)
+        if state:
+            state.complete_stage(result, stage_name)
+    return result
+
+def decode_job(channel, method, body, stage_name):
+    """
+    Returns the job in body, or None after dead-lettering an undecodable message.
+    """
     try:
         job = json.loads(body.decode("utf-8"))
-        job_id = job["job_id"]
-        media_type = job["type"]
-        file_path = job["file_path"]
-        source_language = job["source_language"]
-
-        logger.info(f"Processing job {job_id} ({media_type}): {file_path}")
-
-        # Perform transcription and processing
-        result = process_whisper_transcription(file_path, source_language)
-        
-        if result:
-            # Always translate to DEFAULT_TARGET_LANGUAGE
-            translated_srt_path = translate_srt(result['synced_srt_path'], DEFAULT_TARGET_LANGUAGE)
-            
-            if translated_srt_path:
-                logger.info(f"Job {job_id}: Translation completed successfully")
-            else:
-                logger.error(f"Job {job_id}: Translation failed")
-        
-    except Exception as e:
-        logger.error(f"Failed to process message: {str(e)}")
-    finally:
+        missing = [key for key in ("job_id", "type", "file_path") if key not in job]
+        if missing:
+            raise KeyError(f"missing {', '.join(missing)}")
+        return job
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"[{stage_name}] Dead-lettering undecodable message: {str(e)}")
+        channel.basic_publish(exchange="", routing_key=DEAD_LETTER_QUEUE, body=body,
+                              properties=pika.BasicProperties(delivery_mode=2))
         channel.basic_ack(delivery_tag=method.delivery_tag)
+        return None
+
+def execute_job(job, stage_name, traceparent=None):
+    """
+    Runs the stage for job in a span continuing the trace of the message
+    (traceparent) and, if the job asks for it, under cProfile. Called on a
+    job thread, never on the connection thread, so it may block for hours.
+    Returns the stage span's traceparent for the messages it leads to.
+    """
+    start_time = time.monotonic()
+    with tracing.span(stage_name, parent=traceparent, kind="consumer", job_id=job["job_id"],
+                      request_id=job.get("request_id", ""), file_path=job["file_path"],
+                      attempt=job.get("attempts", 0)) as span:
+        logger.info(f"[{stage_name}] Processing job {job['job_id']} ({job['type']}) "
+                    f"in trace {span.trace_id}: {job['file_path']}")
+        with metrics.JOBS_IN_FLIGHT.labels(stage_name).track_inprogress(), \
+                profiled(profile_path(job["file_path"], stage_name), profiling_enabled(job.get("profile"))):
+            try:
+                result = run_stage(dict(job), stage_name)
+                error = None if result else f"{stage_name} stage returned no result"
+            except Exception as e:
+                result, error = None, str(e)
+        if error:
+            span.error = error
+    elapsed = time.monotonic() - start_time
+    metrics.STAGE_DURATION.labels(stage_name, "success" if result else "failure").observe(elapsed)
+    return result, error, elapsed, span.traceparent
+
+def complete_job(channel, method, job, stage_name, result, error, elapsed, traceparent):
+    """
+    Publishes the job's successor, as a child of the stage span
+    (traceparent), and acks it. Runs on the connection thread.
+    """
+    stage = STAGES[stage_name]
+    job_id = job["job_id"]
+    # The message is acked only after its successor (next stage, retry or
+    # dead letter) has been published, so a crash in between redelivers it
+    # and the checkpoint prevents the work from being redone.
+    if not result:
+        logger.error(f"Job {job_id}: {stage_name} stage failed after {elapsed:.1f}s")
+        retry_or_dead_letter(channel, job, stage_name, error, traceparent)
+    else:
+        next_queue = stage["next_queue"]
+        if "next_stage" in result:
+            next_stage = result.pop("next_stage")
+            next_queue = STAGES[next_stage]["queue"] if next_stage else None
+
+        if next_queue:
+            publish_job(channel, next_queue, result, traceparent)
+            logger.info(f"Job {job_id}: {stage_name} completed in {elapsed:.1f}s, handed to {next_queue}")
+        else:
+            logger.info(f"Job {job_id}: {stage_name} completed in {elapsed:.1f}s, pipeline finished")
+            if get_job_state():
+                get_job_state().finish(result, stage_name)
+            if job.get("enqueued_at"):
+                logger.info(f"Job {job_id}: time to subtitle {time.time() - job['enqueued_at']:.0f}s "
+                            f"(duration {job.get('duration')}s, priority {job.get('priority')})")
+    channel.basic_ack(delivery_tag=method.delivery_tag)
 
 def connect_to_rabbitmq():
-    while True:
+    while not shutdown_event.is_set():
         logger.info("Attempting to connect to RabbitMQ...")
         try:
             connection = pika.BlockingConnection(
                 pika.ConnectionParameters(
                     host=RABBITMQ_HOST,
-                    heartbeat=600,
+                    heartbeat=RABBITMQ_HEARTBEAT,
                     blocked_connection_timeout=300
                 )
             )
@@ -56,27 +358,225 @@ def connect_to_rabbitmq():
             return connection
         except pika.exceptions.AMQPConnectionError:
             logger.warning("RabbitMQ is not ready. Retrying in 5 seconds...")
-            time.sleep(5)
+            shutdown_event.wait(5)
+    return None
+
+def fill_duration(job):
+    job["duration"] = media_duration(job["file_path"])
+
+def scheduler_window():
+    """
+    Deliveries a scheduled stage may hold. The last one in the window waits
+    for up to window - 1 jobs and then runs itself, all unacked, so
+    window * JOB_MAX_SECONDS must fit in the broker's consumer_timeout.
+    """
+    if RABBITMQ_CONSUMER_TIMEOUT <= 0:
+        return max(1, SCHEDULER_WINDOW)
+    return max(1, min(SCHEDULER_WINDOW, RABBITMQ_CONSUMER_TIMEOUT // JOB_MAX_SECONDS))
+
+def scheduling_score(job, received_at):
+    if job.get("urgent"):
+        return float("-inf")
+    waited = time.time() - job.get("enqueued_at", received_at)
+    return (job.get("duration") or UNKNOWN_DURATION) - AGING_FACTOR * waited
+
+def record_delivery(stage_name, method):
+    metrics.DELIVERIES.labels(stage_name, str(bool(method.redelivered)).lower()).inc()
+    with delivery_stats_lock:
+        stats = delivery_stats.setdefault(stage_name, {"delivered": 0, "redelivered": 0})
+        stats["delivered"] += 1
+        if method.redelivered:
+            stats["redelivered"] += 1
+            logger.warning(f"[{stage_name}] Redelivered message {method.delivery_tag} "
+                           f"({stats['redelivered']} of {stats['delivered']} deliveries redelivered)")
+
+def consume(connection, channel, stage_name, executor):
+    """
+    Consumes one stage queue. Job bodies run on a separate job thread while
+    this thread keeps servicing the connection (heartbeats included); the
+    result is published and acked back here via add_callback_threadsafe.
+
+    Scheduled stages buffer up to scheduler_window() unacked deliveries and
+    run them in shortest-job-first order with aging. Unacked messages stay
+    in RabbitMQ, so nothing is lost if the worker dies while holding them.
+
+    Returns once shutdown_event is set and the in-flight job has finished.
+    A job still running after SHUTDOWN_GRACE_SECONDS is never requeued from
+    here: another worker would start it while this thread keeps writing its
+    checkpoints. main() exits the process instead, and the broker redelivers
+    the job once the connection is gone.
+    """
+    stage = STAGES[stage_name]
+    scheduled = stage.get("scheduled")
+    pending = []
+    in_flight = {}
+
+    def on_message(channel, method, properties, body):
+        record_delivery(stage_name, method)
+        job = decode_job(channel, method, body, stage_name)
+        if job:
+            traceparent = (properties.headers or {}).get(tracing.TRACEPARENT_HEADER)
+            if scheduled and SCHEDULING_POLICY == "sjf" and job.get("duration") is None:
+                # Add the key here so the probe only ever replaces a value
+                job["duration"] = None
+                duration_probes.submit(fill_duration, job)
+            pending.append((job, time.time(), method, traceparent))
+
+    def on_done(method, job, traceparent, started_at, future):
+        try:
+            result, error, elapsed, traceparent = future.result()
+        except Exception as e:
+            # Raised around the stage rather than by it (tracing, metrics,
+            # profiler); the job is still retried or dead-lettered, and
+            # in_flight is cleared so the consumer moves on
+            logger.error(f"[{stage_name}] Job {job['job_id']} failed outside its stage: {str(e)}")
+            result, error, elapsed = None, str(e), time.monotonic() - started_at
+
+        def finish():
+            in_flight.pop(method.delivery_tag, None)
+            complete_job(channel, method, job, stage_name, result, error, elapsed, traceparent)
+        try:
+            connection.add_callback_threadsafe(finish)
+        except Exception as e:
+            # The delivery is redelivered on the new connection and resumes
+            # from the checkpoint this job just wrote
+            logger.warning(f"[{stage_name}] Connection gone before job {job['job_id']} could be acked: {str(e)}")
+
+    window = scheduler_window() if scheduled else 1
+    channel.basic_qos(prefetch_count=window)
+    consumer_tag = channel.basic_consume(queue=stage["queue"], on_message_callback=on_message)
+    mode = f"{SCHEDULING_POLICY}, window {window}" if scheduled else "FIFO"
+    logger.info(f"[{stage_name}] Consumer is waiting for jobs ({mode})...")
+    while True:
+        if shutdown_event.is_set() and consumer_tag:
+            # Stop taking work and hand back everything not yet started
+            channel.basic_cancel(consumer_tag)
+            consumer_tag = None
+            for _, _, method, _ in pending:
+                channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            pending.clear()
+            if in_flight:
+                logger.info(f"[{stage_name}] Shutting down, waiting up to {SHUTDOWN_GRACE_SECONDS}s "
+                            f"for the in-flight job")
+        if consumer_tag is None and not in_flight:
+            return
+
+        if pending and not in_flight:
+            if scheduled and SCHEDULING_POLICY == "sjf":
+                item = min(pending, key=lambda entry: scheduling_score(entry[0], entry[1]))
+            else:
+                item = pending[0]
+            pending.remove(item)
+            job, _, method, traceparent = item
+            in_flight[method.delivery_tag] = method
+            future = executor.submit(execute_job, job, stage_name, traceparent)
+            future.add_done_callback(functools.partial(on_done, method, job, traceparent, time.monotonic()))
+
+        connection.process_data_events(time_limit=1)
+
+def run_consumer(stage_name):
+    """
+    Consumes one stage queue on a dedicated connection, reconnecting on failure.
+    pika connections are not thread-safe, so every consumer thread owns one.
+    """
+    # One job thread per consumer, kept across reconnects: a job still
+    # running from a dropped connection finishes before the redelivered
+    # copy starts, which then resumes from its checkpoint
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{stage_name}-job")
+    while not shutdown_event.is_set():
+        connection = connect_to_rabbitmq()
+        if connection is None:
+            break
+        try:
+            channel = connection.channel()
+            declare_queues(channel)
+            consume(connection, channel, stage_name, executor)
+        except pika.exceptions.AMQPConnectionError as e:
+            logger.warning(f"[{stage_name}] Lost connection to RabbitMQ: {str(e)}")
+        except Exception as e:
+            logger.error(f"[{stage_name}] Unexpected error: {str(e)}")
+        finally:
+            if not connection.is_closed:
+                connection.close()
+        shutdown_event.wait(5)
+    executor.shutdown(wait=False)
+    logger.info(f"[{stage_name}] Consumer stopped")
+
+def get_queue_depths(channel):
+    queues = [stage["queue"] for stage in STAGES.values()] + [DEAD_LETTER_QUEUE]
+    depths = {queue: channel.queue_declare(queue=queue, passive=True).method.message_count for queue in queues}
+    for queue, depth in depths.items():
+        metrics.QUEUE_DEPTH.labels(queue).set(depth)
+    return depths
+
+def monitor_queue_depths():
+    while not shutdown_event.is_set():
+        connection = connect_to_rabbitmq()
+        if connection is None:
+            return
+        try:
+            channel = connection.channel()
+            while not shutdown_event.is_set():
+                logger.info(f"Queue depths: {get_queue_depths(channel)}")
+                with delivery_stats_lock:
+                    logger.info(f"Deliveries: {delivery_stats}")
+                connection.sleep(QUEUE_DEPTH_INTERVAL)
+        except Exception as e:
+            logger.warning(f"Queue depth monitor error: {str(e)}")
+        finally:
+            if not connection.is_closed:
+                connection.close()
+        shutdown_event.wait(5)
+
+def request_shutdown(signum, frame):
+    logger.info(f"Received signal {signum}, finishing in-flight jobs before exiting...")
+    shutdown_event.set()
 
 def main():
     logger.info("Starting the worker...")
-    connection = connect_to_rabbitmq()
-    channel = connection.channel()
-    
-    channel.queue_declare(queue="media_jobs", durable=True)
-    channel.basic_qos(prefetch_count=1)
-    
-    channel.basic_consume(queue="media_jobs", on_message_callback=process_job)
-    logger.info("Worker is waiting for jobs...")
+    stage_names = [name.strip() for name in WORKER_STAGES.split(",") if name.strip()]
+    unknown = [name for name in stage_names if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown worker stages: {', '.join(unknown)}")
 
-    try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        logger.info("Worker interrupted, shutting down...")
-        connection.close()
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        connection.close()
+    if 0 < RABBITMQ_CONSUMER_TIMEOUT < JOB_MAX_SECONDS:
+        logger.warning(f"RabbitMQ consumer_timeout ({RABBITMQ_CONSUMER_TIMEOUT}s) is shorter than JOB_MAX_SECONDS "
+                       f"({JOB_MAX_SECONDS}s): longer jobs lose their delivery and are run again")
+    if scheduler_window() < SCHEDULER_WINDOW:
+        logger.warning(f"SCHEDULER_WINDOW {SCHEDULER_WINDOW} reduced to {scheduler_window()}: buffered jobs "
+                       f"would outlive the {RABBITMQ_CONSUMER_TIMEOUT}s consumer timeout")
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+    metrics.start_metrics_server()
+
+    threads = [threading.Thread(target=monitor_queue_depths, name="queue-depth", daemon=True)]
+    consumers = []
+    for stage_name in stage_names:
+        for index in range(STAGES[stage_name]["concurrency"]):
+            consumers.append(threading.Thread(
+                target=run_consumer, args=(stage_name,), name=f"{stage_name}-{index}", daemon=True
+            ))
+    for thread in threads + consumers:
+        thread.start()
+    logger.info(f"Worker started stages: {', '.join(stage_names)}")
+
+    while not shutdown_event.is_set():
+        shutdown_event.wait(1)
+    duration_probes.shutdown(wait=False, cancel_futures=True)
+    deadline = time.monotonic() + SHUTDOWN_GRACE_SECONDS
+    for thread in consumers:
+        thread.join(timeout=max(0, deadline - time.monotonic()))
+    running = sum(1 for thread in consumers if thread.is_alive())
+    if running:
+        # Exiting here, rather than letting the job threads (which are not
+        # daemon threads) keep the process alive, stops them along with
+        # their connections, so no job runs twice
+        logger.warning(f"{running} consumers still had a job running after {SHUTDOWN_GRACE_SECONDS}s, "
+                       f"exiting; RabbitMQ redelivers their jobs")
+        logging.shutdown()
+        os._exit(1)
+    logger.info("Worker stopped")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,87 @@
+"""
+Builds subtitle cues from Whisper word timestamps.
+
+Words are packed greedily into cues, starting a new cue at a pause, when
+the cue would run longer than the maximum duration, when its text would no
+longer fit the line layout, or after sentence-ending punctuation once the
+cue holds a full line.
+"""
+
+import os
+from srt_io import Cue
+
+SEGMENT_MAX_LINE_CHARS = int(os.getenv("SEGMENT_MAX_LINE_CHARS", "42"))
+SEGMENT_MAX_LINES = int(os.getenv("SEGMENT_MAX_LINES", "2"))
+SEGMENT_MAX_DURATION_MS = int(os.getenv("SEGMENT_MAX_DURATION_MS", "7000"))
+SEGMENT_PAUSE_MS = int(os.getenv("SEGMENT_PAUSE_MS", "600"))
+
+SENTENCE_END = (".", "?", "!", "…")
+
+def segmentation_params():
+    return {
+        "max_line_chars": SEGMENT_MAX_LINE_CHARS,
+        "max_lines": SEGMENT_MAX_LINES,
+        "max_duration_ms": SEGMENT_MAX_DURATION_MS,
+        "pause_ms": SEGMENT_PAUSE_MS
+    }
+
+def words_from_whisper(result):
+    """
+    Returns [(text, start_ms, end_ms)] from a Whisper JSON result. Segments
+    without word timings are used as a single word.
+    """
+    words = []
+    for segment in result.get("segments", []):
+        segment_words = segment.get("words") or [
+            {"word": segment.get("text", ""), "start": segment["start"], "end": segment["end"]}
+        ]
+        for word in segment_words:
+            text = word.get("word", "").strip()
+            if text and word.get("start") is not None and word.get("end") is not None:
+                words.append((text, int(round(word["start"] * 1000)), int(round(word["end"] * 1000))))
+    return words
+
+def wrap(words, max_line_chars):
+    """
+    Greedily wraps words into lines of at most max_line_chars (a single
+    longer word gets a line of its own).
+    """
+    lines, current = [], ""
+    for word in words:
+        candidate = f"{current} {word}" if current else word
+        if current and len(candidate) > max_line_chars:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines
+
+def segment(words, max_line_chars=SEGMENT_MAX_LINE_CHARS, max_lines=SEGMENT_MAX_LINES,
+            max_duration_ms=SEGMENT_MAX_DURATION_MS, pause_ms=SEGMENT_PAUSE_MS):
+    """
+    Returns a list of Cue built from [(text, start_ms, end_ms)] words.
+    """
+    cues = []
+    current = []
+
+    def flush():
+        if current:
+            texts = [text for text, _, _ in current]
+            cues.append(Cue(current[0][1], current[-1][2], wrap(texts, max_line_chars)))
+            current.clear()
+
+    for word in words:
+        text, start, end = word
+        if current:
+            previous_text, _, previous_end = current[-1]
+            chars = sum(len(t) + 1 for t, _, _ in current)
+            if (start - previous_end >= pause_ms
+                    or end - current[0][1] > max_duration_ms
+                    or len(wrap([t for t, _, _ in current] + [text], max_line_chars)) > max_lines
+                    or (previous_text.endswith(SENTENCE_END) and chars >= max_line_chars)):
+                flush()
+        current.append(word)
+    flush()
+    return cues
@@ -1,95 +1,190 @@
 import os
+import re
 import logging
 import time
+import threading
 import traceback
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from googletrans import Translator
 from google_lang import GOOGLE_LANG_CODES
+from translation_memory import get_translation_memory
+from srt_io import read_cues, write_cues
+from metrics import TRANSLATED_CUES, TRANSLATION_THROUGHPUT
+import tracing
 
 logger = logging.getLogger(__name__)
 translator = Translator()
 
 DEFAULT_TARGET_LANGUAGE = os.getenv("DEFAULT_TARGET_LANGUAGE", "eng")
 
-def translate_srt(input_srt_path, target_language=None):
+# Batched mode packs many cues into a single translate() request and runs a
+# bounded number of those requests in parallel.
+TRANSLATION_MODE = os.getenv("TRANSLATION_MODE", "batched")
+TRANSLATION_BATCH_CHARS = int(os.getenv("TRANSLATION_BATCH_CHARS", "4000"))
+TRANSLATION_BATCH_CUES = int(os.getenv("TRANSLATION_BATCH_CUES", "50"))
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", "4"))
+TRANSLATION_MAX_RETRIES = 3
+# "google" uses googletrans; "libretranslate" posts to TRANSLATION_URL, any
+# service speaking the LibreTranslate /translate API (language codes are
+# passed as in GOOGLE_LANG_CODES)
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "google")
+TRANSLATION_URL = os.getenv("TRANSLATION_URL", "http://libretranslate:5000/translate")
+TRANSLATION_API_KEY = os.getenv("TRANSLATION_API_KEY", "")
+
+# Cue separator inside a batch. A bare marker on its own line survives
+# translation; the split pattern tolerates whitespace the translator adds.
+BATCH_DELIMITER = "\n###\n"
+BATCH_SPLIT_PATTERN = re.compile(r"\s*#\s*#\s*#\s*")
+
+_thread_local = threading.local()
+
+def _get_translator():
+    # googletrans keeps one HTTP client per Translator, which is not safe to
+    # share between threads.
+    if threading.current_thread() is threading.main_thread():
+        return translator
+    if not hasattr(_thread_local, "translator"):
+        _thread_local.translator = Translator()
+    return _thread_local.translator
+
+def _translate_libretranslate(text, google_lang):
+    body = {"q": text, "source": "auto", "target": google_lang, "format": "text"}
+    if TRANSLATION_API_KEY:
+        body["api_key"] = TRANSLATION_API_KEY
+    response = requests.post(TRANSLATION_URL, json=body, headers=tracing.inject(), timeout=30)
+    response.raise_for_status()
+    return response.json()["translatedText"]
+
+def _translate_text(text, google_lang):
+    for attempt in range(TRANSLATION_MAX_RETRIES):
+        try:
+            if TRANSLATION_BACKEND == "libretranslate":
+                return _translate_libretranslate(text, google_lang)
+            return _get_translator().translate(text, dest=google_lang, timeout=10).text
+        except Exception:
+            if attempt == TRANSLATION_MAX_RETRIES - 1:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Translation attempt {attempt + 1} failed, retrying in {delay}s...")
+            time.sleep(delay)
+
+def _make_batches(texts):
+    """
+    Splits cue texts into (start, end) index ranges bounded by cue count and size.
+    """
+    batches = []
+    start, size = 0, 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= TRANSLATION_BATCH_CUES or size + len(text) > TRANSLATION_BATCH_CHARS):
+            batches.append((start, i))
+            start, size = i, 0
+        size += len(text) + len(BATCH_DELIMITER)
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+def _translate_batch(texts, google_lang):
+    translated = BATCH_SPLIT_PATTERN.split(_translate_text(BATCH_DELIMITER.join(texts), google_lang).strip())
+    if len(translated) == len(texts):
+        return [t.strip() for t in translated]
+    # The translator merged or dropped a delimiter; fall back to one request per cue
+    logger.warning(f"Batch of {len(texts)} cues came back as {len(translated)} parts, translating cue by cue")
+    return [_translate_text(text, google_lang) for text in texts]
+
+def _translate_cues_batched(texts, google_lang):
+    results = [None] * len(texts)
+    batches = _make_batches(texts)
+    logger.info(f"Translating {len(texts)} cues in {len(batches)} batches with {TRANSLATION_WORKERS} workers")
+
+    def run(batch):
+        start, end = batch
+        results[start:end] = _translate_batch(texts[start:end], google_lang)
+
+    with ThreadPoolExecutor(max_workers=TRANSLATION_WORKERS) as executor:
+        # list() re-raises the first failure from any batch
+        list(executor.map(run, batches))
+    return results
+
+def _translate_cues_per_cue(texts, google_lang):
+    results = []
+    for i, text in enumerate(texts, 1):
+        results.append(_translate_text(text, google_lang))
+        if i % 100 == 0:
+            logger.debug(f"Translated {i}/{len(texts)} subtitles")
+    return results
+
+def translate_srt(input_srt_path, target_language=None, mode=None, source_language=None):
     try:
         target_language = target_language or DEFAULT_TARGET_LANGUAGE
+        mode = mode or TRANSLATION_MODE
         google_lang = GOOGLE_LANG_CODES.get(target_language.lower())
-        
+
         if not google_lang:
             logger.error(f"No Google Translate language code found for {target_language}")
             return None
-            
-        logger.info(f"Starting translation to: {target_language} (Google code: {google_lang})")
-        
+
+        logger.info(f"Starting translation to: {target_language} (Google code: {google_lang}, mode: {mode})")
+
         if not os.path.exists(input_srt_path):
             logger.error(f"Input SRT file not found: {input_srt_path}")
             return None
-        
+
         base_path = input_srt_path.rsplit('.', 2)[0]
         output_srt_path = f"{base_path}.{target_language}.srt"
         logger.info(f"Will save translated file to: {output_srt_path}")
 
         try:
-            with open(input_srt_path, "r", encoding="utf-8") as file:
-                lines = file.readlines()
+            cues = read_cues(input_srt_path)
         except Exception as e:
             logger.error(f"Error reading input SRT file: {str(e)}")
             return None
 
-        total_lines = len(lines)
-        logger.info(f"Total lines to process: {total_lines}")
-
-        translated_lines = []
-        buffer = []
-        current_subtitle = 1
-
-        for line_num, line in enumerate(lines, 1):
-            try:
-                stripped_line = line.strip()
-                if stripped_line == "":
-                    if buffer:
-                        original_text = " ".join(buffer)
-                        logger.info(f"Translating subtitle {current_subtitle} of {total_lines//4}")
-                        
-                        # Add retry logic for translation
-                        max_retries = 3
-                        for attempt in range(max_retries):
-                            try:
-                                translated_text = translator.translate(
-                                    original_text, 
-                                    dest=google_lang,
-                                    timeout=10
-                                ).text
-                                translated_lines.append(translated_text)
-                                break
-                            except Exception as e:
-                                if attempt == max_retries - 1:
-                                    raise
-                                logger.warning(f"Translation attempt {attempt + 1} failed, retrying...")
-                                time.sleep(2)
-                        
-                        buffer = []
-                        current_subtitle += 1
-                    translated_lines.append("")
-                elif stripped_line.isdigit():
-                    translated_lines.append(stripped_line)
-                elif "-->" in stripped_line:
-                    translated_lines.append(stripped_line)
-                else:
-                    buffer.append(stripped_line)
-
-                # Write progress periodically
-                if line_num % 100 == 0:
-                    logger.info(f"Processed {line_num}/{total_lines} lines")
-
-            except Exception as e:
-                logger.error(f"Error translating line {line_num}: {str(e)}")
-                logger.error(f"Line content: {stripped_line}")
-                raise
+        texts = [" ".join(cue.lines) for cue in cues]
+        logger.info(f"Total subtitles to process: {len(cues)}")
+
+        # Cues without text are copied through untranslated
+        translated_texts = list(texts)
+        source_language = source_language or "auto"
+        memory = get_translation_memory()
+        remembered = {}
+        if memory:
+            remembered = memory.get_many([text for text in texts if text], source_language, target_language)
+        pending = [i for i, text in enumerate(texts) if text and text not in remembered]
+        unique_texts = list(dict.fromkeys(texts[i] for i in pending))
+        # Empty cues are neither remembered nor translated
+        remembered_cues = sum(1 for text in texts if text in remembered)
+        logger.info(f"Translation memory: {remembered_cues} subtitles remembered, {len(unique_texts)} unique texts to translate")
+
+        start_time = time.monotonic()
+        with tracing.span("translate.requests", kind="client", mode=mode, target=target_language,
+                          cues=len(texts), unique_texts=len(unique_texts)):
+            if mode == "batched":
+                results = _translate_cues_batched(unique_texts, google_lang)
+            else:
+                results = _translate_cues_per_cue(unique_texts, google_lang)
+        translations = dict(zip(unique_texts, results))
+        if memory and translations:
+            memory.put_many(translations, source_language, target_language)
+        translations.update(remembered)
+        for i, text in enumerate(texts):
+            if text:
+                translated_texts[i] = translations[text]
+        elapsed = time.monotonic() - start_time
+        cues_per_second = len(cues) / elapsed if elapsed > 0 else 0.0
+        TRANSLATED_CUES.labels("translator").inc(len(unique_texts))
+        TRANSLATED_CUES.labels("memory").inc(remembered_cues)
+        if elapsed > 0:
+            TRANSLATION_THROUGHPUT.observe(cues_per_second)
+        logger.info(f"Translated {len(cues)} subtitles in {elapsed:.1f}s ({cues_per_second:.1f} cues/s, mode: {mode})")
+        if memory:
+            logger.info(f"Translation memory stats: {memory.stats()}")
+
+        for cue, translated_text in zip(cues, translated_texts):
+            cue.lines = [translated_text] if translated_text else []
 
         logger.info("Writing translated subtitles to file...")
-        with open(output_srt_path, "w", encoding="utf-8") as file:
-            file.write("\n".join(translated_lines))
+        write_cues(output_srt_path, cues)
 
         logger.info(f"Translation completed successfully: {output_srt_path}")
         return output_srt_path
@@ -97,4 +192,4 @@ def translate_srt(input_srt_path, target_language=None):
     except Exception as e:
         logger.error(f"Translation failed with error: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,176 @@
+"""
+Persistent translation memory for subtitle text.
+
+Translations are stored in SQLite keyed by normalized source text, source
+language and target language, with a bounded in-process LRU in front.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "/mediacenter/.arr-subs/translation_memory.db")
+TRANSLATION_MEMORY_LRU_SIZE = int(os.getenv("TRANSLATION_MEMORY_LRU_SIZE", "10000"))
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.getenv("TRANSLATION_MEMORY_MAX_ENTRIES", "500000"))
+TRANSLATION_MEMORY_MAX_AGE_DAYS = int(os.getenv("TRANSLATION_MEMORY_MAX_AGE_DAYS", "180"))
+# Long-running workers re-run eviction after this many inserted entries
+TRANSLATION_MEMORY_EVICT_EVERY = int(os.getenv("TRANSLATION_MEMORY_EVICT_EVERY", "10000"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text):
+    return _WHITESPACE.sub(" ", text).strip()
+
+class TranslationMemory:
+    def __init__(self, path=TRANSLATION_MEMORY_PATH, lru_size=TRANSLATION_MEMORY_LRU_SIZE,
+                 max_entries=TRANSLATION_MEMORY_MAX_ENTRIES, max_age_days=TRANSLATION_MEMORY_MAX_AGE_DAYS,
+                 evict_every=TRANSLATION_MEMORY_EVICT_EVERY):
+        self.path = path
+        self.lru_size = lru_size
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.evict_every = evict_every
+        self._inserted_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                source_text TEXT NOT NULL,
+                source_language TEXT NOT NULL,
+                target_language TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (source_text, source_language, target_language)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self._db.commit()
+        self.evict()
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, texts, source_language, target_language):
+        """
+        Returns a {text: translation} dict for every text found in memory.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for text in set(texts):
+                key = (normalize_text(text), source_language, target_language)
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[text] = self._lru[key]
+                else:
+                    missing.append((text, key))
+
+            now = time.time()
+            touched = []
+            for text, key in missing:
+                row = self._db.execute(
+                    "SELECT translated_text FROM translations "
+                    "WHERE source_text = ? AND source_language = ? AND target_language = ?",
+                    key
+                ).fetchone()
+                if row:
+                    found[text] = row[0]
+                    self._remember(key, row[0])
+                    touched.append((now,) + key)
+            if touched:
+                self._db.executemany(
+                    "UPDATE translations SET last_used = ? "
+                    "WHERE source_text = ? AND source_language = ? AND target_language = ?",
+                    touched
+                )
+                self._db.commit()
+
+            hits = sum(1 for text in texts if text in found)
+            self.hits += hits
+            self.misses += len(texts) - hits
+        return found
+
+    def put_many(self, translations, source_language, target_language):
+        """
+        Stores a {text: translation} dict.
+        """
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, translated_text in translations.items():
+                key = (normalize_text(text), source_language, target_language)
+                self._remember(key, translated_text)
+                rows.append(key + (translated_text, now))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO translations "
+                "(source_text, source_language, target_language, translated_text, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+            self._inserted_since_evict += len(rows)
+            due = self._inserted_since_evict >= self.evict_every
+        if due:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops entries older than max_age_days, then the least recently used
+        entries beyond max_entries.
+        """
+        with self._lock:
+            self._inserted_since_evict = 0
+            cutoff = time.time() - self.max_age_days * 86400
+            expired = self._db.execute("DELETE FROM translations WHERE last_used < ?", (cutoff,)).rowcount
+            overflow = self._db.execute(
+                "DELETE FROM translations WHERE rowid IN ("
+                "SELECT rowid FROM translations ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            self._db.commit()
+        if expired or overflow:
+            logger.info(f"Translation memory evicted {expired} expired and {overflow} overflow entries")
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "lru_entries": len(self._lru),
+                "entries": entries
+            }
+
+_memory = None
+_memory_lock = threading.Lock()
+
+def get_translation_memory():
+    """
+    Returns the process-wide translation memory, or None if it cannot be opened.
+    """
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            try:
+                _memory = TranslationMemory()
+            except Exception as e:
+                logger.error(f"Translation memory unavailable at {TRANSLATION_MEMORY_PATH}: {str(e)}")
+                return None
+        return _memory
@@ -1,41 +1,285 @@
 import os
+import json
+import time
+import uuid
+import queue
+import resource
+import subprocess
 import requests
 import logging
-from aeneas_sync import sync_subtitles
+from concurrent.futures import ThreadPoolExecutor
+from srt_io import Cue, parse, write_cues
+from segmentation import segment, words_from_whisper
+from chunking import detect_silences, plan_chunks, stitch
+from preflight import media_duration
+from metrics import WHISPER_UPLOAD_BYTES, WHISPER_REQUEST_DURATION
+import tracing
 
 logger = logging.getLogger(__name__)
 
-WHISPER_URL = "http://whisper:9000/asr?encode=true&task=transcribe&word_timestamps=false&output=srt"
+WHISPER_ASR_URL = os.getenv("WHISPER_ASR_URL", "http://whisper:9000/asr")
+# Long media is split into chunks transcribed in parallel on these ASR
+# endpoints (comma-separated), each taking WHISPER_ENDPOINT_CONCURRENCY
+# chunks at a time. CHUNKED_TRANSCRIPTION is "auto" (media longer than
+# CHUNKED_TRANSCRIPTION_MIN_SECONDS, when chunks can actually run in
+# parallel), "always" or "never".
+WHISPER_ENDPOINTS = [url.strip() for url in os.getenv("WHISPER_ENDPOINTS", WHISPER_ASR_URL).split(",") if url.strip()]
+WHISPER_ENDPOINT_CONCURRENCY = int(os.getenv("WHISPER_ENDPOINT_CONCURRENCY", "1"))
+CHUNKED_TRANSCRIPTION = os.getenv("CHUNKED_TRANSCRIPTION", "auto")
+CHUNKED_TRANSCRIPTION_MIN_SECONDS = float(os.getenv("CHUNKED_TRANSCRIPTION_MIN_SECONDS", "1800"))
+CHUNK_MAX_ATTEMPTS = int(os.getenv("CHUNK_MAX_ATTEMPTS", "3"))
+CHUNK_TIMEOUT = int(os.getenv("CHUNK_TIMEOUT", "900"))
 
-def process_whisper_transcription(file_path, source_language):
+# "audio" demuxes the selected audio track to 16 kHz mono and streams it to
+# Whisper; "container" uploads the media file as-is.
+WHISPER_UPLOAD_MODE = os.getenv("WHISPER_UPLOAD_MODE", "audio")
+WHISPER_AUDIO_FORMAT = os.getenv("WHISPER_AUDIO_FORMAT", "opus")
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Must match the Whisper service's ASR_MODEL; recorded in the job manifest so
+# a model change re-runs transcription
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+
+AUDIO_FORMATS = {
+    "opus": (["-c:a", "libopus", "-b:a", "32k", "-f", "ogg"], "audio.ogg", "audio/ogg"),
+    "flac": (["-c:a", "flac", "-f", "flac"], "audio.flac", "audio/flac"),
+    "wav": (["-c:a", "pcm_s16le", "-f", "wav"], "audio.wav", "audio/wav"),
+}
+
+def select_audio_stream(file_path, source_language):
+    """
+    Returns the index (among audio streams) of the track tagged with
+    source_language, falling back to the first audio stream.
+    """
+    try:
+        result = subprocess.run([
+            "ffprobe", "-v", "error", "-select_streams", "a",
+            "-show_entries", "stream=index:stream_tags=language",
+            "-of", "json", file_path
+        ], capture_output=True, check=True, text=True)
+        streams = json.loads(result.stdout).get("streams", [])
+    except Exception as e:
+        logger.warning(f"Could not probe audio streams of {file_path}: {str(e)}")
+        return 0
+
+    for audio_index, stream in enumerate(streams):
+        if stream.get("tags", {}).get("language", "").lower() == source_language.lower():
+            logger.info(f"Selected audio stream {audio_index} ({source_language}) of {len(streams)}")
+            return audio_index
+    logger.info(f"No audio stream tagged {source_language} among {len(streams)}, using the first")
+    return 0
+
+def _multipart_stream(stream, filename, content_type, boundary, counter):
+    """
+    Yields a multipart/form-data body for a single audio_file field, reading
+    the payload from stream in chunks.
+    """
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="audio_file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        counter["bytes"] += len(chunk)
+        WHISPER_UPLOAD_BYTES.inc(len(chunk))
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+def whisper_params(word_timestamps):
+    # Word timestamps come back as JSON and are segmented locally; otherwise
+    # the service renders the SRT itself
+    return {
+        "encode": "true",
+        "task": "transcribe",
+        "word_timestamps": "true" if word_timestamps else "false",
+        "output": "json" if word_timestamps else "srt"
+    }
+
+def _post_to_whisper(stream, filename, content_type, counter, word_timestamps=False,
+                     url=WHISPER_ASR_URL, timeout=3600):
+    boundary = uuid.uuid4().hex
+    return requests.post(
+        url,
+        params=whisper_params(word_timestamps),
+        data=_multipart_stream(stream, filename, content_type, boundary, counter),
+        headers=tracing.inject({
+            'accept': 'application/json',
+            'Content-Type': f'multipart/form-data; boundary={boundary}'
+        }),
+        timeout=timeout
+    )
+
+def transcribe_audio_stream(file_path, source_language, word_timestamps=False, audio_index=None,
+                            start=None, duration=None, url=WHISPER_ASR_URL, timeout=3600):
+    """
+    Pipes the selected audio track (or the [start, start + duration) slice
+    of it) through ffmpeg and streams it to Whisper without a temporary file.
+    """
+    codec_args, filename, content_type = AUDIO_FORMATS[WHISPER_AUDIO_FORMAT]
+    if audio_index is None:
+        audio_index = select_audio_stream(file_path, source_language)
+    slice_args = []
+    if start is not None:
+        slice_args += ["-ss", f"{start:.3f}"]
+    if duration is not None:
+        slice_args += ["-t", f"{duration:.3f}"]
+    counter = {"bytes": 0}
+    process = subprocess.Popen([
+        "ffmpeg", "-nostdin", "-v", "error", *slice_args, "-i", file_path,
+        "-map", f"0:a:{audio_index}", "-vn", "-ac", "1", "-ar", "16000",
+        *codec_args, "pipe:1"
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        response = _post_to_whisper(process.stdout, filename, content_type, counter, word_timestamps, url, timeout)
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode("utf-8", errors="replace")
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg audio extraction failed: {stderr.strip()}")
+    return response, counter["bytes"]
+
+def transcribe_container(file_path, word_timestamps=False):
+    counter = {"bytes": 0}
+    with open(file_path, 'rb') as audio_file:
+        response = _post_to_whisper(audio_file, os.path.basename(file_path), 'video/x-matroska', counter,
+                                    word_timestamps)
+    return response, counter["bytes"]
+
+def _response_cues(response, word_timestamps):
+    """
+    Returns the cues of a Whisper response; with word timestamps, one Cue
+    per word.
+    """
+    if word_timestamps:
+        return [Cue(start, end, [text]) for text, start, end in words_from_whisper(response.json())]
+    return [cue for cue in parse(response.text.splitlines()) if cue.lines]
+
+def chunking_enabled():
+    if CHUNKED_TRANSCRIPTION == "always":
+        return True
+    # With a single slot, chunks run one after another and only add the
+    # silence detection and per-chunk request overhead
+    return (CHUNKED_TRANSCRIPTION == "auto" and WHISPER_UPLOAD_MODE == "audio"
+            and len(WHISPER_ENDPOINTS) * WHISPER_ENDPOINT_CONCURRENCY > 1)
+
+def use_chunked(duration):
+    if duration is None or not chunking_enabled():
+        return False
+    return CHUNKED_TRANSCRIPTION == "always" or duration >= CHUNKED_TRANSCRIPTION_MIN_SECONDS
+
+def transcribe_chunked(file_path, source_language, duration, word_timestamps=False):
+    """
+    Transcribes file_path in silence-aligned chunks spread over
+    WHISPER_ENDPOINTS and returns the stitched cues. A failed chunk is
+    retried on its own, on the next free endpoint.
+    """
+    audio_index = select_audio_stream(file_path, source_language)
+    chunks = plan_chunks(duration, detect_silences(file_path, audio_index))
+    endpoints = queue.Queue()
+    for _ in range(WHISPER_ENDPOINT_CONCURRENCY):
+        for url in WHISPER_ENDPOINTS:
+            endpoints.put(url)
+    logger.info(f"Transcribing {duration:.0f}s in {len(chunks)} chunks on {len(WHISPER_ENDPOINTS)} endpoints")
+    # Chunk threads do not inherit the current span
+    parent = tracing.current_span()
+
+    def run(numbered_chunk):
+        number, (start, end, overlap) = numbered_chunk
+        for attempt in range(1, CHUNK_MAX_ATTEMPTS + 1):
+            url = endpoints.get()
+            try:
+                chunk_start = time.monotonic()
+                with tracing.span("whisper.chunk", parent=parent, kind="client", endpoint=url,
+                                  chunk=number, start=start, attempt=attempt) as span:
+                    response, uploaded_bytes = transcribe_audio_stream(
+                        file_path, source_language, word_timestamps, audio_index,
+                        start=start, duration=end - start + overlap, url=url, timeout=CHUNK_TIMEOUT
+                    )
+                    span.set_attribute("uploaded_bytes", uploaded_bytes)
+                    response.raise_for_status()
+                    cues = _response_cues(response, word_timestamps)
+                chunk_elapsed = time.monotonic() - chunk_start
+                WHISPER_REQUEST_DURATION.labels(url).observe(chunk_elapsed)
+                logger.info(f"Chunk {number + 1}/{len(chunks)} ({start:.0f}-{end:.0f}s) done on {url} "
+                            f"in {chunk_elapsed:.1f}s")
+                return cues
+            except Exception as e:
+                if attempt == CHUNK_MAX_ATTEMPTS:
+                    raise RuntimeError(f"Chunk {number + 1} failed after {attempt} attempts: {e}")
+                logger.warning(f"Chunk {number + 1} failed on {url} (attempt {attempt}): {str(e)}")
+            finally:
+                endpoints.put(url)
+
+    with ThreadPoolExecutor(max_workers=endpoints.qsize()) as executor:
+        results = list(executor.map(run, enumerate(chunks)))
+
+    stitched = stitch(chunks, results)
+    if word_timestamps:
+        return segment([(cue.text, cue.start, cue.end) for cue in stitched])
+    return stitched
+
+def process_whisper_transcription(file_path, source_language, word_timestamps=False):
+    """
+    Transcribes file_path to <name>.<source_language>.srt. With
+    word_timestamps the cues are segmented locally from word timings and
+    need no separate alignment pass.
+    """
     try:
-        logger.info(f"Starting Whisper-ASR transcription...")
+        logger.info(f"Starting Whisper-ASR transcription ({WHISPER_UPLOAD_MODE} upload, "
+                    f"word timestamps {'on' if word_timestamps else 'off'})...")
+
+        srt_filename = f"{os.path.splitext(file_path)[0]}.{source_language}.srt"
+        duration = media_duration(file_path) if chunking_enabled() else None
+        if use_chunked(duration):
+            start_time = time.monotonic()
+            cues = transcribe_chunked(file_path, source_language, duration, word_timestamps)
+            if not cues:
+                raise ValueError("Whisper-ASR did not return any subtitles.")
+            write_cues(srt_filename, cues)
+            logger.info(f"Chunked transcription finished in {time.monotonic() - start_time:.1f}s: {len(cues)} cues")
+            return {"srt_path": srt_filename}
 
-        with open(file_path, 'rb') as audio_file:
-            files = {'audio_file': (os.path.basename(file_path), audio_file, 'video/x-matroska')}
-            response = requests.post(
-                WHISPER_URL,
-                files=files,
-                headers={'accept': 'application/json'},
-                timeout=3600
-            )
+        start_time = time.monotonic()
+        with tracing.span("whisper.request", kind="client", endpoint=WHISPER_ASR_URL,
+                          upload_mode=WHISPER_UPLOAD_MODE) as span:
+            if WHISPER_UPLOAD_MODE == "audio":
+                response, uploaded_bytes = transcribe_audio_stream(file_path, source_language, word_timestamps)
+            else:
+                response, uploaded_bytes = transcribe_container(file_path, word_timestamps)
+            span.set_attribute("uploaded_bytes", uploaded_bytes)
+            span.set_attribute("http.status_code", response.status_code)
+        elapsed = time.monotonic() - start_time
+        WHISPER_REQUEST_DURATION.labels(WHISPER_ASR_URL).observe(elapsed)
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        logger.info(
+            f"Whisper-ASR request finished in {elapsed:.1f}s: "
+            f"uploaded {uploaded_bytes / 1048576:.1f} MB, worker peak RSS {peak_rss_mb:.0f} MB"
+        )
 
         response.raise_for_status()
+
+        if word_timestamps:
+            cues = segment(words_from_whisper(response.json()))
+            if not cues:
+                raise ValueError("Whisper-ASR did not return any timed words.")
+            write_cues(srt_filename, cues)
+            logger.info(f"Segmented {len(cues)} cues from word timestamps")
+            return {"srt_path": srt_filename}
+
         srt_text = response.text
 
         if not srt_text:
             raise ValueError("Whisper-ASR did not return valid subtitle text.")
 
         # Create the initial SRT file
-        srt_filename = f"{os.path.splitext(file_path)[0]}.{source_language}.srt"
         with open(srt_filename, 'w', encoding="utf-8") as srt_file:
             srt_file.write(srt_text)
 
-        # Sync subtitles
-        synced_result = sync_subtitles(file_path, srt_filename, source_language)
-        
-        return synced_result
+        return {"srt_path": srt_filename}
 
     except Exception as e:
         logger.error(f"Transcription error: {str(e)}")
-        return None
\ No newline at end of file
+        return None